@@ -201,7 +201,7 @@ class BusinessPackageView(APIView):
             Package = apps.get_model("packages", "Package")
             packages = (
                 Package.objects.filter(sender=request.user)
-                .select_related("payment")
+                .select_related("payment", "current_state")
                 .order_by("-created_at")
             )
 
@@ -217,11 +217,7 @@ class BusinessPackageView(APIView):
                     {
                         "id": p.id,
                         "receiver_name": p.receiver_name,
-                        "status": (
-                            p.actualizations.last().status
-                            if p.actualizations.exists()
-                            else "created"
-                        ),
+                        "status": p.current_status,
                         "is_paid": is_paid,
                         "created_at": p.created_at,
                         "price": price,
@@ -5,7 +5,7 @@ from rest_framework.routers import DefaultRouter
 from .models import Warehouse
 from .views.views import WarehouseSimpleView
 from .views.views_admin import WarehouseAdminViewSet
-from .views.views_routing import RouteAdminViewSet
+from .views.views_routing import RouteAdminViewSet, RouteGenerationJobViewSet
 
 @admin.register(Warehouse)
 class WarehouseAdmin(admin.ModelAdmin):
@@ -15,6 +15,7 @@ router = DefaultRouter()
 
 router.register(r'warehouses', WarehouseAdminViewSet, basename='admin-warehouse')
 router.register(r'routes', RouteAdminViewSet, basename='admin-route')
+router.register(r'route-jobs', RouteGenerationJobViewSet, basename='admin-route-job')
 
 urlpatterns = [
     path("warehouses/simple", WarehouseSimpleView.as_view()),
@@ -1,4 +1,4 @@
-import math
+from proj import geo
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from logistics.models import Warehouse
@@ -61,12 +61,11 @@ class Command(BaseCommand):
 
         self.stdout.write('Calculating connections...')
         updates = {}
-        for wh in created_warehouses:
-            distances = []
-            for other in created_warehouses:
-                if wh.id == other.id: continue
-                dist = self._haversine(wh.latitude, wh.longitude, other.latitude, other.longitude)
-                distances.append((other, dist))
+        matrix = geo.distance_matrix([(wh.latitude, wh.longitude) for wh in created_warehouses])
+        for i, wh in enumerate(created_warehouses):
+            distances = [
+                (other, float(matrix[i, j])) for j, other in enumerate(created_warehouses) if j != i
+            ]
             
             distances.sort(key=lambda x: x[1])
             nearest = distances[:3]
@@ -79,13 +78,3 @@ class Command(BaseCommand):
             wh.save() # This might call geocoding if address was empty, but it's full now!
 
         self.stdout.write(self.style.SUCCESS(f'Successfully seeded {len(created_warehouses)} warehouses.'))
-
-    def _haversine(self, lat1, lon1, lat2, lon2):
-        R = 6371.0
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (math.sin(dlat / 2) ** 2 +
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-             math.sin(dlon / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
\ No newline at end of file
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0005_routegenerationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='structure_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
-from proj import utils
+from proj import geo
 import uuid
 import requests
 import time
@@ -25,7 +25,7 @@ class Warehouse(models.Model):
     
     def _calculate_distance_to(self, other):
         return round(
-            utils.haversine(
+            geo.haversine(
                 float(self.latitude), float(self.longitude),
                 float(other.latitude), float(other.longitude)
             ),
@@ -158,6 +158,8 @@ class Route(models.Model):
     estimated_duration = models.IntegerField(null=True, blank=True, help_text="Minutes")
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Last time stops or packages were added, moved or removed (offline devices re-download then)
+    structure_changed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
@@ -192,7 +194,78 @@ class RoutePackage(models.Model):
     package = models.ForeignKey('packages.Package', on_delete=models.CASCADE, related_name='route_assignments')
     pickup_stop = models.ForeignKey(RouteStop, on_delete=models.CASCADE, related_name='pickups')
     dropoff_stop = models.ForeignKey(RouteStop, on_delete=models.CASCADE, related_name='dropoffs')
-    
+
+    # What the offline bundle is built from; changing one makes the next sync resend the bundle
+    STRUCTURE_FIELDS = ('route_id', 'package_id', 'pickup_stop_id', 'dropoff_stop_id')
+
     class Meta:
         unique_together = ['route', 'package']
-        
\ No newline at end of file
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        link = super().from_db(db, field_names, values)
+        link._loaded_structure = link.structure()
+        return link
+
+    def structure(self):
+        return tuple(self.__dict__.get(field) for field in self.STRUCTURE_FIELDS)
+        
+
+class RouteGenerationJob(models.Model):
+    """Background route generation run (Celery), polled by the admin panel"""
+    TYPE_CHOICES = [
+        ('line_haul', 'Line Haul (all hubs)'),
+        ('last_mile_all', 'Last Mile (all warehouses)'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    params = models.JSONField(default=dict, blank=True)
+    progress = models.JSONField(default=dict, blank=True, help_text="Per hub/warehouse: routes created, seconds, errors")
+    timings = models.JSONField(default=dict, blank=True, help_text="Seconds per phase")
+    route_ids = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='route_generation_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_job_type_display()} job {self.id} ({self.status})"
+
+    def mark_running(self):
+        self.status = 'running'
+        self.started_at = timezone.now()
+        self.save(update_fields=['status', 'started_at'])
+
+    def record_progress(self, key, **data):
+        self.progress[str(key)] = data
+        self.save(update_fields=['progress'])
+
+    def mark_completed(self, routes):
+        self.status = 'completed'
+        self.route_ids = [str(r.id) for r in routes]
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'route_ids', 'timings', 'finished_at'])
+
+    def mark_failed(self, error):
+        self.status = 'failed'
+        self.error = str(error)
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'timings', 'finished_at'])
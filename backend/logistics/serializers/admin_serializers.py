@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from logistics.models import Warehouse, Route, RoutePackage, RouteStop
+from logistics.models import Warehouse, Route, RoutePackage, RouteStop, RouteGenerationJob
 from .serializers import WarehouseSimpleSerializer
 from django.db import transaction
 
@@ -157,3 +157,19 @@ class RouteDetailSerializer(serializers.ModelSerializer):
             'started_at', 'completed_at', 'created_at',
             'stops', 'packages'
         ]
+
+
+class RouteGenerationJobSerializer(serializers.ModelSerializer):
+    routes_created = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RouteGenerationJob
+        fields = [
+            'id', 'job_type', 'status', 'params', 'progress', 'timings',
+            'route_ids', 'routes_created', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+    def get_routes_created(self, obj):
+        return len(obj.route_ids)
@@ -1,3 +1,5 @@
+from collections import defaultdict
+from django.db.models import Prefetch
 from rest_framework import serializers
 from logistics.models import Route, RouteStop, RoutePackage, Warehouse
 from .serializers import WarehouseSimpleSerializer
@@ -23,15 +25,20 @@ class CourierStopSerializer(serializers.ModelSerializer):
             'estimated_arrival', 'completed_at', 'pickups', 'dropoffs', 'postmat'
         ]
         
+    def _packages(self, obj, role):
+        # Grouped once per route by CourierRouteDetailSerializer, no query per stop
+        grouped = self.context.get('route_packages_by_stop')
+        if grouped is None:
+            links = getattr(obj, role).select_related('package')
+        else:
+            links = grouped.get((obj.id, role), [])
+        return PackageSimpleSerializer([rp.package for rp in links], many=True).data
+
     def get_pickups(self, obj):
-        route_packages = RoutePackage.objects.filter(pickup_stop=obj).select_related('package')
-        packages = [rp.package for rp in route_packages]
-        return PackageSimpleSerializer(packages, many=True).data
+        return self._packages(obj, 'pickups')
 
     def get_dropoffs(self, obj):
-        route_packages = RoutePackage.objects.filter(dropoff_stop=obj).select_related('package')
-        packages = [rp.package for rp in route_packages]
-        return PackageSimpleSerializer(packages, many=True).data
+        return self._packages(obj, 'dropoffs')
 
 class CourierRouteDetailSerializer(serializers.ModelSerializer):
     stops = CourierStopSerializer(many=True, read_only=True)
@@ -45,4 +52,20 @@ class CourierRouteDetailSerializer(serializers.ModelSerializer):
             'total_distance', 'estimated_duration', 'route_type',
             'started_at', 'completed_at', 'stops',
             'courier_name', 'courier_email'
-        ]
\ No newline at end of file
+        ]
+
+    @staticmethod
+    def prefetch(queryset):
+        """Everything the payload needs in a fixed number of queries"""
+        return queryset.select_related('courier').prefetch_related(
+            Prefetch('stops', queryset=RouteStop.objects.select_related('warehouse', 'postmat__zone')),
+            Prefetch('route_packages', queryset=RoutePackage.objects.select_related('package')),
+        )
+
+    def to_representation(self, instance):
+        grouped = defaultdict(list)
+        for rp in instance.route_packages.all():
+            grouped[(rp.pickup_stop_id, 'pickups')].append(rp)
+            grouped[(rp.dropoff_stop_id, 'dropoffs')].append(rp)
+        self.context['route_packages_by_stop'] = grouped
+        return super().to_representation(instance)
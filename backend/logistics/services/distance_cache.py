@@ -0,0 +1,129 @@
+import hashlib
+import json
+from typing import Optional
+
+from django.core.cache import cache
+
+from logistics.models import Warehouse
+from logistics.services.distance_service import DistanceService, apply_edge_change, edge_weights
+
+CACHE_KEY_PREFIX = "logistics:distance_matrix"
+CURRENT_FINGERPRINT_KEY = f"{CACHE_KEY_PREFIX}:current"
+
+# Above this many changed edges a full recompute is cheaper than repairing edge by edge
+INCREMENTAL_EDGE_LIMIT = 64
+
+# Per-process copy, so repeated RoutingService() calls skip even the cache round trip
+_local = {"fingerprint": None, "matrices": None}
+
+
+def graph_fingerprint(warehouses) -> str:
+    """Stable hash of the warehouse graph (ids + weighted connections)"""
+    graph = [
+        [str(w.id), sorted((str(c.get('id')), c.get('distance')) for c in (w.connections or []) if isinstance(c, dict))]
+        for w in warehouses
+    ]
+    return hashlib.sha256(json.dumps(graph, default=str).encode()).hexdigest()
+
+
+def _cache_key(fingerprint: str) -> str:
+    return f"{CACHE_KEY_PREFIX}:{fingerprint}"
+
+
+def _sorted_warehouses(warehouses=None):
+    if warehouses is None:
+        warehouses = Warehouse.objects.all()
+    # Matrices are index-aligned, so the order must not depend on the queryset
+    return sorted(warehouses, key=lambda w: str(w.id))
+
+
+def load_distance_service(warehouses=None) -> DistanceService:
+    """
+    Returns a DistanceService for the current graph, reusing matrices computed by
+    any process (web or Celery worker). Only recomputes when the graph changed.
+    """
+    warehouses = _sorted_warehouses(warehouses)
+    fingerprint = graph_fingerprint(warehouses)
+
+    if _local["fingerprint"] == fingerprint:
+        return DistanceService(warehouses, matrices=_local["matrices"])
+
+    entry = _read_cache(fingerprint)
+    if entry is None:
+        service = DistanceService(warehouses)
+        _write_cache(fingerprint, service)
+    else:
+        service = DistanceService(warehouses, matrices=(entry["distances"], entry["predecessors"]))
+        _remember(fingerprint, service)
+    return service
+
+
+def refresh_distance_cache() -> DistanceService:
+    """
+    Brings the shared matrices up to date after the warehouse graph changed.
+    When only a few connections differ from the last cached graph, the affected
+    rows/columns are repaired in place instead of rerunning the full O(n³) pass.
+    """
+    warehouses = _sorted_warehouses()
+    fingerprint = graph_fingerprint(warehouses)
+    if _read_cache(fingerprint) is not None:
+        return load_distance_service(warehouses)
+
+    previous = None
+    try:
+        previous_fingerprint = cache.get(CURRENT_FINGERPRINT_KEY)
+        if previous_fingerprint:
+            previous = _read_cache(previous_fingerprint)
+    except Exception as e:
+        print(f"Warning: Distance cache unavailable, recomputing: {e}")
+
+    warehouse_ids = [str(w.id) for w in warehouses]
+    new_edges = edge_weights(warehouses, {wid: i for i, wid in enumerate(warehouse_ids)})
+    changes = None
+    if previous and previous["warehouse_ids"] == warehouse_ids:
+        old_edges = previous["edges"]
+        changes = [
+            (edge, new_edges.get(edge))
+            for edge in set(old_edges) | set(new_edges)
+            if old_edges.get(edge) != new_edges.get(edge)
+        ]
+
+    if changes is not None and len(changes) <= INCREMENTAL_EDGE_LIMIT:
+        dist = previous["distances"].copy()
+        pred = previous["predecessors"].copy()
+        edges = dict(previous["edges"])
+        for (u, v), weight in changes:
+            apply_edge_change(dist, pred, edges, u, v, weight)
+        service = DistanceService(warehouses, matrices=(dist, pred))
+    else:
+        service = DistanceService(warehouses)
+
+    _write_cache(fingerprint, service)
+    return service
+
+
+def _remember(fingerprint: str, service: DistanceService):
+    _local["fingerprint"] = fingerprint
+    _local["matrices"] = (service.distance_matrix, service.predecessors)
+
+
+def _read_cache(fingerprint: str) -> Optional[dict]:
+    try:
+        return cache.get(_cache_key(fingerprint))
+    except Exception as e:
+        print(f"Warning: Distance cache unavailable, recomputing: {e}")
+        return None
+
+
+def _write_cache(fingerprint: str, service: DistanceService):
+    _remember(fingerprint, service)
+    entry = {
+        "warehouse_ids": service.warehouse_ids,
+        "edges": service.edges,
+        "distances": service.distance_matrix,
+        "predecessors": service.predecessors,
+    }
+    try:
+        cache.set_many({_cache_key(fingerprint): entry, CURRENT_FINGERPRINT_KEY: fingerprint}, timeout=None)
+    except Exception as e:
+        print(f"Warning: Could not store distance cache: {e}")
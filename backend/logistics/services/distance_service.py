@@ -1,44 +1,170 @@
-from typing import List, Optional
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
 from logistics.models import Warehouse
 
+NO_PREDECESSOR = -1
+
+
+def edge_weights(warehouses, id_to_index: Dict[str, int]) -> Dict[Tuple[int, int], float]:
+    """Directed edge list {(i, j): km} taken from Warehouse.connections"""
+    edges = {}
+    for warehouse in warehouses:
+        i = id_to_index[str(warehouse.id)]
+        if not warehouse.connections:
+            continue
+        for conn in warehouse.connections:
+            try:
+                j = id_to_index[conn['id']]
+                weight = float(conn['distance'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if i != j and weight < edges.get((i, j), float('inf')):
+                edges[(i, j)] = weight
+    return edges
+
+
+def build_adjacency_matrix(n: int, edges: Dict[Tuple[int, int], float]) -> np.ndarray:
+    """Dense float32 adjacency matrix (inf = no direct edge, 0 on the diagonal)"""
+    adjacency = np.full((n, n), np.inf, dtype=np.float32)
+    np.fill_diagonal(adjacency, 0.0)
+    for (i, j), weight in edges.items():
+        adjacency[i, j] = weight
+    return adjacency
+
+
+def _initial_predecessors(adjacency: np.ndarray) -> np.ndarray:
+    n = adjacency.shape[0]
+    rows = np.broadcast_to(np.arange(n, dtype=np.int32)[:, None], (n, n))
+    return np.where(np.isfinite(adjacency), rows, NO_PREDECESSOR).astype(np.int32)
+
+
+def floyd_warshall(adjacency: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized Floyd-Warshall: n numpy passes over an n x n matrix instead of
+    n³ interpreted operations. Returns (distances, predecessors) where
+    predecessors[i, j] is the node preceding j on the shortest path i -> j.
+    """
+    dist = adjacency.astype(np.float32, copy=True)
+    pred = _initial_predecessors(adjacency)
+
+    for k in range(dist.shape[0]):
+        via_k = dist[:, k, None] + dist[None, k, :]
+        better = via_k < dist
+        if better.any():
+            np.copyto(dist, via_k, where=better)
+            np.copyto(pred, np.broadcast_to(pred[k], pred.shape), where=better)
+    return dist, pred
+
+
+def _neighbour_lists(n: int, edges: Dict[Tuple[int, int], float]) -> List[List[Tuple[int, float]]]:
+    neighbours: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+    for (i, j), weight in edges.items():
+        neighbours[i].append((j, weight))
+    return neighbours
+
+
+def _single_source(neighbours, source: int) -> Tuple[List[float], List[int]]:
+    n = len(neighbours)
+    row_dist = [float('inf')] * n
+    row_pred = [NO_PREDECESSOR] * n
+    row_dist[source] = 0.0
+    row_pred[source] = source
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > row_dist[u]:
+            continue
+        for v, w in neighbours[u]:
+            nd = d + w
+            if nd < row_dist[v]:
+                row_dist[v] = nd
+                row_pred[v] = u
+                heapq.heappush(heap, (nd, v))
+    return row_dist, row_pred
+
+
+def dijkstra_all_pairs(adjacency: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Repeated Dijkstra over the sparse edge list. Cheaper than Floyd-Warshall
+    when the network is large and every warehouse has only a few connections.
+    """
+    n = adjacency.shape[0]
+    src, dst = np.nonzero(np.isfinite(adjacency))
+    edges = {(i, j): float(adjacency[i, j]) for i, j in zip(src.tolist(), dst.tolist()) if i != j}
+    neighbours = _neighbour_lists(n, edges)
+
+    dist = np.full((n, n), np.inf, dtype=np.float32)
+    pred = np.full((n, n), NO_PREDECESSOR, dtype=np.int32)
+    for source in range(n):
+        dist[source], pred[source] = _single_source(neighbours, source)
+    return dist, pred
+
+
+def apply_edge_change(dist: np.ndarray, pred: np.ndarray, edges: Dict[Tuple[int, int], float],
+                      u: int, v: int, weight: Optional[float]):
+    """
+    Repairs the all-pairs matrices in place after the directed edge u -> v is
+    added, removed (weight=None) or reweighted, and updates `edges` to match.
+
+    A new or shorter edge can only improve pairs routed through it, which is a
+    single O(n²) vectorized pass. A removed or longer edge invalidates just the
+    source rows whose shortest paths used it; those rows are re-run with Dijkstra.
+    """
+    old_weight = edges.get((u, v))
+    if weight is None:
+        edges.pop((u, v), None)
+    else:
+        edges[(u, v)] = weight
+    if old_weight == weight:
+        return
+
+    if old_weight is not None and (weight is None or weight > old_weight):
+        via_edge = dist[:, u, None] + np.float32(old_weight) + dist[None, v, :]
+        used = np.isfinite(dist) & np.isclose(via_edge, dist, rtol=1e-5, atol=1e-3)
+        affected_rows = np.nonzero(used.any(axis=1))[0]
+        if len(affected_rows):
+            neighbours = _neighbour_lists(dist.shape[0], edges)
+            for source in affected_rows.tolist():
+                dist[source], pred[source] = _single_source(neighbours, source)
+
+    if weight is not None:
+        via_edge = dist[:, u, None] + np.float32(weight) + dist[None, v, :]
+        better = via_edge < dist
+        if better.any():
+            # Predecessor of j on i -> u -> v ~> j is u for j == v, else taken from v's row
+            pred_row = pred[v].copy()
+            pred_row[v] = u
+            np.copyto(dist, via_edge, where=better)
+            np.copyto(pred, np.broadcast_to(pred_row, pred.shape), where=better)
+
+
 class DistanceService:
     """Precomputes and caches shortest paths between warehouses"""
-    
-    def __init__(self):
-        self.warehouses = list(Warehouse.objects.all())
+
+    METHODS = {
+        'floyd_warshall': floyd_warshall,
+        'dijkstra': dijkstra_all_pairs,
+    }
+
+    def __init__(self, warehouses=None, method: str = 'floyd_warshall', matrices=None):
+        """
+        `matrices` takes a precomputed (distances, predecessors) pair aligned with
+        `warehouses`, e.g. loaded from the shared cache, and skips the computation.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown all-pairs method: {method}")
+        self.warehouses = list(warehouses) if warehouses is not None else list(Warehouse.objects.all())
         self.warehouse_ids = [str(w.id) for w in self.warehouses]
         self.id_to_index = {wid: i for i, wid in enumerate(self.warehouse_ids)}
-        self.distance_matrix = self._compute_floyd_warshall()
-    
-    def _compute_floyd_warshall(self) -> List[List[float]]:
-        """Floyd-Warshall: O(n³) all-pairs shortest paths"""
-        n = len(self.warehouses)
-        dist = [[float('inf')] * n for _ in range(n)]
-        
-        # Initialize diagonal
-        for i in range(n):
-            dist[i][i] = 0
-        
-        # Fill direct connections
-        for warehouse in self.warehouses:
-            i = self.id_to_index[str(warehouse.id)]
-            if warehouse.connections:
-                for conn in warehouse.connections:
-                    try:
-                        j = self.id_to_index[conn['id']]
-                        dist[i][j] = conn['distance']
-                    except (KeyError, TypeError):
-                        continue
-        
-        # Floyd-Warshall algorithm
-        for k in range(n):
-            for i in range(n):
-                for j in range(n):
-                    if dist[i][k] + dist[k][j] < dist[i][j]:
-                        dist[i][j] = dist[i][k] + dist[k][j]
-        
-        return dist
-    
+        self.edges = edge_weights(self.warehouses, self.id_to_index)
+        if matrices is None:
+            adjacency = build_adjacency_matrix(len(self.warehouses), self.edges)
+            matrices = self.METHODS[method](adjacency)
+        self.distance_matrix, self.predecessors = matrices
+
     def get_distance(self, from_id: str, to_id: str) -> float:
         """O(1) distance lookup"""
         if from_id == to_id:
@@ -46,6 +172,27 @@ class DistanceService:
         try:
             i = self.id_to_index[from_id]
             j = self.id_to_index[to_id]
-            return self.distance_matrix[i][j]
+            return float(self.distance_matrix[i, j])
+        except KeyError:
+            return float('inf')
+
+    def get_path_ids(self, from_id: str, to_id: str) -> Optional[List[str]]:
+        """Rebuilds the shortest path (warehouse ids, both ends included) from the predecessor matrix"""
+        try:
+            i = self.id_to_index[from_id]
+            j = self.id_to_index[to_id]
         except KeyError:
-            return float('inf')
\ No newline at end of file
+            return None
+        if i == j:
+            return [from_id]
+        if self.predecessors[i, j] == NO_PREDECESSOR:
+            return None
+
+        indices = [j]
+        while j != i:
+            j = int(self.predecessors[i, j])
+            if j == NO_PREDECESSOR or len(indices) > len(self.warehouse_ids):
+                return None
+            indices.append(j)
+        indices.reverse()
+        return [self.warehouse_ids[idx] for idx in indices]
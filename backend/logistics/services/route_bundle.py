@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Optional
+
+# Writes committed slightly out of timestamp order are still picked up by the next sync;
+# items are sent as absolute state, so seeing one twice is harmless on the device
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def to_version(moment: Optional[datetime]) -> int:
+    return int(moment.timestamp() * 1_000_000) if moment else 0
+
+
+# Versions outside 0..MAX_VERSION cannot come from this server (datetime tops out in year 9999)
+MAX_VERSION = to_version(datetime(9999, 1, 1, tzinfo=dt_timezone.utc))
+
+
+def from_version(version: int) -> datetime:
+    return datetime.fromtimestamp(version / 1_000_000, tz=dt_timezone.utc)
+
+
+def _stop_row(stop) -> Dict:
+    place = stop.postmat or stop.warehouse
+    return {
+        'id': str(stop.id),
+        'order': stop.order,
+        'kind': 'postmat' if stop.postmat_id else 'warehouse',
+        'name': getattr(place, 'name', None) or getattr(place, 'city', ''),
+        'lat': place.latitude if place else None,
+        'lon': place.longitude if place else None,
+        'completed': stop.completed_at is not None,
+    }
+
+
+def _package_row(route, link, completed_stops) -> Dict:
+    state = getattr(link.package, 'current_state', None)
+    status = state.status if state else 'created'
+    scanned_here = bool(state) and state.courier_id == route.courier_id and state.updated_at >= route.created_at
+
+    if link.dropoff_stop_id in completed_stops or (scanned_here and status != 'in_transit'):
+        expected = None
+    elif link.pickup_stop_id in completed_stops or (scanned_here and status == 'in_transit'):
+        expected = 'drop'
+    else:
+        expected = 'pick'
+    return {
+        'id': str(link.package_id),
+        'code': link.package.pickup_code,
+        'size': link.package.size,
+        'pickup_stop': str(link.pickup_stop_id),
+        'dropoff_stop': str(link.dropoff_stop_id),
+        'status': status,
+        'expected': expected,
+    }
+
+
+def _route_row(route) -> Dict:
+    return {'id': str(route.id), 'status': route.status}
+
+
+def _version(route, stops, links, floor=None) -> int:
+    moments = [route.created_at, route.started_at, route.completed_at, route.structure_changed_at, floor]
+    moments += [s.completed_at for s in stops]
+    moments += [getattr(l.package, 'current_state', None) and l.package.current_state.updated_at for l in links]
+    return to_version(max(m for m in moments if m))
+
+
+def _links(route):
+    from logistics.models import RoutePackage
+
+    return RoutePackage.objects.filter(route=route).select_related('package__current_state')
+
+
+def build_bundle(route) -> Dict:
+    """
+    Everything a courier device needs to work offline: stops, packages with the
+    action expected next, and a version to pass to `build_delta` afterwards.
+    """
+    stops = list(route.stops.select_related('postmat', 'warehouse'))
+    links = list(_links(route))
+    completed = {s.id for s in stops if s.completed_at}
+    return {
+        'full': True,
+        'version': _version(route, stops, links),
+        'route': _route_row(route),
+        'stops': [_stop_row(s) for s in stops],
+        'packages': [_package_row(route, l, completed) for l in links],
+    }
+
+
+def build_delta(route, since: int) -> Dict:
+    """
+    Stops and packages that changed after version `since` (plus the route status).
+    When stops or packages were added or removed since then, the full bundle is sent
+    instead (`full: true`), so the device replaces its copy and drops what is gone.
+    """
+    after = from_version(since) - SYNC_OVERLAP
+    if route.structure_changed_at and route.structure_changed_at > after:
+        return build_bundle(route)
+    stops = list(route.stops.select_related('postmat', 'warehouse').filter(completed_at__gt=after))
+    links = list(_links(route).filter(package__current_state__updated_at__gt=after))
+    completed = set(route.stops.filter(completed_at__isnull=False).values_list('id', flat=True))
+    return {
+        'full': False,
+        'version': _version(route, stops, links, floor=from_version(since)),
+        'route': _route_row(route),
+        'stops': [_stop_row(s) for s in stops],
+        'packages': [_package_row(route, l, completed) for l in links],
+    }
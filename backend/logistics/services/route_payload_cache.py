@@ -0,0 +1,45 @@
+import uuid
+
+from django.core.cache import cache
+
+CACHE_KEY_PREFIX = "logistics:courier_route"
+
+# Stale versions are never read again; the TTL only bounds how long they linger
+PAYLOAD_TIMEOUT = 60 * 60
+
+
+def _version_key(route_id) -> str:
+    return f"{CACHE_KEY_PREFIX}:{route_id}:version"
+
+
+def invalidate_route_payload(route_id):
+    """Moves the route to a new version, so the next poll rebuilds its payload"""
+    try:
+        cache.set(_version_key(route_id), uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        print(f"Warning: Could not invalidate route payload {route_id}: {e}")
+
+
+def get_route_payload(route_id, build):
+    """
+    Serialized courier route detail, shared by every process and device polling it.
+    `build()` runs only when the route changed (stop completed, scan, status change).
+    """
+    try:
+        version = cache.get(_version_key(route_id))
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(_version_key(route_id), version, timeout=None)
+        key = f"{CACHE_KEY_PREFIX}:{route_id}:{version}"
+        payload = cache.get(key)
+    except Exception as e:
+        print(f"Warning: Route payload cache unavailable, building directly: {e}")
+        return build()
+
+    if payload is None:
+        payload = build()
+        try:
+            cache.set(key, payload, timeout=PAYLOAD_TIMEOUT)
+        except Exception as e:
+            print(f"Warning: Could not cache route payload {route_id}: {e}")
+    return payload
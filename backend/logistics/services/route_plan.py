@@ -0,0 +1,214 @@
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+ACTIVE_ROUTE_STATUSES = ['planned', 'in_progress']
+
+
+@dataclass
+class PlannedStop:
+    order: int
+    distance_from_previous: float
+    warehouse_id: Optional[str] = None
+    postmat_id: Optional[str] = None
+
+
+@dataclass
+class PlannedPackage:
+    package_id: str
+    pickup_order: int
+    dropoff_order: int
+    stash_id: Optional[str] = None
+
+
+@dataclass
+class PlannedRoute:
+    courier_id: int
+    route_type: str
+    total_distance: float
+    estimated_duration: int
+    stops: List[PlannedStop] = field(default_factory=list)
+    packages: List[PlannedPackage] = field(default_factory=list)
+
+
+@dataclass
+class PlannedDelay:
+    """Package that stays in the warehouse this cycle (written as an in_warehouse Actualization)"""
+    package_id: str
+    warehouse_id: str
+    info: str
+
+
+@dataclass
+class RoutePlan:
+    """
+    Output of the planning phase: plain ids and numbers only, so it can be
+    stored, sent to a worker or inspected before anything is written.
+    `planned_at` is the snapshot time used by the optimistic checks on commit.
+    """
+    scheduled_date: date
+    planned_at: datetime = field(default_factory=timezone.now)
+    routes: List[PlannedRoute] = field(default_factory=list)
+    delays: List[PlannedDelay] = field(default_factory=list)
+    rejected_package_ids: List[str] = field(default_factory=list)
+    # km removed from the constructed tours by the improvement phase
+    distance_saved: float = 0.0
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data['scheduled_date'] = self.scheduled_date.isoformat()
+        data['planned_at'] = self.planned_at.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RoutePlan':
+        return cls(
+            scheduled_date=date.fromisoformat(data['scheduled_date']),
+            planned_at=datetime.fromisoformat(data['planned_at']),
+            routes=[
+                PlannedRoute(
+                    **{k: v for k, v in r.items() if k not in ('stops', 'packages')},
+                    stops=[PlannedStop(**s) for s in r['stops']],
+                    packages=[PlannedPackage(**p) for p in r['packages']],
+                )
+                for r in data.get('routes', [])
+            ],
+            delays=[PlannedDelay(**d) for d in data.get('delays', [])],
+            rejected_package_ids=list(data.get('rejected_package_ids', [])),
+            distance_saved=data.get('distance_saved', 0.0),
+        )
+
+
+def _reserve_replacement_stashes(plan: RoutePlan, stashes: Dict, rejected) -> Dict:
+    """
+    For planned stashes taken since planning, claims another fitting stash in the
+    same postmat. Returns {planned stash id: replacement}; packages without one get rejected later.
+    """
+    from packages.models import Package
+    from postmats.models import Stash
+    from postmats.services.stash_reservation import reserve_stash
+
+    lost = {
+        p.stash_id: p.package_id for r in plan.routes for p in r.packages
+        if p.stash_id and p.stash_id not in stashes and p.package_id not in rejected
+    }
+    if not lost:
+        return {}
+
+    sizes = dict(Package.objects.filter(id__in=lost.values()).values_list('id', 'size'))
+    replacements = {}
+    for planned in Stash.objects.select_related('postmat').filter(id__in=lost):
+        package_id = lost[str(planned.id)]
+        stash = reserve_stash(planned.postmat, sizes.get(uuid.UUID(package_id)), mark_full=True)
+        if stash:
+            replacements[str(planned.id)] = stash
+    return replacements
+
+
+def commit_route_plan(plan: RoutePlan) -> List:
+    """
+    Persists a RoutePlan in one short transaction. Packages that changed since
+    `plan.planned_at` (new Actualization), that already ride on an active route,
+    or whose reserved stash was taken meanwhile are dropped from their route and
+    listed in `plan.rejected_package_ids`; routes left without packages are skipped.
+    """
+    from logistics.models import Route, RouteStop, RoutePackage
+    from packages.models import Actualization, PackageCurrentState
+    from postmats.models import Stash
+
+    package_ids = [p.package_id for r in plan.routes for p in r.packages]
+    stash_ids = [p.stash_id for r in plan.routes for p in r.packages if p.stash_id]
+
+    with transaction.atomic():
+        rejected = set()
+        if package_ids:
+            rejected.update(str(pid) for pid in Actualization.objects.filter(
+                package_id__in=package_ids, created_at__gt=plan.planned_at
+            ).values_list('package_id', flat=True))
+            # Still aboard another active route; a package already dropped off there is free to go on
+            rejected.update(str(pid) for pid in RoutePackage.objects.filter(
+                package_id__in=package_ids, route__status__in=ACTIVE_ROUTE_STATUSES,
+                dropoff_stop__completed_at__isnull=True
+            ).values_list('package_id', flat=True))
+
+        stashes = {}
+        if stash_ids:
+            # Stashes locked by a concurrent reservation are skipped, not waited for
+            stashes = {
+                str(s.id): s for s in Stash.objects.select_for_update(skip_locked=True).filter(
+                    id__in=stash_ids, is_empty=True, reserved_until__isnull=True
+                )
+            }
+            stashes.update(_reserve_replacement_stashes(plan, stashes, rejected))
+
+        reserved_until = timezone.now() + timezone.timedelta(hours=24)
+        created_routes = []
+        new_stops, new_links, reserved_stashes = [], [], []
+        for planned in plan.routes:
+            accepted = []
+            for p in planned.packages:
+                if p.package_id in rejected or (p.stash_id and p.stash_id not in stashes):
+                    rejected.add(p.package_id)
+                    continue
+                accepted.append(p)
+            if not accepted:
+                continue
+
+            route = Route.objects.create(
+                courier_id=planned.courier_id,
+                scheduled_date=plan.scheduled_date,
+                status='planned',
+                route_type=planned.route_type,
+                total_distance=planned.total_distance,
+                estimated_duration=planned.estimated_duration
+            )
+            stops = [
+                RouteStop(
+                    route=route,
+                    warehouse_id=s.warehouse_id,
+                    postmat_id=s.postmat_id,
+                    order=s.order,
+                    distance_from_previous=s.distance_from_previous
+                )
+                for s in planned.stops
+            ]
+            stop_by_order = {s.order: s for s in stops}
+            new_stops.extend(stops)
+            for p in accepted:
+                new_links.append(RoutePackage(
+                    route=route,
+                    package_id=p.package_id,
+                    pickup_stop=stop_by_order[p.pickup_order],
+                    dropoff_stop=stop_by_order[p.dropoff_order]
+                ))
+                if p.stash_id:
+                    stash = stashes[p.stash_id]
+                    stash.reserved_until = reserved_until
+                    stash.package_id = p.package_id
+                    stash.is_empty = False
+                    reserved_stashes.append(stash)
+            created_routes.append(route)
+
+        RouteStop.objects.bulk_create(new_stops)
+        RoutePackage.objects.bulk_create(new_links)
+        if reserved_stashes:
+            Stash.objects.bulk_update(reserved_stashes, ['reserved_until', 'package', 'is_empty'])
+        if plan.delays:
+            PackageCurrentState.record(Actualization.objects.bulk_create([
+                Actualization(
+                    package_id_id=d.package_id,
+                    status='in_warehouse',
+                    warehouse_id_id=d.warehouse_id,
+                    route_remaining={'info': d.info}
+                )
+                for d in plan.delays
+            ]))
+
+    plan.rejected_package_ids = sorted(rejected)
+    if rejected:
+        print(f"WARNING: {len(rejected)} packages changed since planning and were left out of the routes.")
+    return created_routes
@@ -1,9 +1,29 @@
-from typing import List, Dict, Optional, Set, Tuple
-from collections import defaultdict, deque
+from typing import Callable, List, Dict, Optional, Set
+from bisect import bisect_right
+from collections import defaultdict
 from datetime import date
-from django.db import transaction
 from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from concurrent.futures import ProcessPoolExecutor
 import math
+import multiprocessing
+import time
+
+# Read-only planning snapshot inherited by forked planner workers
+_planning_snapshot = None
+
+
+def _plan_hub_in_worker(hub_job):
+    service, packages_at_warehouse, vehicle_capacity = _planning_snapshot
+    hub_id, max_hub_routes = hub_job
+    plans = service._plan_hub(hub_id, max_hub_routes, packages_at_warehouse, set(), vehicle_capacity)
+    # Ship ids back instead of pickled model instances
+    for plan in plans:
+        plan['stops'] = [str(wh.id) for wh in plan['stops']]
+        plan['assignments'] = [(pkg.id, str(src.id), str(dst.id)) for pkg, src, dst in plan['assignments']]
+    return plans
+
 
 class RoutingService:
     MAX_WORK_DAY_MINUTES = 720 
@@ -11,115 +31,298 @@ class RoutingService:
     STOP_DURATION_MINUTES = 15 
 
     def __init__(self):
-        from logistics.services.distance_service import DistanceService
-        self.distance_service = DistanceService()
+        from logistics.services.distance_cache import load_distance_service
         from logistics.models import Warehouse
         
         self.all_warehouses = list(Warehouse.objects.all())
         self.warehouse_map = {str(w.id): w for w in self.all_warehouses}
+        self.distance_service = load_distance_service(self.all_warehouses)
+        self._path_cache = {}
     
-    @transaction.atomic
     def generate_routes_for_date(
         self,
         target_date: date,
         max_stops: int = 15,
-        vehicle_capacity: int = 50
+        vehicle_capacity: int = 50,
+        workers: Optional[int] = None,
+        progress: Optional[Callable] = None
     ) -> List:
-        
+        """Plans routes, then commits them in one short transaction"""
+        from logistics.services.route_plan import commit_route_plan
+
+        plan = self.plan_routes_for_date(target_date, max_stops, vehicle_capacity, workers, progress)
+        return commit_route_plan(plan)
+
+    def plan_routes_for_date(
+        self,
+        target_date: date,
+        max_stops: int = 15,
+        vehicle_capacity: int = 50,
+        workers: Optional[int] = None,
+        progress: Optional[Callable] = None
+    ):
+        """
+        Planning phase only: reads a snapshot and returns a RoutePlan without
+        writing anything. With workers > 1 hubs are planned in a process pool
+        and backhaul conflicts are resolved in a merge step.
+        `progress(hub_id, routes=..., seconds=...)` is called after every hub.
+        """
         from accounts.models import User
+        from logistics.services.route_plan import RoutePlan
         
-        pkg_locations = self._get_packages_and_locations()
-        if not pkg_locations:
-            return []
-        
-        packages_at_warehouse = defaultdict(list)
-        for pkg, current_wh in pkg_locations:
-            wh_id_str = str(current_wh.id)
-            packages_at_warehouse[wh_id_str].append(pkg)
+        route_plan = RoutePlan(scheduled_date=target_date)
+        self._path_cache = {}
+        packages_at_warehouse = self._get_hub_backlog()
+        if not packages_at_warehouse:
+            return route_plan
 
         couriers = list(User.objects.filter(role='warehouse', is_active=True))
         if not couriers:
             raise ValueError("No warehouse couriers available")
         
-        hub_ids = list(packages_at_warehouse.keys())
-        route_plans = []
-        assigned_package_ids = set()
-
-        for hub_id in hub_ids:
-            hub_packages = packages_at_warehouse[hub_id]
-            hub_packages.sort(key=lambda p: str(p.destination_postmat.warehouse_id))
-            
-            available_packages = [p for p in hub_packages if p.id not in assigned_package_ids]
-            
-            if not available_packages:
+        # Driver Capacity Check
+        # STRICT RULE: Only count drivers belonging to THIS hub
+        # We removed the DEBUG override. You must have drivers to move packages.
+        hub_jobs = []
+        for hub_id, hub_packages in packages_at_warehouse.items():
+            max_hub_routes = sum(1 for c in couriers if str(getattr(c, 'warehouse_id', '')) == str(hub_id))
+            if not max_hub_routes:
+                print(f"WARNING: No drivers found assigned to Hub {hub_id}. {len(hub_packages)} packages will remain in warehouse.")
                 continue
+            hub_jobs.append((hub_id, max_hub_routes))
+
+        if workers is None:
+            workers = getattr(settings, 'ROUTING_PLANNER_WORKERS', 1)
+        # Forking inside an open transaction would hand its connection state to the workers
+        in_transaction = any(conn.in_atomic_block for conn in connections.all())
+        if workers > 1 and len(hub_jobs) > 1 and not in_transaction \
+                and 'fork' in multiprocessing.get_all_start_methods():
+            route_plans = self._plan_hubs_parallel(hub_jobs, packages_at_warehouse, vehicle_capacity, workers, progress)
+        else:
+            route_plans = []
+            assigned_package_ids = set()
+            for hub_id, max_hub_routes in hub_jobs:
+                started = time.monotonic()
+                hub_plans = self._plan_hub(
+                    hub_id, max_hub_routes, packages_at_warehouse, assigned_package_ids, vehicle_capacity
+                )
+                route_plans.extend(hub_plans)
+                if progress:
+                    progress(hub_id, routes=len(hub_plans), seconds=round(time.monotonic() - started, 3))
+        
+        route_plans, route_plan.distance_saved = self._improve_tours(route_plans, vehicle_capacity)
 
-            # Driver Capacity Check
-            # STRICT RULE: Only count drivers belonging to THIS hub
-            # We removed the DEBUG override. You must have drivers to move packages.
-            drivers_at_hub = [c for c in couriers if str(getattr(c, 'warehouse_id', '')) == str(hub_id)]
-            max_hub_routes = len(drivers_at_hub)
+        assignments = self._assign_to_couriers(route_plans, couriers)
+        for courier, plan in assignments:
+            planned = self._plan_route(courier, plan)
+            if planned.packages:
+                route_plan.routes.append(planned)
             
-            if not drivers_at_hub:
-                print(f"WARNING: No drivers found assigned to Hub {hub_id}. {len(available_packages)} packages will remain in warehouse.")
-                continue
+        return route_plan
 
-            routes_generated_this_hub = 0
+    def _plan_hub(self, hub_id, max_hub_routes, packages_at_warehouse, assigned_package_ids, vehicle_capacity) -> List[Dict]:
+        """Builds up to max_hub_routes tours out of one hub; adds routed package ids to assigned_package_ids"""
+        plans = []
+        available_packages = [p for p in packages_at_warehouse[hub_id] if p.id not in assigned_package_ids]
 
-            while available_packages:
-                # Stop if we don't have free drivers left
-                if routes_generated_this_hub >= max_hub_routes:
-                    print(f"DEBUG: Capacity reached for hub {hub_id}. Drivers: {max_hub_routes}, Routes: {routes_generated_this_hub}")
-                    break 
+        while available_packages:
+            # Stop if we don't have free drivers left
+            if len(plans) >= max_hub_routes:
+                print(f"DEBUG: Capacity reached for hub {hub_id}. Drivers: {max_hub_routes}, Routes: {len(plans)}")
+                break 
 
-                chunk = available_packages[:vehicle_capacity]
-                chunk_ids = {p.id for p in chunk}
+            chunk = available_packages[:vehicle_capacity]
+            chunk_ids = {p.id for p in chunk}
+            
+            plan = self._build_optimized_tour(
+                hub_packages=chunk,
+                all_packages_map=packages_at_warehouse,
+                assigned_ids=assigned_package_ids,
+                vehicle_capacity=vehicle_capacity,
+                start_hub_id=hub_id
+            )
+            
+            if plan and plan['assignments']:
+                plan['start_hub_id'] = hub_id
+                plans.append(plan)
+                for pkg, _, _ in plan['assignments']:
+                    assigned_package_ids.add(pkg.id)
                 
-                plan = self._build_optimized_tour(
-                    hub_packages=chunk,
-                    all_packages_map=packages_at_warehouse,
-                    assigned_ids=assigned_package_ids,
-                    vehicle_capacity=vehicle_capacity,
-                    start_hub_id=hub_id
+            available_packages = [p for p in available_packages if p.id not in chunk_ids]
+        return plans
+
+    def _plan_hubs_parallel(self, hub_jobs, packages_at_warehouse, vehicle_capacity, workers, progress=None) -> List[Dict]:
+        """
+        Plans every hub independently in forked workers. The snapshot (this service,
+        its distance matrices and the package map) is inherited read-only on fork,
+        so only hub ids go in and id-based plans come back.
+        """
+        global _planning_snapshot
+        _planning_snapshot = (self, packages_at_warehouse, vehicle_capacity)
+        started = time.monotonic()
+        hub_results = []
+        # Workers must not inherit (and later close) this process's database sockets;
+        # the parent reconnects lazily on its next query
+        connections.close_all()
+        try:
+            ctx = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=min(workers, len(hub_jobs)), mp_context=ctx) as pool:
+                for (hub_id, _), plans in zip(hub_jobs, pool.map(_plan_hub_in_worker, hub_jobs)):
+                    hub_results.append(plans)
+                    if progress:
+                        progress(hub_id, routes=len(plans), seconds=round(time.monotonic() - started, 3))
+        finally:
+            _planning_snapshot = None
+
+        packages_by_id = {p.id: p for pkgs in packages_at_warehouse.values() for p in pkgs}
+        for plans in hub_results:
+            for plan in plans:
+                plan['stops'] = [self.warehouse_map[wh_id] for wh_id in plan['stops']]
+                plan['assignments'] = [
+                    (packages_by_id[pkg_id], self.warehouse_map[src_id], self.warehouse_map[dst_id])
+                    for pkg_id, src_id, dst_id in plan['assignments']
+                ]
+        return self._merge_hub_plans(hub_results)
+
+    def _merge_hub_plans(self, hub_results) -> List[Dict]:
+        """
+        Each package may ride on one route only. Hubs were planned in isolation,
+        so a package can appear both as a hub's own load and as another hub's
+        backhaul pickup. Own loads win; a backhaul is kept only for the first
+        route (in hub order) that claimed it. Routes left empty are dropped and
+        routes that lost a backhaul get their stops and distance recomputed.
+        """
+        claimed = set()
+        for plans in hub_results:
+            for plan in plans:
+                claimed.update(
+                    pkg.id for pkg, src, _ in plan['assignments'] if str(src.id) == plan['start_hub_id']
                 )
-                
-                if plan and plan['assignments']:
-                    plan['start_hub_id'] = hub_id
-                    route_plans.append(plan)
-                    routes_generated_this_hub += 1
-                    
-                    for pkg, _, _ in plan['assignments']:
-                        assigned_package_ids.add(pkg.id)
-                    
-                    routed_ids = {p.id for p, _, _ in plan['assignments']}
-                    available_packages = [p for p in available_packages if p.id not in chunk_ids]
-                else:
-                    available_packages = [p for p in available_packages if p.id not in chunk_ids]
-        
-        assignments = self._assign_to_couriers(route_plans, couriers)
-        created_routes = []
-        for courier, plan in assignments:
-            route = self._create_route(courier, plan, target_date)
-            created_routes.append(route)
-            
-        return created_routes
 
-    def _get_packages_and_locations(self) -> List[Tuple]:
-        from packages.models import Actualization
-        
-        latest_acts = Actualization.objects.order_by('package_id', '-created_at').distinct('package_id').select_related(
-            'package_id__origin_postmat__warehouse',
-            'package_id__destination_postmat__warehouse',
-            'warehouse_id'
+        merged = []
+        for plans in hub_results:
+            for plan in plans:
+                kept = []
+                for assignment in plan['assignments']:
+                    pkg, src, _ = assignment
+                    if str(src.id) == plan['start_hub_id']:
+                        kept.append(assignment)
+                    elif pkg.id not in claimed:
+                        claimed.add(pkg.id)
+                        kept.append(assignment)
+                if kept:
+                    dropped = len(kept) < len(plan['assignments'])
+                    plan['assignments'] = kept
+                    plan['package_count'] = len(kept)
+                    if dropped:
+                        self._rebuild_tour_stops(plan)
+                    merged.append(plan)
+        return merged
+
+    def _rebuild_tour_stops(self, plan):
+        """
+        Keeps only the hubs that still load or unload something (plus both tour ends),
+        re-threads them with shortest paths and recomputes total_distance.
+        """
+        stops = plan['stops']
+        served = {str(wh.id) for _, src, dst in plan['assignments'] for wh in (src, dst)}
+        kept = [stops[0]]
+        for idx, wh in enumerate(stops[1:], start=1):
+            is_end = idx == len(stops) - 1
+            if (is_end or str(wh.id) in served) and wh.id != kept[-1].id:
+                kept.append(wh)
+
+        rebuilt = [kept[0]]
+        for prev, nxt in zip(kept, kept[1:]):
+            path = self._find_shortest_graph_path(prev, nxt)
+            if not path:
+                return  # Cannot re-thread; the original (longer) tour is still valid
+            rebuilt.extend(path[1:])
+        plan['stops'] = rebuilt
+        plan['total_distance'] = round(self._calculate_path_distance(rebuilt), 2)
+
+    def _improve_tours(self, plans, vehicle_capacity, time_budget: Optional[float] = None):
+        """
+        Local-search pass (2-opt, Or-opt, relocate/exchange between tours of one hub)
+        over the greedy tours. Returns (plans, km saved); tours emptied by relocation are dropped.
+        """
+        from logistics.services.tour_improvement import Tour, TourImprover
+
+        if not plans:
+            return plans, 0.0
+        if time_budget is None:
+            time_budget = getattr(settings, 'ROUTING_IMPROVEMENT_SECONDS', 2.0)
+
+        index = self.distance_service.id_to_index
+        ids = self.distance_service.warehouse_ids
+        tours = []
+        for plan in plans:
+            hub = index[str(plan['stops'][0].id)]
+            service_stops = {index[str(wh.id)] for _, src, dst in plan['assignments'] for wh in (src, dst)} - {hub}
+            visits = []
+            for wh in plan['stops']:
+                i = index[str(wh.id)]
+                if i in service_stops and i not in visits:
+                    visits.append(i)
+            items = [(pkg, index[str(src.id)], index[str(dst.id)]) for pkg, src, dst in plan['assignments']]
+            tours.append(Tour(hub=hub, visits=visits, items=items))
+
+        improver = TourImprover(
+            self.distance_service.distance_matrix, vehicle_capacity, self.MAX_WORK_DAY_MINUTES,
+            self.AVG_SPEED_KM_MIN, self.STOP_DURATION_MINUTES, time_budget
+        )
+        tours, saved = improver.improve(tours)
+        if saved <= 0:
+            return plans, 0.0
+
+        improved_plans = []
+        for tour in tours:
+            sequence = [self.warehouse_map[ids[i]] for i in [tour.hub] + tour.visits + [tour.hub]]
+            stops = [sequence[0]]
+            for a, b in zip(sequence, sequence[1:]):
+                path = self._find_shortest_graph_path(a, b)
+                if not path:
+                    print(f"Warning: No path {a.city} -> {b.city}, keeping the greedy line haul tours.")
+                    return plans, 0.0
+                stops.extend(path[1:])
+            assignments = [
+                (pkg, self.warehouse_map[ids[src]], self.warehouse_map[ids[dst]]) for pkg, src, dst in tour.items
+            ]
+            improved_plans.append({
+                'assignments': assignments,
+                'stops': stops,
+                'start_hub_id': ids[tour.hub],
+                'total_distance': round(self._calculate_path_distance(stops), 2),
+                'package_count': len(assignments)
+            })
+        print(f"Tour improvement saved {saved:.1f} km over {len(plans)} line haul routes.")
+        return improved_plans, round(saved, 2)
+
+    def _get_hub_backlog(self) -> Dict[str, List]:
+        """
+        Line-haul backlog in one query: packages whose current state is 'in_warehouse'
+        at a hub other than their destination's, grouped by hub id and sorted by
+        destination warehouse. Served by the (status, warehouse) index on
+        PackageCurrentState, so the cost follows today's backlog, not the history.
+        """
+        from packages.models import PackageCurrentState
+
+        states = (
+            PackageCurrentState.objects
+            .filter(
+                status='in_warehouse',
+                warehouse__isnull=False,
+                package__destination_postmat__warehouse__isnull=False,
+            )
+            .exclude(warehouse_id=F('package__destination_postmat__warehouse_id'))
+            .select_related('package__destination_postmat__warehouse')
+            .order_by('warehouse_id', 'package__destination_postmat__warehouse_id', 'updated_at')
         )
-        
-        results = []
-        for act in latest_acts:
-            if act.status == 'in_warehouse' and act.warehouse_id:
-                pkg = act.package_id
-                if str(pkg.destination_postmat.warehouse_id) != str(act.warehouse_id.id):
-                    results.append((pkg, act.warehouse_id))
-        return results
+
+        backlog = defaultdict(list)
+        for state in states:
+            backlog[str(state.warehouse_id)].append(state.package)
+        return backlog
 
     def _build_optimized_tour(self, hub_packages, all_packages_map, assigned_ids, vehicle_capacity, start_hub_id):
         if not hub_packages: return None
@@ -277,25 +480,19 @@ class RoutingService:
             prev = node
         return dist
 
-    def _find_shortest_graph_path(self, start_wh, end_wh) -> List:
-        if start_wh.id == end_wh.id: return [start_wh]
-        queue = deque([(start_wh, [start_wh])])
-        visited = {str(start_wh.id)}
-        while queue:
-            current, path = queue.popleft()
-            if str(current.id) == str(end_wh.id): return path
-            conn_ids = []
-            if current.connections:
-                first = current.connections[0]
-                if isinstance(first, dict): conn_ids = [str(c.get('id')) for c in current.connections if c.get('id')]
-                elif isinstance(first, str): conn_ids = [str(c) for c in current.connections]
-            for cid in conn_ids:
-                if cid not in visited:
-                    visited.add(cid)
-                    next_wh = self.warehouse_map.get(cid)
-                    if next_wh:
-                        queue.append((next_wh, path + [next_wh]))
-        return None
+    def _find_shortest_graph_path(self, start_wh, end_wh) -> Optional[List]:
+        """
+        Shortest-distance path rebuilt from the DistanceService predecessor matrix,
+        memoized per (from, to) pair for the current planning run.
+        """
+        key = (str(start_wh.id), str(end_wh.id))
+        if key not in self._path_cache:
+            path_ids = self.distance_service.get_path_ids(*key)
+            if path_ids and all(wid in self.warehouse_map for wid in path_ids):
+                self._path_cache[key] = [self.warehouse_map[wid] for wid in path_ids]
+            else:
+                self._path_cache[key] = None
+        return self._path_cache[key]
 
     def _assign_to_couriers(self, plans, couriers):
         assignments = []
@@ -328,55 +525,44 @@ class RoutingService:
             
         return assignments
 
-    def _create_route(self, courier, plan, scheduled_date):
-        from logistics.models import Route, RouteStop, RoutePackage
+    def _plan_route(self, courier, plan):
+        from logistics.services.route_plan import PlannedRoute, PlannedStop, PlannedPackage
         
-        route = Route.objects.create(
-            courier=courier,
-            scheduled_date=scheduled_date,
-            total_distance=plan['total_distance'],
-            estimated_duration=0
-        )
-        
-        stops_created = []
+        stops = []
+        stop_orders = defaultdict(list)  # warehouse id -> stop orders, ascending
         for i, wh in enumerate(plan['stops']):
             prev = plan['stops'][i-1] if i > 0 else None
             dist = self.distance_service.get_distance(str(prev.id), str(wh.id)) if prev else 0.0
-            stop = RouteStop.objects.create(route=route, warehouse=wh, order=i, distance_from_previous=0 if math.isinf(dist) else dist)
-            stops_created.append(stop)
+            stops.append(PlannedStop(order=i, warehouse_id=str(wh.id), distance_from_previous=0 if math.isinf(dist) else dist))
+            stop_orders[str(wh.id)].append(i)
             
-        active_stop_ids = set()
-        
+        packages = []
+        active_orders = set()
         for pkg, pickup_wh, dropoff_wh in plan['assignments']:
-            pickup_id = str(pickup_wh.id)
-            dropoff_id = str(dropoff_wh.id)
-            
-            pickup_stop = None
-            for s in stops_created:
-                if str(s.warehouse.id) == pickup_id:
-                    pickup_stop = s
-                    break 
+            pickup_orders = stop_orders.get(str(pickup_wh.id))
+            dropoff_orders = stop_orders.get(str(dropoff_wh.id))
+            if not pickup_orders or not dropoff_orders:
+                continue
             
-            dropoff_stop = None
-            if pickup_stop:
-                for s in stops_created:
-                    if s.order > pickup_stop.order and str(s.warehouse.id) == dropoff_id:
-                        dropoff_stop = s
-                        break
+            # First pickup visit, then the first dropoff visit after it
+            pickup_order = pickup_orders[0]
+            pos = bisect_right(dropoff_orders, pickup_order)
+            if pos == len(dropoff_orders):
+                continue
+            dropoff_order = dropoff_orders[pos]
             
-            if pickup_stop and dropoff_stop and pickup_stop != dropoff_stop:
-                RoutePackage.objects.create(
-                    route=route,
-                    package=pkg,
-                    pickup_stop=pickup_stop,
-                    dropoff_stop=dropoff_stop
-                )
-                active_stop_ids.add(pickup_stop.id)
-                active_stop_ids.add(dropoff_stop.id)
+            packages.append(PlannedPackage(package_id=str(pkg.id), pickup_order=pickup_order, dropoff_order=dropoff_order))
+            active_orders.add(pickup_order)
+            active_orders.add(dropoff_order)
 
-        drive_time = route.total_distance / self.AVG_SPEED_KM_MIN
-        stop_penalty = len(active_stop_ids) * self.STOP_DURATION_MINUTES
-        route.estimated_duration = int(drive_time + stop_penalty)
-        route.save()
-                
-        return route
\ No newline at end of file
+        drive_time = plan['total_distance'] / self.AVG_SPEED_KM_MIN
+        stop_penalty = len(active_orders) * self.STOP_DURATION_MINUTES
+        
+        return PlannedRoute(
+            courier_id=courier.id,
+            route_type='line_haul',
+            total_distance=plan['total_distance'],
+            estimated_duration=int(drive_time + stop_penalty),
+            stops=stops,
+            packages=packages
+        )
@@ -0,0 +1,93 @@
+import uuid
+from typing import Dict, List
+
+from django.db import transaction
+
+# Largest batch one request may carry (a full truck with room to spare)
+MAX_SCANS_PER_BATCH = 500
+
+
+def _uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _scan_status(action, stop):
+    if action == 'pick':
+        return 'in_transit'
+    if stop.postmat_id:
+        return 'placed_in_stash'
+    if stop.warehouse_id:
+        return 'in_warehouse'
+    return 'delivered'
+
+
+def apply_scans(route, courier, items: List[Dict]) -> List[Dict]:
+    """
+    Validates a batch of scans ({scan_id, package_id, stop_id, action}) against `route`
+    - a pick must happen at the package's pickup stop, a drop at its dropoff stop -
+    and writes every accepted one in a single bulk_create, whatever the batch size.
+    A scan_id already stored is reported as a duplicate, so an offline queue can resend
+    the whole batch after a dropped response. Returns one outcome per item, in order.
+    """
+    from logistics.models import RoutePackage
+    from packages.models import Actualization, PackageCurrentState
+
+    stops = {stop.id: stop for stop in route.stops.only('id', 'route_id', 'postmat_id', 'warehouse_id')}
+    # package -> {(action, stop)} it may be scanned with: picked at its pickup, dropped at its dropoff
+    on_route = {}
+    for package_id, pickup_id, dropoff_id in RoutePackage.objects.filter(route=route).values_list(
+        'package_id', 'pickup_stop_id', 'dropoff_stop_id'
+    ):
+        on_route.setdefault(package_id, set()).update({('pick', pickup_id), ('drop', dropoff_id)})
+    scan_ids = [sid for sid in (_uuid(item.get('scan_id')) for item in items) if sid]
+    seen = set(Actualization.objects.filter(scan_id__in=scan_ids).values_list('scan_id', flat=True))
+
+    outcomes, pending = [], []
+    for item in items:
+        scan_id, package_id, stop_id = (_uuid(item.get(k)) for k in ('scan_id', 'package_id', 'stop_id'))
+        action = item.get('action')
+        outcome = {'scan_id': item.get('scan_id'), 'package_id': item.get('package_id')}
+        outcomes.append(outcome)
+
+        if not scan_id:
+            outcome.update(result='error', error='Invalid scan_id')
+        elif scan_id in seen:
+            outcome.update(result='duplicate')
+        elif action not in ('pick', 'drop'):
+            outcome.update(result='error', error='Unknown action')
+        elif stop_id not in stops:
+            outcome.update(result='error', error='Stop not found in this route')
+        elif package_id not in on_route:
+            outcome.update(result='error', error='Package not on this route')
+        elif (action, stop_id) not in on_route[package_id]:
+            where = 'picked up' if action == 'pick' else 'dropped off'
+            outcome.update(result='error', error=f'Package is not {where} at this stop')
+        else:
+            stop = stops[stop_id]
+            seen.add(scan_id)
+            new_status = _scan_status(action, stop)
+            outcome.update(result='ok', new_state=new_status)
+            pending.append((outcome, Actualization(
+                package_id_id=package_id,
+                status=new_status,
+                courier_id=courier,
+                warehouse_id_id=stop.warehouse_id,
+                scan_id=scan_id,
+            )))
+
+    if pending:
+        with transaction.atomic():
+            # A concurrent retry of the same batch may have won the race for some scan_ids
+            Actualization.objects.bulk_create([act for _, act in pending], ignore_conflicts=True)
+            written = set(Actualization.objects.filter(
+                id__in=[act.id for _, act in pending]
+            ).values_list('id', flat=True))
+            for outcome, act in pending:
+                if act.id not in written:
+                    outcome.update(result='duplicate')
+                    outcome.pop('new_state')
+            PackageCurrentState.record([act for _, act in pending if act.id in written])
+    return outcomes
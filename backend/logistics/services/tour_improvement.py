@@ -0,0 +1,196 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Tuple
+
+# Moves smaller than this (km) are treated as noise, so the search cannot cycle on float rounding
+EPSILON_KM = 1e-3
+
+# Longest segment moved as a block by Or-opt
+OR_OPT_MAX_SEGMENT = 3
+
+
+@dataclass
+class Tour:
+    """
+    A line-haul tour as matrix indices: `hub` -> `visits` (service stops) -> `hub`.
+    `items` are (payload, pickup_index, dropoff_index) - one per package carried.
+    """
+    hub: int
+    visits: List[int]
+    items: List[Tuple[Any, int, int]] = field(default_factory=list)
+
+
+class TourImprover:
+    """
+    Local search over greedy tours: 2-opt and Or-opt inside a tour, relocate and
+    exchange of delivery stops between tours of the same hub. A move is kept only
+    if it shortens the total distance and the touched tours stay feasible
+    (vehicle capacity along the route, pickup before dropoff, work day length).
+    """
+
+    def __init__(self, distance_matrix, vehicle_capacity, max_minutes, speed_km_min, stop_minutes, time_budget):
+        self.D = distance_matrix.tolist()
+        self.vehicle_capacity = vehicle_capacity
+        self.max_minutes = max_minutes
+        self.speed_km_min = speed_km_min
+        self.stop_minutes = stop_minutes
+        self.time_budget = time_budget
+
+    def cost(self, hub, visits) -> float:
+        D = self.D
+        total, prev = 0.0, hub
+        for v in visits:
+            total += D[prev][v]
+            prev = v
+        return total + D[prev][hub]
+
+    def feasible(self, hub, visits, items) -> bool:
+        cost = self.cost(hub, visits)
+        if cost == float('inf'):
+            return False
+        if cost / self.speed_km_min + len(visits) * self.stop_minutes > self.max_minutes:
+            return False
+
+        pos = {v: i for i, v in enumerate(visits)}
+        change = [0] * len(visits)
+        load = 0
+        for _, src, dst in items:
+            if src == hub:
+                load += 1
+            elif src in pos:
+                change[pos[src]] += 1
+            else:
+                return False
+            if dst != hub:
+                if dst not in pos:
+                    return False
+                if src != hub and pos[src] >= pos[dst]:
+                    return False
+                change[pos[dst]] -= 1
+
+        if load > self.vehicle_capacity:
+            return False
+        for delta in change:
+            load += delta
+            if load > self.vehicle_capacity:
+                return False
+        return True
+
+    def improve(self, tours: List[Tour]) -> Tuple[List[Tour], float]:
+        """Improves tours in place until no move helps or the time budget runs out; returns (tours, km saved)"""
+        deadline = time.monotonic() + self.time_budget
+        before = sum(self.cost(t.hub, t.visits) for t in tours)
+
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+            for tour in tours:
+                improved |= self._two_opt(tour, deadline)
+                improved |= self._or_opt(tour, deadline)
+            improved |= self._relocate(tours, deadline)
+            improved |= self._exchange(tours, deadline)
+
+        tours = [t for t in tours if t.items]
+        after = sum(self.cost(t.hub, t.visits) for t in tours)
+        return tours, max(0.0, before - after)
+
+    def _try(self, tour, visits, current_cost) -> bool:
+        if self.cost(tour.hub, visits) < current_cost - EPSILON_KM and self.feasible(tour.hub, visits, tour.items):
+            tour.visits = visits
+            return True
+        return False
+
+    def _two_opt(self, tour, deadline) -> bool:
+        improved = False
+        n = len(tour.visits)
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                if time.monotonic() > deadline:
+                    return improved
+                v = tour.visits
+                candidate = v[:i] + v[i:j + 1][::-1] + v[j + 1:]
+                if self._try(tour, candidate, self.cost(tour.hub, v)):
+                    improved = True
+        return improved
+
+    def _or_opt(self, tour, deadline) -> bool:
+        improved = False
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            i = 0
+            while i + length <= len(tour.visits):
+                if time.monotonic() > deadline:
+                    return improved
+                v = tour.visits
+                segment, rest = v[i:i + length], v[:i] + v[i + length:]
+                current = self.cost(tour.hub, v)
+                moved = False
+                for k in range(len(rest) + 1):
+                    if k == i:
+                        continue
+                    if self._try(tour, rest[:k] + segment + rest[k:], current):
+                        improved = moved = True
+                        break
+                if not moved:
+                    i += 1
+        return improved
+
+    def _movable(self, tour, visit) -> bool:
+        """Stops that only receive packages loaded at the hub can change tours"""
+        touching = [it for it in tour.items if visit in (it[1], it[2])]
+        return bool(touching) and all(src == tour.hub and dst == visit for _, src, dst in touching)
+
+    def _relocate(self, tours, deadline) -> bool:
+        improved = False
+        for a in tours:
+            for b in tours:
+                if a is b or a.hub != b.hub:
+                    continue
+                for visit in list(a.visits):
+                    if time.monotonic() > deadline:
+                        return improved
+                    if visit in b.visits or not self._movable(a, visit):
+                        continue
+                    moved_items = [it for it in a.items if it[2] == visit]
+                    a_items = [it for it in a.items if it[2] != visit]
+                    b_items = b.items + moved_items
+                    a_visits = [v for v in a.visits if v != visit]
+                    current = self.cost(a.hub, a.visits) + self.cost(b.hub, b.visits)
+                    a_cost = self.cost(a.hub, a_visits) if a_visits else 0.0
+                    if a_items and not self.feasible(a.hub, a_visits, a_items):
+                        continue
+                    for k in range(len(b.visits) + 1):
+                        b_visits = b.visits[:k] + [visit] + b.visits[k:]
+                        if a_cost + self.cost(b.hub, b_visits) < current - EPSILON_KM \
+                                and self.feasible(b.hub, b_visits, b_items):
+                            a.visits, a.items = a_visits, a_items
+                            b.visits, b.items = b_visits, b_items
+                            improved = True
+                            break
+        return improved
+
+    def _exchange(self, tours, deadline) -> bool:
+        improved = False
+        for x, a in enumerate(tours):
+            for b in tours[x + 1:]:
+                if a.hub != b.hub:
+                    continue
+                for i, va in enumerate(a.visits):
+                    for j, vb in enumerate(b.visits):
+                        if time.monotonic() > deadline:
+                            return improved
+                        if va in b.visits or vb in a.visits:
+                            continue
+                        if not (self._movable(a, va) and self._movable(b, vb)):
+                            continue
+                        a_visits = a.visits[:i] + [vb] + a.visits[i + 1:]
+                        b_visits = b.visits[:j] + [va] + b.visits[j + 1:]
+                        current = self.cost(a.hub, a.visits) + self.cost(b.hub, b.visits)
+                        if self.cost(a.hub, a_visits) + self.cost(b.hub, b_visits) >= current - EPSILON_KM:
+                            continue
+                        a_items = [it for it in a.items if it[2] != va] + [it for it in b.items if it[2] == vb]
+                        b_items = [it for it in b.items if it[2] != vb] + [it for it in a.items if it[2] == va]
+                        if self.feasible(a.hub, a_visits, a_items) and self.feasible(b.hub, b_visits, b_items):
+                            a.visits, a.items = a_visits, a_items
+                            b.visits, b.items = b_visits, b_items
+                            improved = True
+        return improved
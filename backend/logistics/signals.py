@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Warehouse, Route, RouteStop, RoutePackage
+
+
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def refresh_distance_matrix(sender, instance, **kwargs):
+    """
+    Keep the shared distance matrix in step with the warehouse graph.
+    Queued after commit on a worker; when one Warehouse.save() also rewrites
+    its neighbours' connections, the later tasks find the matrices already cached.
+    """
+    from logistics.tasks import refresh_distance_cache
+
+    def dispatch():
+        try:
+            refresh_distance_cache.delay()
+        except Exception as e:
+            # Not fatal: load_distance_service recomputes on the next cache miss
+            print(f"Warning: Could not queue distance cache refresh: {e}")
+
+    transaction.on_commit(dispatch)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+@receiver(post_save, sender=RouteStop)
+@receiver(post_delete, sender=RouteStop)
+@receiver(post_save, sender=RoutePackage)
+@receiver(post_delete, sender=RoutePackage)
+def refresh_route_payload(sender, instance, **kwargs):
+    """Courier devices poll a cached route payload; move it to a new version after commit"""
+    from logistics.services.route_payload_cache import invalidate_route_payload
+
+    route_id = instance.id if sender is Route else instance.route_id
+    transaction.on_commit(lambda: invalidate_route_payload(route_id))
+
+
+@receiver(post_save, sender=RouteStop)
+@receiver(post_delete, sender=RouteStop)
+@receiver(post_save, sender=RoutePackage)
+@receiver(post_delete, sender=RoutePackage)
+def mark_route_structure_changed(sender, instance, created=True, **kwargs):
+    """Stops added or removed, packages added, moved or removed: the next delta sync sends the full bundle"""
+    from django.utils import timezone
+
+    if sender is RouteStop and not created:
+        return  # Completing a stop is a plain delta (completed_at)
+    route_ids = {instance.route_id}
+    if sender is RoutePackage and not created:
+        loaded = getattr(instance, '_loaded_structure', None)
+        if loaded == instance.structure():
+            return  # Saved without moving the link - nothing the bundle holds changed
+        if loaded:
+            route_ids.add(loaded[0])
+        instance._loaded_structure = instance.structure()
+    Route.objects.filter(id__in=route_ids).update(structure_changed_at=timezone.now())
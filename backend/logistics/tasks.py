@@ -0,0 +1,52 @@
+import time
+from datetime import date
+from celery import shared_task
+from .models import RouteGenerationJob
+
+
+@shared_task(name="generate_line_haul_routes")
+def generate_line_haul_routes(job_id):
+    """
+    Runs line-haul planning for a RouteGenerationJob, recording per-hub progress,
+    phase timings and the created route ids on the job.
+    """
+    from logistics.services.routing_service import RoutingService
+    from logistics.services.route_plan import commit_route_plan
+
+    job = RouteGenerationJob.objects.get(id=job_id)
+    job.mark_running()
+    params = job.params
+    try:
+        started = time.monotonic()
+        service = RoutingService()
+        plan = service.plan_routes_for_date(
+            date.fromisoformat(params['date']),
+            params.get('max_stops', 15),
+            params.get('vehicle_capacity', 50),
+            progress=job.record_progress,
+        )
+        planned = time.monotonic()
+        routes = commit_route_plan(plan)
+        job.timings = {
+            'planning': round(planned - started, 3),
+            'commit': round(time.monotonic() - planned, 3),
+            'rejected_packages': len(plan.rejected_package_ids),
+            'distance_saved_km': plan.distance_saved,
+        }
+        job.mark_completed(routes)
+    except Exception as e:
+        job.mark_failed(e)
+        raise
+    return f"Created {len(job.route_ids)} line haul routes"
+
+
+@shared_task(name="refresh_distance_cache")
+def refresh_distance_cache():
+    """
+    Repairs the shared distance matrices after the warehouse graph changed,
+    off the request that saved the warehouse (see distance_cache.refresh_distance_cache).
+    """
+    from logistics.services import distance_cache
+
+    service = distance_cache.refresh_distance_cache()
+    return f"Distance matrices ready for {len(service.warehouse_ids)} warehouses"
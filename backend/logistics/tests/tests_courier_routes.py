@@ -0,0 +1,186 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from accounts.models import User
+from logistics.models import Warehouse, Route, RouteStop, RoutePackage
+from postmats.models import Postmat, Zone
+from packages.models import Package
+
+
+class CourierRoutePayloadTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.warehouse = Warehouse.objects.create(
+            city="Test City", latitude=50.0, longitude=20.0, address="Hub Address 1"
+        )
+        self.zone = Zone.objects.create(name="Zone A", warehouse=self.warehouse)
+        self.courier = User.objects.create(
+            email="driver@test.com", username="driver1", role='courier',
+            warehouse=self.warehouse, is_active=True
+        )
+        self.route = Route.objects.create(
+            courier=self.courier, route_type='last_mile', scheduled_date=date.today(), total_distance=10
+        )
+        self.start = RouteStop.objects.create(route=self.route, warehouse=self.warehouse, order=0)
+        self.client.force_authenticate(self.courier)
+
+    def _add_stops(self, count):
+        for i in range(count):
+            point = Postmat.objects.create(
+                name=f"P{i}", warehouse=self.warehouse, zone=self.zone,
+                latitude=50.01, longitude=20.01, address=f"P {i}"
+            )
+            stop = RouteStop.objects.create(route=self.route, postmat=point, order=RouteStop.objects.count())
+            pkg = Package.objects.create(
+                origin_postmat=point, destination_postmat=point, sender=self.courier,
+                receiver_name="R", receiver_phone="1", size='small', weight=1, route_path={}
+            )
+            RoutePackage.objects.create(route=self.route, package=pkg, pickup_stop=self.start, dropoff_stop=stop)
+
+    def _current(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/courier/routes/current/")
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data
+
+    def test_payload_queries_do_not_grow_with_stops(self):
+        self._add_stops(2)
+        few, _ = self._current()
+        self._add_stops(6)
+        many, data = self._current()
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(data['stops']), 9)
+        self.assertEqual(len(data['stops'][0]['pickups']), 8)
+        self.assertEqual(len(data['stops'][1]['dropoffs']), 1)
+
+    def test_cached_poll_is_invalidated_by_stop_completion(self):
+        self._add_stops(1)
+        self.client.get("/api/courier/routes/current/")
+        with self.assertNumQueries(1):
+            self.client.get("/api/courier/routes/current/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/courier/routes/{self.route.id}/complete-stop/{self.start.id}/")
+
+        data = self.client.get("/api/courier/routes/current/").data
+        self.assertIsNotNone(data['stops'][0]['completed_at'])
+
+    def test_complete_stop_writes_in_bulk_and_reports_each_package(self):
+        from packages.models import Actualization, PackageCurrentState
+        from postmats.models import Stash
+
+        self._add_stops(3)
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(f"/api/courier/routes/{self.route.id}/complete-stop/{self.start.id}/")
+        self._add_stops(5)
+        dropoff = RouteStop.objects.get(route=self.route, order=1)
+        pkg = RoutePackage.objects.get(dropoff_stop=dropoff).package
+        stash = Stash.objects.create(postmat=dropoff.postmat, size='small', package=pkg)
+        new_start = RouteStop.objects.create(route=self.route, warehouse=self.warehouse, order=99)
+        RoutePackage.objects.filter(pickup_stop=self.start, dropoff_stop__order__gt=3).update(pickup_stop=new_start)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.post(f"/api/courier/routes/{self.route.id}/complete-stop/{new_start.id}/")
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual({r['status'] for r in response.data['results']}, {'in_transit'})
+
+        response = self.client.post(f"/api/courier/routes/{self.route.id}/complete-stop/{dropoff.id}/")
+        self.assertEqual(response.data['results'], [{'package_id': str(pkg.id), 'action': 'drop', 'status': 'placed_in_stash'}])
+        self.assertFalse(Stash.objects.get(id=stash.id).is_empty)
+        self.assertEqual(PackageCurrentState.objects.get(package=pkg).status, 'placed_in_stash')
+        self.assertEqual(Actualization.objects.filter(package_id=pkg, status='placed_in_stash').count(), 1)
+
+    def test_scan_batch_is_idempotent_and_reports_each_item(self):
+        import uuid
+        from packages.models import Actualization, PackageCurrentState
+
+        self._add_stops(3)
+        links = list(RoutePackage.objects.filter(route=self.route).select_related('dropoff_stop'))
+        scans = [
+            {'scan_id': str(uuid.uuid4()), 'package_id': str(rp.package_id), 'stop_id': str(rp.dropoff_stop_id), 'action': 'drop'}
+            for rp in links
+        ]
+        scans.append({'scan_id': str(uuid.uuid4()), 'package_id': str(uuid.uuid4()), 'stop_id': str(self.start.id), 'action': 'pick'})
+        # Right package, wrong stop: dropped where it should be picked up
+        scans.append({'scan_id': str(uuid.uuid4()), 'package_id': str(links[0].package_id), 'stop_id': str(self.start.id), 'action': 'drop'})
+        url = f"/api/courier/routes/{self.route.id}/scan-batch/"
+
+        with self.assertNumQueries(9):
+            first = self.client.post(url, {'scans': scans}, format='json').data['results']
+        retry = self.client.post(url, {'scans': scans}, format='json').data['results']
+
+        self.assertEqual([r['result'] for r in first], ['ok', 'ok', 'ok', 'error', 'error'])
+        self.assertEqual(first[0]['new_state'], 'placed_in_stash')
+        self.assertEqual(first[4]['error'], 'Package is not dropped off at this stop')
+        self.assertEqual([r['result'] for r in retry], ['duplicate', 'duplicate', 'duplicate', 'error', 'error'])
+        self.assertEqual(Actualization.objects.filter(scan_id__isnull=False).count(), 3)
+        self.assertEqual(PackageCurrentState.objects.get(package_id=links[0].package_id).status, 'placed_in_stash')
+
+    def test_bundle_then_delta_sync_with_offline_scans(self):
+        import uuid
+
+        self._add_stops(2)
+        Route.objects.filter(id=self.route.id).update(structure_changed_at=None)  # built long ago
+        bundle = self.client.get(f"/api/courier/routes/{self.route.id}/bundle/").data
+        self.assertEqual(len(bundle['stops']), 3)
+        self.assertEqual({p['expected'] for p in bundle['packages']}, {'pick'})
+
+        picked = bundle['packages'][0]
+        scans = [{'scan_id': str(uuid.uuid4()), 'package_id': picked['id'], 'stop_id': picked['pickup_stop'], 'action': 'pick'}]
+        delta = self.client.post(
+            f"/api/courier/routes/{self.route.id}/sync/",
+            {'since': bundle['version'], 'scans': scans}, format='json'
+        ).data
+
+        self.assertEqual(delta['results'][0]['result'], 'ok')
+        # Rows inside the overlap window may come again; the device simply overwrites them
+        self.assertEqual({p['id']: p['expected'] for p in delta['packages']}[picked['id']], 'drop')
+        self.assertGreater(delta['version'], bundle['version'])
+        self.assertEqual(delta['stops'], [])
+
+    def test_sync_rejects_out_of_range_version(self):
+        for since in (10 ** 30, -10 ** 30, "abc"):
+            response = self.client.post(f"/api/courier/routes/{self.route.id}/sync/", {'since': since}, format='json')
+            self.assertEqual(response.status_code, 400, since)
+
+    def test_sync_sends_full_bundle_after_route_structure_changes(self):
+        import time
+
+        self._add_stops(2)
+        bundle = self.client.get(f"/api/courier/routes/{self.route.id}/bundle/").data
+        removed = RoutePackage.objects.filter(route=self.route).first()
+        sync_url = f"/api/courier/routes/{self.route.id}/sync/"
+
+        Route.objects.filter(id=self.route.id).update(structure_changed_at=None)
+        with patch('logistics.services.route_bundle.SYNC_OVERLAP', timedelta(0)):
+            time.sleep(0.01)
+            self.assertFalse(self.client.post(sync_url, {'since': bundle['version']}, format='json').data['full'])
+
+            removed.delete()
+            delta = self.client.post(sync_url, {'since': bundle['version']}, format='json').data
+
+        self.assertTrue(delta['full'])
+        self.assertNotIn(str(removed.package_id), {p['id'] for p in delta['packages']})
+        self.assertEqual(len(delta['packages']), 1)
+
+    def test_saving_an_unchanged_link_does_not_touch_the_route(self):
+        self._add_stops(2)
+        Route.objects.filter(id=self.route.id).update(structure_changed_at=None)
+        link = RoutePackage.objects.filter(route=self.route).first()
+
+        with self.assertNumQueries(1):
+            link.save()
+        self.route.refresh_from_db()
+        self.assertIsNone(self.route.structure_changed_at)
+
+        link.dropoff_stop = self.start
+        link.save()
+        self.route.refresh_from_db()
+        self.assertIsNotNone(self.route.structure_changed_at)
@@ -0,0 +1,167 @@
+import uuid
+import numpy as np
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from logistics.models import Warehouse
+from logistics.services.distance_service import DistanceService, apply_edge_change
+from logistics.services import distance_cache
+from proj import geo
+
+
+class DistanceServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        # A -10- B -10- C -5- D, plus a long direct A-C edge (50 km)
+        self.a, self.b, self.c, self.d = [
+            Warehouse(id=uuid.uuid4(), city=name, latitude=0, longitude=0)
+            for name in ("A", "B", "C", "D")
+        ]
+        self._connect(self.a, self.b, 10)
+        self._connect(self.b, self.c, 10)
+        self._connect(self.a, self.c, 50)
+        self._connect(self.c, self.d, 5)
+        self.isolated = Warehouse(id=uuid.uuid4(), city="E", latitude=0, longitude=0)
+        self.warehouses = [self.a, self.b, self.c, self.d, self.isolated]
+
+    def _connect(self, w1, w2, distance):
+        w1.connections.append({"id": str(w2.id), "distance": distance})
+        w2.connections.append({"id": str(w1.id), "distance": distance})
+
+    def test_floyd_warshall_and_dijkstra_agree(self):
+        fw = DistanceService(self.warehouses, method='floyd_warshall')
+        dj = DistanceService(self.warehouses, method='dijkstra')
+
+        self.assertEqual(fw.distance_matrix.dtype, np.float32)
+        np.testing.assert_array_equal(fw.distance_matrix, dj.distance_matrix)
+
+    def test_get_distance_uses_weighted_shortest_path(self):
+        service = DistanceService(self.warehouses)
+
+        self.assertEqual(service.get_distance(str(self.a.id), str(self.c.id)), 20.0)
+        self.assertEqual(service.get_distance(str(self.a.id), str(self.d.id)), 25.0)
+        self.assertEqual(service.get_distance(str(self.a.id), str(self.a.id)), 0.0)
+        self.assertEqual(service.get_distance(str(self.a.id), str(self.isolated.id)), float('inf'))
+        self.assertEqual(service.get_distance(str(self.a.id), "unknown"), float('inf'))
+
+    def test_path_reconstruction_from_predecessors(self):
+        for method in DistanceService.METHODS:
+            service = DistanceService(self.warehouses, method=method)
+
+            path = service.get_path_ids(str(self.a.id), str(self.d.id))
+
+            self.assertEqual(path, [str(self.a.id), str(self.b.id), str(self.c.id), str(self.d.id)])
+            self.assertIsNone(service.get_path_ids(str(self.a.id), str(self.isolated.id)))
+
+    def test_cached_matrices_are_reused_until_graph_changes(self):
+        cache.clear()
+        first = distance_cache.load_distance_service(self.warehouses)
+        second = distance_cache.load_distance_service(list(reversed(self.warehouses)))
+
+        self.assertIs(second.distance_matrix, first.distance_matrix)
+        self.assertEqual(second.get_distance(str(self.a.id), str(self.d.id)), 25.0)
+
+        self._connect(self.a, self.d, 1)
+        changed = distance_cache.load_distance_service(self.warehouses)
+
+        self.assertIsNot(changed.distance_matrix, first.distance_matrix)
+        self.assertEqual(changed.get_distance(str(self.a.id), str(self.d.id)), 1.0)
+
+    def test_incremental_edge_changes_match_full_recompute(self):
+        service = DistanceService(self.warehouses)
+        dist, pred, edges = service.distance_matrix.copy(), service.predecessors.copy(), dict(service.edges)
+        idx = service.id_to_index
+        a, b, c, d, e = (idx[str(w.id)] for w in self.warehouses)
+
+        # remove B-C, add D-E, make A-C shorter
+        self._disconnect(self.b, self.c)
+        self._connect(self.d, self.isolated, 7)
+        self._disconnect(self.a, self.c)
+        self._connect(self.a, self.c, 12)
+        for (u, v), weight in [((b, c), None), ((c, b), None), ((d, e), 7), ((e, d), 7), ((a, c), 12), ((c, a), 12)]:
+            apply_edge_change(dist, pred, edges, u, v, weight)
+
+        expected = DistanceService(self.warehouses)
+        np.testing.assert_allclose(dist, expected.distance_matrix)
+        self.assertEqual(edges, expected.edges)
+
+        repaired = DistanceService(self.warehouses, matrices=(dist, pred))
+        self.assertEqual(
+            repaired.get_path_ids(str(self.b.id), str(self.isolated.id)),
+            [str(w.id) for w in (self.b, self.a, self.c, self.d, self.isolated)],
+        )
+
+    def _disconnect(self, w1, w2):
+        w1.connections = [c for c in w1.connections if c["id"] != str(w2.id)]
+        w2.connections = [c for c in w2.connections if c["id"] != str(w1.id)]
+
+
+class DistanceCacheRefreshTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        distance_cache._local.update(fingerprint=None, matrices=None)
+        # Krakow - Katowice - Wroclaw - Poznan, plus Krakow - Wroclaw
+        self.krk, self.kat, self.wro, self.poz = [
+            Warehouse.objects.create(city=city, latitude=lat, longitude=lon, address=city)
+            for city, lat, lon in (
+                ("Krakow", 50.06, 19.94), ("Katowice", 50.26, 19.02),
+                ("Wroclaw", 51.11, 17.03), ("Poznan", 52.41, 16.93),
+            )
+        ]
+        for a, b in ((self.krk, self.kat), (self.kat, self.wro), (self.wro, self.poz), (self.krk, self.wro)):
+            self._set_links(a, a._extract_ids() + [str(b.id)])
+
+    def _set_links(self, warehouse, ids):
+        warehouse.refresh_from_db()
+        warehouse.connections = ids
+        warehouse.save()
+
+    def test_refresh_repairs_changed_edges_like_a_full_recompute(self):
+        distance_cache.refresh_distance_cache()
+        # Drop Krakow - Wroclaw, add Katowice - Poznan
+        self.krk.refresh_from_db()
+        self._set_links(self.krk, [wid for wid in self.krk._extract_ids() if wid != str(self.wro.id)])
+        self.kat.refresh_from_db()
+        self._set_links(self.kat, self.kat._extract_ids() + [str(self.poz.id)])
+
+        with patch.object(distance_cache, "DistanceService", wraps=DistanceService) as built, \
+                patch.object(distance_cache, "apply_edge_change", wraps=apply_edge_change) as repair:
+            service = distance_cache.refresh_distance_cache()
+
+        self.assertTrue(repair.called)
+        # Only wrapped around repaired matrices - no full O(n^3) pass
+        self.assertTrue(all("matrices" in call.kwargs for call in built.call_args_list))
+        expected = DistanceService(distance_cache._sorted_warehouses(), method='floyd_warshall')
+        self.assertEqual(service.warehouse_ids, expected.warehouse_ids)
+        np.testing.assert_allclose(service.distance_matrix, expected.distance_matrix, rtol=1e-6)
+        for src in expected.warehouse_ids:
+            for dst in expected.warehouse_ids:
+                self.assertEqual(service.get_path_ids(src, dst), expected.get_path_ids(src, dst))
+
+    def test_graph_change_queues_refresh_task_after_commit(self):
+        with patch("logistics.tasks.refresh_distance_cache.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self._set_links(self.poz, [])
+        self.assertTrue(delay.called)
+
+        # An unreachable broker is not fatal: the next load recomputes on a cache miss
+        with patch("logistics.tasks.refresh_distance_cache.delay", side_effect=ConnectionError("down")):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._set_links(self.poz, [str(self.wro.id)])
+
+
+class GeoDistanceTests(SimpleTestCase):
+
+    def test_vectorized_matrix_matches_scalar_haversine(self):
+        points = [(50.06, 19.94), (52.23, 21.01), (54.35, 18.65)]
+
+        matrix = geo.distance_matrix(points)
+        from_krakow = geo.distances_from(points[0], points[1:])
+
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.shape, (3, 3))
+        for i, a in enumerate(points):
+            for j, b in enumerate(points):
+                self.assertAlmostEqual(float(matrix[i, j]), geo.haversine(*a, *b), places=2)
+        np.testing.assert_array_equal(from_krakow, matrix[0, 1:])
@@ -0,0 +1,122 @@
+from datetime import date
+from unittest.mock import patch
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APITestCase
+from accounts.models import User
+from logistics.models import Warehouse, RouteGenerationJob
+from postmats.models import Postmat, Zone
+from packages.models import Package, Actualization
+from postmats.tasks import generate_local_routes_for_all_warehouses
+from logistics.tasks import generate_line_haul_routes
+
+
+class RouteGenerationJobTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create(
+            email="admin@test.com", username="admin", is_staff=True, is_active=True
+        )
+        self.warehouse = Warehouse.objects.create(
+            city="Test City", latitude=50.0, longitude=20.0, address="Hub Address 1"
+        )
+        zone = Zone.objects.create(name="Zone A", warehouse=self.warehouse)
+        self.courier = User.objects.create(
+            email="driver@test.com", username="driver1", role='courier',
+            warehouse=self.warehouse, is_active=True
+        )
+        point = Postmat.objects.create(
+            name="Point", warehouse=self.warehouse, zone=zone, latitude=50.01, longitude=20.01,
+            type='pickup_point', address="Business St"
+        )
+        pkg = Package.objects.create(
+            origin_postmat=point, destination_postmat=point, sender=self.courier,
+            receiver_name="R", receiver_phone="1", size='small', weight=1, route_path={}
+        )
+        Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse)
+        self.client.force_authenticate(self.admin)
+
+    def test_generate_all_queues_job_and_reports_progress(self):
+        with patch("postmats.views.views_routing.generate_local_routes_for_all_warehouses.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/api/admin/local-routes/generate-all/")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        delay.assert_called_once_with(response.data['id'])
+
+        # Run the worker side inline
+        generate_local_routes_for_all_warehouses(response.data['id'])
+
+        poll = self.client.get(f"/api/admin/route-jobs/{response.data['id']}/")
+        self.assertEqual(poll.status_code, status.HTTP_200_OK)
+        self.assertEqual(poll.data['status'], 'completed')
+        self.assertEqual(poll.data['routes_created'], 1)
+        self.assertEqual(poll.data['progress'][str(self.warehouse.id)]['routes'], 1)
+
+    def test_job_endpoint_requires_admin(self):
+        job = RouteGenerationJob.objects.create(job_type='line_haul', params={'date': '2025-01-01'})
+        self.client.force_authenticate(self.courier)
+
+        response = self.client.get(f"/api/admin/route-jobs/{job.id}/")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class LineHaulJobTaskTests(TestCase):
+
+    def setUp(self):
+        self.krakow = Warehouse.objects.create(city="Krakow", latitude=50.06, longitude=19.94, address="A 1")
+        self.warsaw = Warehouse.objects.create(city="Warsaw", latitude=52.23, longitude=21.01, address="B 1")
+        self.krakow.connections = [str(self.warsaw.id)]
+        self.krakow.save()
+        User.objects.create(
+            email="trucker@test.com", username="trucker", role='warehouse', warehouse=self.krakow, is_active=True
+        )
+        sender = User.objects.create(email="sender@test.com", username="sender", is_active=True)
+        postmat = Postmat.objects.create(
+            name="WAW-1", warehouse=self.warsaw, latitude=52.23, longitude=21.01, address="W St"
+        )
+        pkg = Package.objects.create(
+            origin_postmat=postmat, destination_postmat=postmat, sender=sender,
+            receiver_name="R", receiver_phone="1", size='small', weight=1, route_path={}
+        )
+        Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.krakow)
+        self.job = RouteGenerationJob.objects.create(job_type='line_haul', params={'date': date.today().isoformat()})
+
+    def _run_eagerly(self):
+        """Runs the task in-process and records the job status seen at every progress update"""
+        seen = []
+        record_progress = RouteGenerationJob.record_progress
+
+        def spy(job, key, **data):
+            seen.append(job.status)
+            record_progress(job, key, **data)
+
+        with patch.object(RouteGenerationJob, "record_progress", spy):
+            result = generate_line_haul_routes.apply(args=[str(self.job.id)])
+        self.job.refresh_from_db()
+        return result, seen
+
+    def test_job_runs_reports_progress_and_completes(self):
+        result, seen = self._run_eagerly()
+
+        self.assertTrue(result.successful())
+        self.assertEqual(seen, ['running'])
+        self.assertEqual(self.job.status, 'completed')
+        self.assertEqual(list(self.job.progress), [str(self.krakow.id)])
+        self.assertEqual(len(self.job.route_ids), 1)
+        self.assertEqual(self.job.timings['rejected_packages'], 0)
+        self.assertIsNotNone(self.job.started_at)
+        self.assertIsNotNone(self.job.finished_at)
+
+    def test_failed_commit_marks_job_failed(self):
+        with patch("logistics.services.route_plan.commit_route_plan", side_effect=RuntimeError("boom")):
+            result, seen = self._run_eagerly()
+
+        self.assertTrue(result.failed())
+        self.assertEqual(seen, ['running'])
+        self.assertEqual(self.job.status, 'failed')
+        self.assertEqual(self.job.error, 'boom')
+        self.assertEqual(self.job.route_ids, [])
+        self.assertIsNotNone(self.job.finished_at)
@@ -0,0 +1,240 @@
+import numpy as np
+from unittest.mock import patch
+from datetime import date
+from types import SimpleNamespace
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from accounts.models import User
+from logistics.models import Warehouse
+from logistics.services.routing_service import RoutingService
+from logistics.services.tour_improvement import Tour, TourImprover
+from postmats.models import Postmat
+from packages.models import Package, Actualization
+
+
+class HubBacklogTests(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create(email="sender@test.com", username="sender", is_active=True)
+        self.krakow = Warehouse.objects.create(city="Krakow", latitude=50.06, longitude=19.94, address="A 1")
+        self.warsaw = Warehouse.objects.create(city="Warsaw", latitude=52.23, longitude=21.01, address="B 1")
+        self.warsaw_postmat = Postmat.objects.create(
+            name="WAW-1", warehouse=self.warsaw, latitude=52.23, longitude=21.01, address="W St"
+        )
+
+    def _package_at(self, warehouse, status='in_warehouse'):
+        pkg = Package.objects.create(
+            origin_postmat=self.warsaw_postmat, destination_postmat=self.warsaw_postmat,
+            sender=self.sender, receiver_name="R", receiver_phone="1", size='small', weight=1, route_path={}
+        )
+        Actualization.objects.create(package_id=pkg, status=status, warehouse_id=warehouse)
+        return pkg
+
+    def test_backlog_holds_only_packages_waiting_for_another_hub(self):
+        waiting = self._package_at(self.krakow)
+        self._package_at(self.warsaw)  # already at its destination hub
+        moved_on = self._package_at(self.krakow)
+        Actualization.objects.create(package_id=moved_on, status='in_transit')
+
+        service = RoutingService()
+        with self.assertNumQueries(1):
+            backlog = service._get_hub_backlog()
+            destinations = [p.destination_postmat.warehouse.city for p in backlog[str(self.krakow.id)]]
+
+        self.assertEqual(list(backlog), [str(self.krakow.id)])
+        self.assertEqual([p.id for p in backlog[str(self.krakow.id)]], [waiting.id])
+        self.assertEqual(destinations, ["Warsaw"])
+
+
+class TourImprovementTests(SimpleTestCase):
+    # hub (0,0) and three stops on the corners of a 10 km square
+    HUB, A, B, C = range(4)
+
+    def setUp(self):
+        points = np.array([(0, 0), (0, 10), (10, 10), (10, 0)], dtype=np.float32)
+        self.matrix = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+
+    def _improver(self, capacity=10, max_minutes=10_000):
+        return TourImprover(self.matrix, capacity, max_minutes, 1.0, 0, time_budget=5)
+
+    def test_two_opt_removes_crossing_and_reports_saving(self):
+        items = [("p1", self.HUB, self.A), ("p2", self.HUB, self.B), ("p3", self.HUB, self.C)]
+        tour = Tour(hub=self.HUB, visits=[self.B, self.A, self.C], items=items)
+
+        tours, saved = self._improver().improve([tour])
+
+        self.assertEqual(tours[0].visits, [self.A, self.B, self.C])
+        self.assertAlmostEqual(saved, 2 * 200 ** 0.5 - 20, places=3)
+
+    def test_relocate_merges_tours_within_capacity(self):
+        first = Tour(hub=self.HUB, visits=[self.A], items=[("p1", self.HUB, self.A)])
+        second = Tour(hub=self.HUB, visits=[self.B], items=[("p2", self.HUB, self.B)])
+
+        merged, _ = self._improver(capacity=2).improve([first, second])
+        kept, _ = self._improver(capacity=1).improve([
+            Tour(hub=self.HUB, visits=[self.A], items=[("p1", self.HUB, self.A)]),
+            Tour(hub=self.HUB, visits=[self.B], items=[("p2", self.HUB, self.B)]),
+        ])
+
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(sorted(p for p, _, _ in merged[0].items), ["p1", "p2"])
+        self.assertEqual(len(kept), 2)
+
+    def test_pickup_must_precede_dropoff(self):
+        improver = self._improver()
+        items = [("p1", self.C, self.A)]
+
+        self.assertTrue(improver.feasible(self.HUB, [self.C, self.A], items))
+        self.assertFalse(improver.feasible(self.HUB, [self.A, self.C], items))
+        self.assertFalse(self._improver(max_minutes=30).feasible(self.HUB, [self.C, self.A], items))
+
+
+def _line_of_hubs():
+    """Krakow - Katowice - Wroclaw, connected in a line"""
+    hubs = [
+        Warehouse.objects.create(city=city, latitude=lat, longitude=lon, address=city)
+        for city, lat, lon in (("Krakow", 50.06, 19.94), ("Katowice", 50.26, 19.02), ("Wroclaw", 51.11, 17.03))
+    ]
+    for a, b in zip(hubs, hubs[1:]):
+        a.refresh_from_db()
+        a.connections = a._extract_ids() + [str(b.id)]
+        a.save()
+    return hubs
+
+
+class HubPlanMergeTests(TestCase):
+
+    def setUp(self):
+        self.krk, self.kat, self.wro = _line_of_hubs()
+        self.service = RoutingService()
+        self.hub = lambda wh: self.service.warehouse_map[str(wh.id)]
+
+    def test_backhaul_claimed_as_own_load_is_dropped_and_tour_shortened(self):
+        krk, kat, wro = self.hub(self.krk), self.hub(self.kat), self.hub(self.wro)
+        own, shared = SimpleNamespace(id=1), SimpleNamespace(id=2)
+        krk_plan = {
+            'start_hub_id': str(krk.id), 'stops': [krk, kat, wro, kat, krk], 'total_distance': 999,
+            'assignments': [(own, krk, kat), (shared, wro, krk)], 'package_count': 2,
+        }
+        wro_plan = {
+            'start_hub_id': str(wro.id), 'stops': [wro, kat, krk, kat, wro], 'total_distance': 999,
+            'assignments': [(shared, wro, krk)], 'package_count': 1,
+        }
+
+        merged = self.service._merge_hub_plans([[krk_plan], [wro_plan]])
+
+        self.assertEqual(merged[0]['assignments'], [(own, krk, kat)])
+        self.assertEqual(merged[0]['stops'], [krk, kat, krk])
+        expected = 2 * self.service.distance_service.get_distance(str(krk.id), str(kat.id))
+        self.assertAlmostEqual(merged[0]['total_distance'], round(expected, 2))
+        # Untouched plan keeps its stops and distance
+        self.assertEqual(merged[1]['total_distance'], 999)
+        self.assertEqual(len(merged[1]['stops']), 5)
+
+    def test_improved_tour_with_unreachable_leg_keeps_greedy_plans(self):
+        krk, kat = self.hub(self.krk), self.hub(self.kat)
+        plans = [{'start_hub_id': str(krk.id), 'stops': [krk, kat, krk], 'total_distance': 1,
+                  'assignments': [(SimpleNamespace(id=1), krk, kat)], 'package_count': 1}]
+
+        with patch("logistics.services.tour_improvement.TourImprover.improve", lambda _, tours: (tours, 5.0)), \
+                patch.object(self.service, "_find_shortest_graph_path", return_value=None):
+            improved, saved = self.service._improve_tours(plans, vehicle_capacity=10)
+
+        self.assertIs(improved, plans)
+        self.assertEqual(saved, 0.0)
+
+    def test_first_backhaul_claim_wins_and_empty_routes_are_dropped(self):
+        krk, kat, wro = self.hub(self.krk), self.hub(self.kat), self.hub(self.wro)
+        pkg = SimpleNamespace(id=7)
+        first = {'start_hub_id': str(krk.id), 'stops': [krk, kat, krk], 'total_distance': 1,
+                 'assignments': [(pkg, kat, krk)], 'package_count': 1}
+        second = {'start_hub_id': str(wro.id), 'stops': [wro, kat, wro], 'total_distance': 1,
+                  'assignments': [(pkg, kat, krk)], 'package_count': 1}
+
+        merged = self.service._merge_hub_plans([[first], [second]])
+
+        self.assertEqual(merged, [first])
+
+
+class GraphPathTests(TestCase):
+
+    def setUp(self):
+        # Krakow - Katowice - Wroclaw with a Katowice - Lodz branch, Gdansk unconnected
+        self.krk, self.kat, self.wro = _line_of_hubs()
+        self.lodz = Warehouse.objects.create(city="Lodz", latitude=51.76, longitude=19.46, address="Lodz")
+        self.gda = Warehouse.objects.create(city="Gdansk", latitude=54.35, longitude=18.65, address="Gdansk")
+        self.kat.refresh_from_db()
+        self.kat.connections = self.kat._extract_ids() + [str(self.lodz.id)]
+        self.kat.save()
+
+    def _bfs(self, start, end):
+        """Fewest-hop path over Warehouse.connections"""
+        neighbours = {str(w.id): w._extract_ids() for w in Warehouse.objects.all()}
+        parents, queue = {str(start.id): None}, [str(start.id)]
+        for node in queue:
+            if node == str(end.id):
+                path = []
+                while node:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+            for nxt in neighbours[node]:
+                if nxt not in parents:
+                    parents[nxt] = node
+                    queue.append(nxt)
+        return None
+
+    def test_shortest_path_matches_bfs_on_a_tree(self):
+        service = RoutingService()
+        hubs = [self.krk, self.kat, self.wro, self.lodz, self.gda]
+
+        for start in hubs:
+            for end in hubs:
+                path = service._find_shortest_graph_path(start, end)
+                expected = self._bfs(start, end)
+                self.assertEqual([str(w.id) for w in path] if path else None, expected, (start.city, end.city))
+
+    def test_weighted_path_is_never_longer_than_bfs_path(self):
+        # Krakow - Lodz shortcut: fewest hops and shortest distance can now disagree
+        self.krk.refresh_from_db()
+        self.krk.connections = self.krk._extract_ids() + [str(self.lodz.id)]
+        self.krk.save()
+        service = RoutingService()
+
+        for start, end in ((self.wro, self.lodz), (self.krk, self.wro), (self.lodz, self.wro)):
+            path = service._find_shortest_graph_path(start, end)
+            bfs = [service.warehouse_map[wid] for wid in self._bfs(start, end)]
+            self.assertEqual((path[0], path[-1]), (start, end))
+            for a, b in zip(path, path[1:]):
+                self.assertIn(str(b.id), a._extract_ids())
+            self.assertLessEqual(
+                service._calculate_path_distance(path), service._calculate_path_distance(bfs) + 1e-6
+            )
+
+
+class ParallelHubPlanningTests(TransactionTestCase):
+
+    @patch("logistics.tasks.refresh_distance_cache.delay")
+    def test_pool_plans_each_package_once(self, _refresh):
+        krk, kat, wro = _line_of_hubs()
+        sender = User.objects.create(email="sender@test.com", username="sender", is_active=True)
+        for hub in (krk, wro):
+            User.objects.create(email=f"d{hub.city}@test.com", username=f"d{hub.city}", role='warehouse',
+                                warehouse=hub, is_active=True)
+        for hub, target in ((krk, wro), (wro, krk), (krk, kat)):
+            postmat = Postmat.objects.create(name=f"P-{target.city}", warehouse=target,
+                                             latitude=target.latitude, longitude=target.longitude, address="x")
+            pkg = Package.objects.create(
+                origin_postmat=postmat, destination_postmat=postmat, sender=sender,
+                receiver_name="R", receiver_phone="1", size='small', weight=1, route_path={}
+            )
+            Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=hub)
+
+        sequential = RoutingService().plan_routes_for_date(date.today(), workers=1)
+        parallel = RoutingService().plan_routes_for_date(date.today(), workers=2)
+
+        routed = [p.package_id for r in parallel.routes for p in r.packages]
+        self.assertTrue(routed)
+        self.assertEqual(len(routed), len(set(routed)))
+        self.assertEqual(set(routed), {p.package_id for r in sequential.routes for p in r.packages})
+        # The parent reconnects after the pool closed its connections
+        self.assertEqual(Package.objects.count(), 3)
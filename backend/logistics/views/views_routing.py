@@ -10,9 +10,10 @@ from drf_spectacular.types import OpenApiTypes
 
 # Importy z Twojego projektu (upewnij się, że ścieżki są poprawne)
 from logistics.serializers.warehouse_courier_serializers import CourierRouteDetailSerializer
-from logistics.models import Route, RouteStop
-from logistics.serializers.admin_serializers import RouteListSerializer, RouteDetailSerializer
-from logistics.services.routing_service import RoutingService
+from django.db import transaction
+from logistics.models import Route, RouteStop, RouteGenerationJob
+from logistics.serializers.admin_serializers import RouteListSerializer, RouteDetailSerializer, RouteGenerationJobSerializer
+from logistics.tasks import generate_line_haul_routes
 from accounts.permissions import IsAdmin
 from packages.models import Package, Actualization
 
@@ -42,20 +43,24 @@ class RouteAdminViewSet(viewsets.ModelViewSet):
 
     @extend_schema(
         summary="Generate routes for date",
+        description="Queues line-haul generation as a background job. Poll /api/admin/route-jobs/{id}/ for progress.",
         request=None,
         parameters=[
             OpenApiParameter('date', OpenApiTypes.DATE, description="Date (YYYY-MM-DD)"),
             OpenApiParameter('max_stops', OpenApiTypes.INT, description="Max stops per route"),
             OpenApiParameter('vehicle_capacity', OpenApiTypes.INT, description="Vehicle capacity"),
         ],
-        responses={201: CourierRouteDetailSerializer(many=True)}
+        responses={202: RouteGenerationJobSerializer}
     )
     @action(detail=False, methods=['post'])
     def generate(self, request):
-        """Generate routes for a specific date"""
+        """Queue route generation for a specific date"""
         target_date_str = request.data.get('date') or request.query_params.get('date')
-        max_stops = int(request.data.get('max_stops', 15))
-        vehicle_capacity = int(request.data.get('vehicle_capacity', 50))
+        try:
+            max_stops = int(request.data.get('max_stops', 15))
+            vehicle_capacity = int(request.data.get('vehicle_capacity', 50))
+        except (TypeError, ValueError):
+            return Response({'error': 'max_stops and vehicle_capacity must be integers'}, status=400)
         
         if target_date_str:
             try:
@@ -65,23 +70,17 @@ class RouteAdminViewSet(viewsets.ModelViewSet):
         else:
             target_date = date.today()
         
-        try:
-            service = RoutingService()
-            routes = service.generate_routes_for_date(target_date, max_stops, vehicle_capacity)
-            
-            serializer = self.get_serializer(routes, many=True)
-            return Response({
-                'success': True,
-                'date': target_date,
-                'routes_created': len(routes),
-                'routes': serializer.data
-            }, status=status.HTTP_201_CREATED)
-        
-        except ValueError as e:
-            return Response({
-                'success': False,
-                'error': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
+        job = RouteGenerationJob.objects.create(
+            job_type='line_haul',
+            created_by=request.user,
+            params={
+                'date': target_date.isoformat(),
+                'max_stops': max_stops,
+                'vehicle_capacity': vehicle_capacity,
+            }
+        )
+        transaction.on_commit(lambda: generate_line_haul_routes.delay(str(job.id)))
+        return Response(RouteGenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
     @extend_schema(summary="Clear only PLANNED routes")
     @action(detail=False, methods=['delete'])
@@ -104,6 +103,15 @@ class RouteAdminViewSet(viewsets.ModelViewSet):
         return Response(stats)
 
 
+@extend_schema(tags=["Admin - Routing"])
+class RouteGenerationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status, per-hub progress and results of background route generation"""
+
+    serializer_class = RouteGenerationJobSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+    queryset = RouteGenerationJob.objects.all()
+
+
 # --- 2. Local Route ViewSet ---
 class LocalRouteViewSet(viewsets.ViewSet):
     # Jeśli używasz tej klasy w urls.py, zostaw ją tutaj (nawet pustą lub z pass)
@@ -8,7 +8,11 @@ from django.db.models import Q
 
 from logistics.models import Route, RouteStop, RoutePackage
 from logistics.serializers.warehouse_courier_serializers import CourierRouteDetailSerializer
-from packages.models import Actualization, Package
+from logistics.services.route_payload_cache import get_route_payload, invalidate_route_payload
+from logistics.services.scan_batch import MAX_SCANS_PER_BATCH, apply_scans
+from logistics.services.route_bundle import MAX_VERSION, build_bundle, build_delta
+from packages.models import Actualization, Package, PackageCurrentState
+from postmats.models import Stash
 
 class IsLogisticsCourier(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -19,7 +23,15 @@ class CourierRouteViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsLogisticsCourier]
 
     def get_queryset(self):
-        return Route.objects.filter(courier=self.request.user).order_by('-created_at')
+        return CourierRouteDetailSerializer.prefetch(
+            Route.objects.filter(courier=self.request.user).order_by('-created_at')
+        )
+
+    def _payload(self, route_id):
+        """Cached detail payload; rebuilt only after the route changed"""
+        return get_route_payload(
+            route_id, lambda: self.get_serializer(self.get_queryset().get(id=route_id)).data
+        )
     
     @action(detail=True, methods=['post'], url_path='scan-package')
     def scan_package(self, request, pk=None):
@@ -70,6 +82,7 @@ class CourierRouteViewSet(viewsets.ReadOnlyModelViewSet):
                 courier_id=request.user,         # ZMIANA: courier -> courier_id
                 warehouse_id=stop.warehouse if stop.warehouse else None, # ZMIANA: warehouse -> warehouse_id
             )
+            invalidate_route_payload(route.id)
             
             return Response({'status': 'success', 'new_state': new_status})
 
@@ -81,18 +94,70 @@ class CourierRouteViewSet(viewsets.ReadOnlyModelViewSet):
             traceback.print_exc() # Drukuje pełny stack trace do konsoli
             return Response({'error': f'Błąd serwera: {str(e)}'}, status=500)
 
+    @action(detail=True, methods=['post'], url_path='scan-batch')
+    def scan_batch(self, request, pk=None):
+        """
+        Wiele skanów w jednym żądaniu: {"scans": [{scan_id, package_id, stop_id, action}, ...]}.
+        Ponowione scan_id zwracają 'duplicate', więc kolejka offline może bezpiecznie powtarzać.
+        """
+        route = get_object_or_404(Route, pk=pk, courier=request.user)
+        scans = request.data.get('scans')
+        if not isinstance(scans, list) or not scans:
+            return Response({'error': 'Brakuje listy scans'}, status=400)
+        if len(scans) > MAX_SCANS_PER_BATCH:
+            return Response({'error': f'Maksymalnie {MAX_SCANS_PER_BATCH} skanów na żądanie'}, status=400)
+        if not all(isinstance(item, dict) for item in scans):
+            return Response({'error': 'Każdy skan musi być obiektem'}, status=400)
+
+        results = apply_scans(route, request.user, scans)
+        if any(r['result'] == 'ok' for r in results):
+            invalidate_route_payload(route.id)
+        return Response({'results': results})
+
+    @action(detail=True, methods=['get'])
+    def bundle(self, request, pk=None):
+        """Kompaktowa trasa do pracy offline (przystanki, paczki, oczekiwane akcje, wersja)"""
+        route = get_object_or_404(Route, pk=pk, courier=request.user)
+        return Response(build_bundle(route))
+
+    @action(detail=True, methods=['post'])
+    def sync(self, request, pk=None):
+        """
+        Synchronizacja różnicowa: {"since": <wersja>, "scans": [...]} - najpierw zapisuje
+        zebrane offline skany (jak scan-batch), potem zwraca zmiany od wersji `since`.
+        """
+        route = get_object_or_404(Route, pk=pk, courier=request.user)
+        try:
+            since = int(request.data.get('since', 0))
+        except (TypeError, ValueError):
+            return Response({'error': 'Niepoprawna wersja since'}, status=400)
+        if not 0 <= since <= MAX_VERSION:
+            return Response({'error': 'Niepoprawna wersja since'}, status=400)
+        scans = request.data.get('scans') or []
+        if not isinstance(scans, list) or not all(isinstance(item, dict) for item in scans):
+            return Response({'error': 'scans musi być listą obiektów'}, status=400)
+        if len(scans) > MAX_SCANS_PER_BATCH:
+            return Response({'error': f'Maksymalnie {MAX_SCANS_PER_BATCH} skanów na żądanie'}, status=400)
+
+        results = apply_scans(route, request.user, scans) if scans else []
+        if any(r['result'] == 'ok' for r in results):
+            invalidate_route_payload(route.id)
+        return Response({'results': results, **build_delta(route, since)})
+
     @action(detail=False, methods=['get'])
     def current(self, request):
         user = request.user
         print(f"DEBUG: Courier View. Requesting User: {user.email} (ID: {user.id})")
         
         # 1. Try generic fetch (latest non-cancelled)
-        route = Route.objects.filter(courier=user).exclude(status='cancelled').order_by('-created_at').first()
+        route_id = (
+            Route.objects.filter(courier=user).exclude(status='cancelled')
+            .order_by('-created_at').values_list('id', flat=True).first()
+        )
         
-        if route:
-            print(f"DEBUG: Found route {route.id} assigned to {user.email}")
-            serializer = self.get_serializer(route)
-            return Response(serializer.data)
+        if route_id:
+            print(f"DEBUG: Found route {route_id} assigned to {user.email}")
+            return Response(self._payload(route_id))
         
         # 2. If no route found, dump debug info about DB state
         total_routes = Route.objects.count()
@@ -119,43 +184,41 @@ class CourierRouteViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True, methods=['post'], url_path='complete-stop/(?P<stop_id>[^/.]+)')
     @transaction.atomic
     def complete_stop(self, request, pk=None, stop_id=None):
-        route = self.get_object()
-        stop = get_object_or_404(RouteStop, id=stop_id, route=route)
+        route = get_object_or_404(Route, pk=pk, courier=request.user)
+        stop = get_object_or_404(RouteStop.objects.select_for_update(), id=stop_id, route=route)
         if stop.completed_at:
             return Response({'error': 'Stop already completed'}, status=400)
         stop.completed_at = timezone.now()
         stop.save()
-        
-        # Dropoffs
-        dropoff_links = RoutePackage.objects.filter(dropoff_stop=stop).select_related('package')
-        for link in dropoff_links:
-            new_status = 'in_warehouse'
-            if stop.postmat:
-                new_status = 'placed_in_stash'
-                if hasattr(link.package, 'stash_assignment'):
-                     stash = link.package.stash_assignment.first()
-                     if stash:
-                         stash.is_empty = False
-                         stash.save()
-            Actualization.objects.create(
-                package_id=link.package,
+
+        # Wszystkie paczki przystanku jednym zapytaniem, zapisy zbiorczo (bez zapytań per paczka)
+        links = RoutePackage.objects.filter(route=route).filter(
+            Q(dropoff_stop=stop) | Q(pickup_stop=stop)
+        ).values_list('package_id', 'dropoff_stop_id')
+        drop_status = 'placed_in_stash' if stop.postmat else 'in_warehouse'
+        results = []
+        actualizations = []
+        for package_id, dropoff_stop_id in links:
+            if dropoff_stop_id == stop.id:
+                action_type, new_status, warehouse = 'drop', drop_status, stop.warehouse
+            else:
+                action_type, new_status, warehouse = 'pick', 'in_transit', None
+            actualizations.append(Actualization(
+                package_id_id=package_id,
                 status=new_status,
                 courier_id=request.user,
-                warehouse_id=stop.warehouse,
-                route_remaining={} 
-            )
-            
-        # Pickups
-        pickup_links = RoutePackage.objects.filter(pickup_stop=stop).select_related('package')
-        for link in pickup_links:
-            Actualization.objects.create(
-                package_id=link.package,
-                status='in_transit',
-                courier_id=request.user,
-                warehouse_id=None,
+                warehouse_id=warehouse,
                 route_remaining={}
-            )
-        return Response({'status': 'stop_completed'})
+            ))
+            results.append({'package_id': str(package_id), 'action': action_type, 'status': new_status})
+
+        dropped = [r['package_id'] for r in results if r['action'] == 'drop']
+        if stop.postmat and dropped:
+            # Only the stash in this locker - the package may still hold one at its origin
+            Stash.objects.filter(package_id__in=dropped, postmat=stop.postmat).update(is_empty=False)
+        PackageCurrentState.record(Actualization.objects.bulk_create(actualizations))
+
+        return Response({'status': 'stop_completed', 'results': results})
 
     @action(detail=True, methods=['post'])
     def finish(self, request, pk=None):
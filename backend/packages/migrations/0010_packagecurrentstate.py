@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-17 22:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_current_state(apps, schema_editor):
+    Actualization = apps.get_model('packages', 'Actualization')
+    PackageCurrentState = apps.get_model('packages', 'PackageCurrentState')
+
+    latest = Actualization.objects.using(schema_editor.connection.alias).order_by('package_id', '-created_at')
+    if schema_editor.connection.features.can_distinct_on_fields:
+        # Postgres keeps only the newest row per package, so Python sees one row per state
+        latest = latest.distinct('package_id')
+
+    chunk, last_package = [], None
+    for act in latest.iterator(chunk_size=2000):
+        if act.package_id_id == last_package:
+            continue
+        last_package = act.package_id_id
+        chunk.append(PackageCurrentState(
+            package_id=act.package_id_id,
+            status=act.status,
+            warehouse_id=act.warehouse_id_id,
+            courier_id=act.courier_id_id,
+            actualization_id=act.id,
+            updated_at=act.created_at,
+        ))
+        if len(chunk) >= 2000:
+            PackageCurrentState.objects.bulk_create(chunk)
+            chunk = []
+    PackageCurrentState.objects.bulk_create(chunk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0005_routegenerationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('packages', '0009_package_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageCurrentState',
+            fields=[
+                ('package', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_state', serialize=False, to='packages.package')),
+                ('status', models.CharField(choices=[('created', 'Created'), ('placed_in_stash', 'Placed in Stash'), ('in_transit', 'In Transit'), ('in_warehouse', 'In Warehouse'), ('delivered', 'Delivered'), ('picked_up', 'Picked Up')], default='created', max_length=20)),
+                ('updated_at', models.DateTimeField()),
+                ('actualization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='packages.actualization')),
+                ('courier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('warehouse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='current_packages', to='logistics.warehouse')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='packagecurrentstate',
+            index=models.Index(fields=['status', 'warehouse'], name='pkg_state_status_wh_idx'),
+        ),
+        migrations.RunPython(backfill_current_state, migrations.RunPython.noop),
+    ]
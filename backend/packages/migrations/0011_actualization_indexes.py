@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packages', '0010_packagecurrentstate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actualization',
+            index=models.Index(fields=['package_id', '-created_at'], name='act_package_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actualization',
+            index=models.Index(fields=['status', 'warehouse_id'], name='act_status_warehouse_idx'),
+        ),
+    ]
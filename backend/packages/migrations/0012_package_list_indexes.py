@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packages', '0011_actualization_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['sender', '-created_at', '-id'], name='pkg_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['receiver_user', '-created_at', '-id'], name='pkg_receiver_created_idx'),
+        ),
+    ]
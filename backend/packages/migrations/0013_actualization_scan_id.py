@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packages', '0012_package_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actualization',
+            name='scan_id',
+            field=models.UUIDField(blank=True, null=True, unique=True),
+        ),
+    ]
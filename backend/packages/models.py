@@ -79,6 +79,21 @@ class Package(models.Model):
 
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the sender / receiver parcel lists
+            models.Index(fields=["sender", "-created_at", "-id"], name="pkg_sender_created_idx"),
+            models.Index(fields=["receiver_user", "-created_at", "-id"], name="pkg_receiver_created_idx"),
+        ]
+
+    @property
+    def current_status(self):
+        """Status from PackageCurrentState (no scan of the Actualization history)"""
+        try:
+            return self.current_state.status
+        except PackageCurrentState.DoesNotExist:
+            return Actualization.PackageStatus.CREATED
+
     def __str__(self):
         return f"{self.pickup_code} ({self.size})"
 
@@ -115,9 +130,109 @@ class Actualization(models.Model):
     )
     route_remaining = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Client-generated id of a handheld scan; a retried scan is recognised and not written twice
+    scan_id = models.UUIDField(null=True, blank=True, unique=True)
     routes = models.ManyToManyField(
         "logistics.Route", related_name="actualizations", blank=True
     )
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # History of one package, newest first (latest-status lookups, "changed since" checks)
+            models.Index(fields=["package_id", "-created_at"], name="act_package_created_idx"),
+            models.Index(fields=["status", "warehouse_id"], name="act_status_warehouse_idx"),
+        ]
+
+
+class PackageCurrentState(models.Model):
+    """
+    Denormalized copy of the latest Actualization of each package.
+    Maintained on every Actualization insert (signals + bulk writers call `record`),
+    so "current status" lookups and warehouse backlogs don't scan the history.
+    """
+
+    package = models.OneToOneField(
+        Package,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="current_state",
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Actualization.PackageStatus.choices,
+        default=Actualization.PackageStatus.CREATED,
+    )
+    warehouse = models.ForeignKey(
+        "logistics.Warehouse",
+        on_delete=models.SET_NULL,
+        related_name="current_packages",
+        null=True,
+        blank=True,
+    )
+    courier = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    actualization = models.ForeignKey(
+        Actualization,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "warehouse"], name="pkg_state_status_wh_idx"),
+        ]
+
+    @classmethod
+    def record(cls, actualizations):
+        """
+        Upserts the state rows for the given (newly created) actualizations in one query.
+        bulk_create skips post_save, so every bulk writer of Actualizations calls this itself.
+        """
+        latest = {}
+        for act in actualizations:
+            current = latest.get(act.package_id_id)
+            if current is None or act.created_at >= current.created_at:
+                latest[act.package_id_id] = act
+        if not latest:
+            return
+        cls.objects.bulk_create(
+            [
+                cls(
+                    package_id=package_id,
+                    status=act.status,
+                    warehouse_id=act.warehouse_id_id,
+                    courier_id=act.courier_id_id,
+                    actualization_id=act.id,
+                    updated_at=act.created_at,
+                )
+                for package_id, act in latest.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["package"],
+            update_fields=["status", "warehouse", "courier", "actualization", "updated_at"],
+        )
+
+    @classmethod
+    def rebuild(cls, package_ids):
+        """Recomputes the state of the given packages from their Actualization history"""
+        latest = {}
+        for act in Actualization.objects.filter(package_id__in=package_ids).order_by(
+            "package_id", "-created_at"
+        ):
+            latest.setdefault(act.package_id_id, act)
+        cls.objects.filter(package_id__in=package_ids).exclude(
+            package_id__in=list(latest)
+        ).delete()
+        cls.record(latest.values())
+
+    def __str__(self):
+        return f"{self.package_id}: {self.status}"
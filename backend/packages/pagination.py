@@ -0,0 +1,63 @@
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class PackageCursorPagination(BasePagination):
+    """
+    Keyset pagination on (created_at, id), newest first.
+    The cursor is the last row of the previous page, so every page is one
+    index range scan no matter how long the user's history is.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self._page_size(request)
+        queryset = queryset.order_by("-created_at", "-id")
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self._decode(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_cursor = self._encode(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({"next_cursor": self.next_cursor, "results": data})
+
+    def _page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def _encode(package):
+        raw = f"{package.created_at.isoformat()}|{package.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode(cursor):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            parsed = parse_datetime(created_at)
+            pk = uuid.UUID(pk)
+        except (ValueError, UnicodeDecodeError):
+            parsed = None
+        if parsed is None:
+            raise ValidationError({"cursor": "Invalid cursor."})
+        return parsed, pk
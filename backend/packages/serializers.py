@@ -5,7 +5,8 @@ from rest_framework import serializers
 from postmats.models import Postmat, Stash
 from packages.models import Package, Actualization
 from payments.models import Payment, PricingRule
-from .utils import generate_unlock_code, find_nearest_postmat_with_stash
+from .utils import generate_unlock_code
+from postmats.services.stash_reservation import reserve_stash_nearby, release_stashes
 
 
 class PackageSerializer(serializers.ModelSerializer):
@@ -79,20 +80,75 @@ class PackageListSerializer(serializers.ModelSerializer):
             "can_delete",
         ]
 
+    # Columns behind each field that is not a plain Package column; joins follow the "__" paths
+    QUERY_COLUMNS = {
+        "sender_name": ("sender__username",),
+        "sender_email": ("sender__email",),
+        "origin_postmat_name": ("origin_postmat__name",),
+        "destination_postmat_name": ("destination_postmat__name",),
+        "latest_status": (),
+        "payment_status": ("payment__status",),
+        "payment_amount": ("payment__amount",),
+        "payment_client_secret": ("payment__status", "payment__stripe_client_secret"),
+        "can_retry_payment": ("payment__status",),
+        "can_delete": ("sender", "payment__status"),
+        "unlock_code": ("unlock_code", "receiver_user"),
+        "stash_reserved_until": (),
+        "stash_seconds_left": (),
+    }
+
+    @classmethod
+    def shape_queryset(cls, queryset, fields=None):
+        """
+        Joins, annotations and `.only()` columns for the requested `fields`
+        (all of them when empty), so a trimmed list also reads less. A page
+        then costs a fixed number of queries whatever its size.
+        """
+        from django.db.models import OuterRef, Subquery, Value
+        from django.db.models.functions import Coalesce
+
+        wanted = (set(fields or cls.Meta.fields) & set(cls.Meta.fields)) | {"id"}
+        columns = {"id", "created_at"}  # created_at feeds the page cursor
+        for name in wanted:
+            columns.update(cls.QUERY_COLUMNS.get(name, (name,)))
+
+        if "latest_status" in wanted:
+            queryset = queryset.annotate(latest_status=Coalesce("current_state__status", Value("created")))
+        if wanted & {"stash_reserved_until", "stash_seconds_left"}:
+            reserved = Stash.objects.filter(package_id=OuterRef("pk")).values("reserved_until")[:1]
+            queryset = queryset.annotate(reserved_until=Subquery(reserved))
+        related = {column.split("__")[0] for column in columns if "__" in column}
+        return queryset.select_related(*related).only(*columns)
+
+    def _payment(self, obj):
+        try:
+            return obj.payment
+        except Payment.DoesNotExist:
+            return None
+
+    def _reserved_until(self, obj):
+        if hasattr(obj, "reserved_until"):
+            return obj.reserved_until
+        stash = next(iter(obj.stash_assignment.all()), None)
+        return stash.reserved_until if stash else None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?fields=id,latest_status,... - the client only pays for the columns it shows
+        requested = self.context.get("fields")
+        if requested:
+            for name in set(self.fields) - set(requested) - {"id"}:
+                self.fields.pop(name)
+
     def get_stash_reserved_until(self, obj):
-        if hasattr(obj, "stash_assignment"):
-            stash = obj.stash_assignment.first()
-            if stash:
-                return stash.reserved_until
-        return None
+        return self._reserved_until(obj)
 
     def get_stash_seconds_left(self, obj):
-        if hasattr(obj, "stash_assignment"):
-            stash = obj.stash_assignment.first()
-            if stash and stash.reserved_until:
-                now = timezone.now()
-                if stash.reserved_until > now:
-                    return int((stash.reserved_until - now).total_seconds())
+        reserved_until = self._reserved_until(obj)
+        if reserved_until:
+            now = timezone.now()
+            if reserved_until > now:
+                return int((reserved_until - now).total_seconds())
         return 0
 
     def get_pickup_code(self, obj):
@@ -101,46 +157,34 @@ class PackageListSerializer(serializers.ModelSerializer):
 
     def get_payment_status(self, obj):
         """Get payment status for this package"""
-        try:
-            payment = Payment.objects.get(package=obj)
-            return payment.status
-        except Payment.DoesNotExist:
-            return None
+        payment = self._payment(obj)
+        return payment.status if payment else None
 
     def get_payment_amount(self, obj):
         """Get payment amount for this package"""
-        try:
-            payment = Payment.objects.get(package=obj)
-            return str(payment.amount)
-        except Payment.DoesNotExist:
-            return None
+        payment = self._payment(obj)
+        return str(payment.amount) if payment else None
 
     def get_payment_client_secret(self, obj):
         """Get client secret for pending payments"""
-        try:
-            payment = Payment.objects.get(package=obj)
-            # Only return client secret if payment is pending or failed
-            if payment.status in [
-                Payment.PaymentStatus.PENDING,
-                Payment.PaymentStatus.FAILED,
-            ]:
-                return payment.stripe_client_secret
-            return None
-        except Payment.DoesNotExist:
-            return None
+        payment = self._payment(obj)
+        # Only return client secret if payment is pending or failed
+        if payment and payment.status in [
+            Payment.PaymentStatus.PENDING,
+            Payment.PaymentStatus.FAILED,
+        ]:
+            return payment.stripe_client_secret
+        return None
 
     def get_can_retry_payment(self, obj):
         """Check if user can retry payment"""
-        try:
-            payment = Payment.objects.get(package=obj)
-            # Allow retry for pending, failed, or cancelled payments
-            return payment.status in [
-                Payment.PaymentStatus.PENDING,
-                Payment.PaymentStatus.FAILED,
-                Payment.PaymentStatus.CANCELLED,
-            ]
-        except Payment.DoesNotExist:
-            return False
+        payment = self._payment(obj)
+        # Allow retry for pending, failed, or cancelled payments
+        return bool(payment) and payment.status in [
+            Payment.PaymentStatus.PENDING,
+            Payment.PaymentStatus.FAILED,
+            Payment.PaymentStatus.CANCELLED,
+        ]
 
     def get_can_delete(self, obj):
         """Check if package can be deleted (not paid and user is sender)"""
@@ -148,21 +192,17 @@ class PackageListSerializer(serializers.ModelSerializer):
         if request and obj.sender_id != request.user.id:
             return False
 
-        try:
-            payment = Payment.objects.get(package=obj)
-            return payment.status != Payment.PaymentStatus.SUCCEEDED
-        except Payment.DoesNotExist:
-            return True
+        payment = self._payment(obj)
+        return payment is None or payment.status != Payment.PaymentStatus.SUCCEEDED
 
     def get_latest_status(self, obj):
-        latest = obj.actualizations.order_by("-created_at").first()
-        return latest.status if latest else "created"
+        return obj.current_status
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         request = self.context.get("request")
         # Only receiver sees unlock code
-        if not request or request.user != instance.receiver_user:
+        if not request or not instance.receiver_user_id or request.user.id != instance.receiver_user_id:
             data.pop("unlock_code", None)
         return data
 
@@ -237,27 +277,13 @@ class SendPackageSerializer(serializers.Serializer):
         origin_pm = validated_data["origin_postmat"]
         size = validated_data["size"]
 
-        # 1. Find stash in origin postmat
-        stash = origin_pm.stashes.filter(
-            size=size, is_empty=True, reserved_until__isnull=True
-        ).first()
-
+        # 1-2. Reserve a stash in origin postmat, or in the nearest postmat with a free one
+        stash = reserve_stash_nearby(origin_pm, size)
         if not stash:
-            # 2. Find nearest postmat
-            alt_pm = find_nearest_postmat_with_stash(origin_pm, size)
-            if not alt_pm:
-                raise serializers.ValidationError(
-                    "No available stash in any postmat for this size."
-                )
-
-            origin_pm = alt_pm
-            stash = alt_pm.stashes.filter(
-                size=size, is_empty=True, reserved_until__isnull=True
-            ).first()
-
-        # Reserve stash
-        stash.is_empty = True
-        stash.reserved_until = datetime.now() + timedelta(days=1)
+            raise serializers.ValidationError(
+                "No available stash in any postmat for this size."
+            )
+        origin_pm = stash.postmat
 
         unlock_code = generate_unlock_code()
 
@@ -282,7 +308,7 @@ class SendPackageSerializer(serializers.Serializer):
         )
 
         stash.package = package
-        stash.save()
+        stash.save(update_fields=["package"])
 
         # 4. Calculate pricing
         pricing = PricingRule.calculate_price(size, validated_data["weight"])
@@ -316,10 +342,8 @@ class SendPackageSerializer(serializers.Serializer):
 
         except stripe.error.StripeError as e:
             # Delete package if payment creation fails
+            release_stashes(package)
             package.delete()
-            stash.is_empty = True
-            stash.reserved_until = None
-            stash.save()
             raise serializers.ValidationError(f"Payment error: {str(e)}")
 
         # 7. Create actualization (package created but not paid)
@@ -359,32 +383,15 @@ class SendPackageSerializer(serializers.Serializer):
         # Check if origin postmat or size changed - need new stash
         if new_origin_pm.id != instance.origin_postmat_id or new_size != instance.size:
             # Release old stash
-            Stash.objects.filter(package=instance).update(
-                package=None, is_empty=True, reserved_until=None
-            )
-
-            # Find new stash
-            stash = new_origin_pm.stashes.filter(
-                size=new_size, is_empty=True, reserved_until__isnull=True
-            ).first()
+            release_stashes(instance)
 
+            # Reserve new stash (origin first, then nearest postmat with a free one)
+            stash = reserve_stash_nearby(new_origin_pm, new_size, package=instance)
             if not stash:
-                # Find nearest postmat with available stash
-                alt_pm = find_nearest_postmat_with_stash(new_origin_pm, new_size)
-                if not alt_pm:
-                    raise serializers.ValidationError(
-                        "No available stash in any postmat for this size."
-                    )
-                new_origin_pm = alt_pm
-                stash = alt_pm.stashes.filter(
-                    size=new_size, is_empty=True, reserved_until__isnull=True
-                ).first()
-
-            # Reserve new stash
-            stash.package = instance
-            stash.is_empty = True
-            stash.reserved_until = datetime.now() + timedelta(days=1)
-            stash.save()
+                raise serializers.ValidationError(
+                    "No available stash in any postmat for this size."
+                )
+            new_origin_pm = stash.postmat
 
         # Update package fields
         instance.origin_postmat = new_origin_pm
@@ -617,8 +624,7 @@ class SenderPackageDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_latest_status(self, obj):
-        latest = obj.actualizations.first()
-        return latest.status if latest else "created"
+        return obj.current_status
 
     def get_is_ready_for_pickup(self, obj):
         # Check if package is in a stash at the destination postmat
@@ -628,10 +634,7 @@ class SenderPackageDetailSerializer(serializers.ModelSerializer):
                 return True
 
         # Fallback: if status is explicitly DELIVERED
-        latest = obj.actualizations.first()
-        if latest and latest.status == "delivered":
-            return True
-        return False
+        return obj.current_status == "delivered"
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -697,8 +700,7 @@ class PublicPackageTrackingSerializer(serializers.ModelSerializer):
         ]
 
     def get_latest_status(self, obj):
-        latest = obj.actualizations.order_by("-created_at").first()
-        return latest.status if latest else "created"
+        return obj.current_status
 
 
 class AnonymousPickupSerializer(serializers.Serializer):
@@ -1,6 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Package, Actualization
+from .models import Package, Actualization, PackageCurrentState
 
 @receiver(post_save, sender=Package)
 def create_initial_actualization(sender, instance, created, **kwargs):
@@ -13,3 +13,15 @@ def create_initial_actualization(sender, instance, created, **kwargs):
             package_id=instance,
             status="created",
         )
+
+
+@receiver(post_save, sender=Actualization)
+def update_current_state(sender, instance, created, **kwargs):
+    """Keep PackageCurrentState in step with the newest Actualization."""
+    if created:
+        PackageCurrentState.record([instance])
+
+
+@receiver(post_delete, sender=Actualization)
+def rebuild_current_state(sender, instance, **kwargs):
+    PackageCurrentState.rebuild([instance.package_id_id])
@@ -1,3 +1,114 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import User
+from logistics.models import Warehouse
+from packages.models import Package, Actualization, PackageCurrentState
+from payments.models import Payment
 
-# Create your tests here.
+
+class PackageCurrentStateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email="sender@test.com", username="sender", is_active=True)
+        self.warehouse = Warehouse.objects.create(
+            city="Test City", latitude=50.0, longitude=20.0, address="Hub Address 1"
+        )
+        self.package = Package.objects.create(
+            sender=self.user, receiver_name="R", receiver_phone="1",
+            size='small', weight=1, route_path={}
+        )
+
+    def test_state_follows_latest_actualization(self):
+        self.assertEqual(self.package.current_state.status, 'created')
+
+        act = Actualization.objects.create(
+            package_id=self.package, status='in_warehouse', warehouse_id=self.warehouse
+        )
+        state = PackageCurrentState.objects.get(package=self.package)
+        self.assertEqual(state.status, 'in_warehouse')
+        self.assertEqual(state.warehouse, self.warehouse)
+        self.assertEqual(state.actualization_id, act.id)
+
+        act.delete()
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.current_status, 'created')
+        self.assertIsNone(PackageCurrentState.objects.get(package=self.package).warehouse)
+
+    def test_bulk_record_keeps_newest_per_package(self):
+        acts = Actualization.objects.bulk_create([
+            Actualization(package_id=self.package, status='in_warehouse', warehouse_id=self.warehouse),
+            Actualization(package_id=self.package, status='in_transit'),
+        ])
+        PackageCurrentState.record(acts)
+
+        self.assertEqual(PackageCurrentState.objects.get(package=self.package).status, 'in_transit')
+
+
+class UserPackagesListTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email="sender@test.com", username="sender", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _add_packages(self, count):
+        for _ in range(count):
+            package = Package.objects.create(
+                sender=self.user, receiver_name="R", receiver_phone="1",
+                size='small', weight=1, route_path={}
+            )
+            Payment.objects.create(
+                package=package, user=self.user, amount=10, base_price=10,
+                status=Payment.PaymentStatus.PENDING, stripe_client_secret="secret"
+            )
+
+    def _list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/packages/user/")
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data['results']
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self._add_packages(2)
+        small_page, _ = self._list_queries()
+        self._add_packages(8)
+        large_page, data = self._list_queries()
+
+        self.assertEqual(small_page, large_page)
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[0]['payment_status'], 'pending')
+        self.assertEqual(data[0]['payment_client_secret'], 'secret')
+        self.assertTrue(data[0]['can_delete'])
+
+    def test_cursor_pages_walk_history_newest_first(self):
+        self._add_packages(5)
+        expected = list(Package.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 2, "fields": "id,payment_status"}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get("/api/packages/user/", params).data
+            seen.extend(row["id"] for row in data["results"])
+            self.assertEqual(set(data["results"][0]), {"id", "payment_status"})
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [str(pk) for pk in expected])
+        self.assertEqual(self.client.get("/api/packages/user/", {"cursor": "bogus"}).status_code, 400)
+
+    def test_fields_trim_the_query(self):
+        self._add_packages(2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/packages/user/", {"fields": "id,latest_status"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["latest_status"], "created")
+
+        page_sql = next(q["sql"] for q in ctx.captured_queries if "latest_status" in q["sql"])
+        self.assertNotIn("payments_payment", page_sql)
+        self.assertNotIn("receiver_phone", page_sql)
+        self.assertNotIn("stash", page_sql)
@@ -19,8 +19,9 @@ class PackageAdminViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = Package.objects.select_related(
-            "origin_postmat", "destination_postmat", "sender"
+            "origin_postmat", "destination_postmat", "sender", "payment"
         ).prefetch_related(
+            "stash_assignment",
             Prefetch(
                 "actualizations",
                 queryset=Actualization.objects.select_related(
@@ -4,17 +4,19 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 
 from django.http import HttpResponse
-from django.db.models import OuterRef, Subquery, Q, F
+from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 
 from ..models import Package, Actualization
 from accounts.models import User
-from postmats.models import Postmat, Stash
+from postmats.models import Postmat
 from payments.models import Payment, WebhookEvent
 
 from ..serializers import SendPackageSerializer, PackageDetailSerializer
+from ..pagination import PackageCursorPagination
+from postmats.services.stash_reservation import release_stashes
 from accounts.authentication import CustomTokenAuthentication
 
 import stripe
@@ -30,9 +32,20 @@ from packages.serializers import (
 )
 
 
+def paginated_package_list(request, packages):
+    """One keyset page of `packages` serialized with the optional ?fields= projection"""
+    paginator = PackageCursorPagination()
+    fields = [f for f in request.query_params.get("fields", "").split(",") if f]
+    page = paginator.paginate_queryset(PackageListSerializer.shape_queryset(packages, fields), request)
+    serializer = PackageListSerializer(
+        page, many=True, context={"request": request, "fields": fields}
+    )
+    return paginator.get_paginated_response(serializer.data)
+
+
 class UserPackagesView(APIView):
     """
-    GET /user/parcels → list of user's shipments
+    GET /user/parcels → list of user's shipments (?cursor=, ?page_size=, ?fields=)
     POST /user/parcels → create new shipment
     """
 
@@ -40,65 +53,19 @@ class UserPackagesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-
-        last_status_subquery = (
-            Actualization.objects.filter(package_id=OuterRef("pk"))
-            .order_by("-created_at")
-            .values("status")[:1]
-        )
-
-        reservation_subquery = Stash.objects.filter(package_id=OuterRef("pk")).values(
-            "reserved_until"
-        )[:1]
-
-        packages = (
-            Package.objects.filter(sender=user)
-            .annotate(
-                latest_status=Subquery(last_status_subquery),
-                payment_status=F("payment__status"),
-                reserved_until=Subquery(reservation_subquery),
-            )
-            .select_related("origin_postmat", "destination_postmat", "payment")
-        )
-
-        serializer = PackageListSerializer(
-            packages, many=True, context={"request": request}
-        )
-        # The PackageListSerializer needs to be updated to include
-        # `payment_status` and `reserved_until` fields.
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginated_package_list(request, Package.objects.filter(sender=request.user))
 
 
 class UserIncomingPackagesView(APIView):
     """
-    GET /user/incoming/ → list of packages sent TO the user
+    GET /user/incoming/ → list of packages sent TO the user (?cursor=, ?page_size=, ?fields=)
     """
 
     authentication_classes = [CustomTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-
-        last_status_subquery = (
-            Actualization.objects.filter(package_id=OuterRef("pk"))
-            .order_by("-created_at")
-            .values("status")[:1]
-        )
-
-        packages = (
-            Package.objects.filter(receiver_user=user)
-            .annotate(latest_status=Subquery(last_status_subquery))
-            .select_related("origin_postmat", "destination_postmat", "sender")
-        )
-
-        serializer = PackageListSerializer(
-            packages, many=True, context={"request": request}
-        )
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginated_package_list(request, Package.objects.filter(receiver_user=request.user))
 
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -483,18 +450,10 @@ class StripeWebhookView(APIView):
             )
             payment.save()
 
-            # Release the stash
+            # Release the stash held by this package
             package = payment.package
-            if package.origin_postmat:
-                stash = package.origin_postmat.stashes.filter(
-                    size=package.size, is_empty=False
-                ).first()
-
-                if stash:
-                    stash.is_empty = True
-                    stash.reserved_until = None
-                    stash.save()
-                    print(f"[WEBHOOK] Stash released for failed payment")
+            if release_stashes(package):
+                print(f"[WEBHOOK] Stash released for failed payment")
 
             print(f"[WEBHOOK] ✓ Payment marked as failed for package {package.id}")
 
@@ -513,18 +472,10 @@ class StripeWebhookView(APIView):
             payment.status = Payment.PaymentStatus.CANCELLED
             payment.save()
 
-            # Release the stash
+            # Release the stash held by this package
             package = payment.package
-            if package.origin_postmat:
-                stash = package.origin_postmat.stashes.filter(
-                    size=package.size, is_empty=False
-                ).first()
-
-                if stash:
-                    stash.is_empty = True
-                    stash.reserved_until = None
-                    stash.save()
-                    print(f"[WEBHOOK] Stash released for canceled payment")
+            if release_stashes(package):
+                print(f"[WEBHOOK] Stash released for canceled payment")
 
             print(f"[WEBHOOK] ✓ Payment marked as canceled for package {package.id}")
 
@@ -772,12 +723,7 @@ class CollectPackageView(APIView):
 
             # Check if package is ready for collection (must be DELIVERED)
             is_ready = False
-            latest_act = package.actualizations.order_by("-created_at").first()
-
-            if (
-                latest_act
-                and latest_act.status == Actualization.PackageStatus.DELIVERED
-            ):
+            if package.current_status == Actualization.PackageStatus.DELIVERED:
                 is_ready = True
             elif hasattr(package, "stash_assignment"):
                 stash = package.stash_assignment.first()
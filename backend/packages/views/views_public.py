@@ -107,9 +107,7 @@ class AnonymousPickupView(APIView):
 
         # Check if package is ready for collection
         is_ready = False
-        latest_act = package.actualizations.order_by("-created_at").first()
-
-        if latest_act and latest_act.status == Actualization.PackageStatus.DELIVERED:
+        if package.current_status == Actualization.PackageStatus.DELIVERED:
             is_ready = True
         elif hasattr(package, "stash_assignment"):
             stash = package.stash_assignment.first()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PostmatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'postmats'
+
+    def ready(self):
+        import postmats.signals
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-17 22:36
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def backfill_capacity(apps, schema_editor):
+    Postmat = apps.get_model('postmats', 'Postmat')
+    PostmatCapacity = apps.get_model('postmats', 'PostmatCapacity')
+
+    free = Q(stashes__is_empty=True, stashes__reserved_until__isnull=True)
+    counts = Postmat.objects.annotate(
+        small=Count('stashes', filter=free & Q(stashes__size='small')),
+        medium=Count('stashes', filter=free & Q(stashes__size='medium')),
+        large=Count('stashes', filter=free & Q(stashes__size='large')),
+    ).values_list('id', 'small', 'medium', 'large')
+    PostmatCapacity.objects.bulk_create(
+        [
+            PostmatCapacity(postmat_id=pid, free_small=small, free_medium=medium, free_large=large)
+            for pid, small, medium, large in counts
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('postmats', '0007_postmat_owner_postmat_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostmatCapacity',
+            fields=[
+                ('postmat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='capacity', serialize=False, to='postmats.postmat')),
+                ('free_small', models.PositiveIntegerField(default=0)),
+                ('free_medium', models.PositiveIntegerField(default=0)),
+                ('free_large', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_capacity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('postmats', '0008_postmatcapacity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stash',
+            index=models.Index(
+                condition=models.Q(('reserved_until__isnull', False)),
+                fields=['reserved_until'],
+                name='stash_reserved_until_idx',
+            ),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 import uuid
 import time
 import requests
+from contextvars import ContextVar
 from logistics.models import Warehouse
 from django.conf import settings
 
@@ -126,6 +127,103 @@ class Postmat(models.Model):
             return ""
         return ""
 
+# Set while bulk_update runs its own update() calls, which it has already accounted for
+_capacity_accounted = ContextVar("capacity_accounted", default=False)
+
+
+class StashQuerySet(models.QuerySet):
+    """
+    Bulk writes skip post_save, so they move the PostmatCapacity counters themselves.
+    Writes the deltas cannot be derived for (expressions, size/postmat moves,
+    conflict handling) fall back to a recount of the touched postmats.
+    """
+
+    def update(self, **kwargs):
+        from django.db import transaction
+
+        touched = self._capacity_fields(kwargs)
+        if not touched or _capacity_accounted.get():
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            plain = not any(hasattr(value, "resolve_expression") for value in kwargs.values())
+            if plain and touched <= {"is_empty", "reserved_until"}:
+                moves = self._capacity_moves(kwargs)
+                updated = super().update(**kwargs)
+                PostmatCapacity.adjust(moves)
+            else:
+                postmat_ids = set(self.values_list("postmat_id", flat=True))
+                target = kwargs.get("postmat", kwargs.get("postmat_id"))
+                postmat_ids.add(getattr(target, "pk", target))
+                updated = super().update(**kwargs)
+                PostmatCapacity.refresh(postmat_ids)
+        return updated
+
+    def _capacity_fields(self, names):
+        return self.model.CAPACITY_FIELDS & {self.model._meta.get_field(name).name for name in names}
+
+    def _capacity_moves(self, kwargs):
+        """[(slot, change)] for every (postmat, size) whose free count the update changes"""
+        from django.db.models import Count, Q, Value
+
+        free_after = Q()
+        for field, lookup, stays_free in (
+            ("is_empty", Q(is_empty=True), lambda v: v is True),
+            ("reserved_until", Q(reserved_until__isnull=True), lambda v: v is None),
+        ):
+            if field not in kwargs:
+                free_after &= lookup
+            elif not stays_free(kwargs[field]):
+                free_after = None
+                break
+        if free_after is None:
+            now_free = Value(0)
+        else:
+            now_free = Count("pk", filter=free_after) if free_after else Count("pk")
+        groups = self.order_by().values("postmat_id", "size").annotate(
+            was_free=Count("pk", filter=Q(is_empty=True, reserved_until__isnull=True)),
+            now_free=now_free,
+        )
+        return [((g["postmat_id"], g["size"]), g["now_free"] - g["was_free"]) for g in groups]
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        from django.db import transaction
+
+        objs = list(objs)
+        if not self._capacity_fields(fields):
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        moves, unknown = [], set()
+        for obj in objs:
+            if hasattr(obj, "_capacity_slot"):
+                after = obj.capacity_slot()
+                moves += [(obj._capacity_slot, -1), (after, 1)]
+                obj._capacity_slot = after
+            else:
+                unknown.add(obj.postmat_id)
+        with transaction.atomic(using=self.db):
+            token = _capacity_accounted.set(True)
+            try:
+                updated = super().bulk_update(objs, fields, batch_size=batch_size)
+            finally:
+                _capacity_accounted.reset(token)
+            PostmatCapacity.adjust(moves)
+            PostmatCapacity.refresh(unknown)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from django.db import transaction
+
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get("ignore_conflicts") or kwargs.get("update_conflicts"):
+                PostmatCapacity.refresh(obj.postmat_id for obj in objs)
+            else:
+                for obj in objs:
+                    obj._capacity_slot = obj.capacity_slot()
+                PostmatCapacity.adjust((obj._capacity_slot, 1) for obj in objs)
+        return created
+
+
 class Stash(models.Model):
     class StashSize(models.TextChoices):
         SMALL = "small", "Small"
@@ -147,3 +245,116 @@ class Stash(models.Model):
         on_delete=models.SET_NULL,
         related_name="stash_assignment",
     )
+
+    objects = StashQuerySet.as_manager()
+
+    # Fields that decide whether (and where) a stash counts as free in PostmatCapacity
+    CAPACITY_FIELDS = frozenset({"postmat", "size", "is_empty", "reserved_until"})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        stash = super().from_db(db, field_names, values)
+        # Remember the loaded slot, so a later save knows which counter it leaves
+        if not {"postmat_id", "size", "is_empty", "reserved_until"} & stash.get_deferred_fields():
+            stash._capacity_slot = stash.capacity_slot()
+        return stash
+
+    def capacity_slot(self):
+        """(postmat id, size) this stash is counted under as free, or None when taken"""
+        if self.is_empty and self.reserved_until is None:
+            return (self.postmat_id, self.size)
+        return None
+
+    class Meta:
+        indexes = [
+            # Only reserved stashes are indexed, so the expiry sweep stays small on a large table
+            models.Index(
+                fields=["reserved_until"],
+                name="stash_reserved_until_idx",
+                condition=models.Q(reserved_until__isnull=False),
+            ),
+        ]
+
+
+class PostmatCapacity(models.Model):
+    """
+    Free (empty and unreserved) stash counts per size for one postmat.
+    Moved with F() increments in the same transaction as every stash change
+    (signals, or the Stash queryset after bulk writes); the full recount in
+    `refresh` is left to reconcile_postmat_capacity and the rare fallbacks.
+    """
+    postmat = models.OneToOneField(
+        Postmat, on_delete=models.CASCADE, primary_key=True, related_name="capacity"
+    )
+    free_small = models.PositiveIntegerField(default=0)
+    free_medium = models.PositiveIntegerField(default=0)
+    free_large = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def free(self, size) -> int:
+        return getattr(self, f"free_{size}", 0)
+
+    @classmethod
+    def adjust(cls, moves):
+        """
+        Applies [((postmat id, size), change)] to the counters, one UPDATE per postmat.
+        Slots of None are skipped; a postmat without a counter row yet is recounted.
+        """
+        from collections import defaultdict
+        from django.db.models import F
+        from django.db.models.functions import Greatest
+        from django.utils import timezone
+
+        changes = defaultdict(lambda: defaultdict(int))
+        for slot, change in moves:
+            if slot and slot[0] and slot[1] in Stash.StashSize.values:
+                changes[slot[0]][f"free_{slot[1]}"] += change
+        missing = []
+        now = timezone.now()
+        for postmat_id, fields in sorted(changes.items(), key=lambda item: str(item[0])):
+            updates = {
+                field: Greatest(F(field) + change, 0, output_field=models.PositiveIntegerField())
+                for field, change in fields.items() if change
+            }
+            if updates and not cls.objects.filter(postmat_id=postmat_id).update(updated_at=now, **updates):
+                missing.append(postmat_id)
+        cls.refresh(missing)
+
+    @classmethod
+    def refresh(cls, postmat_ids):
+        """
+        Recounts free stashes of the given postmats. The capacity rows are locked
+        first, so concurrent refreshes of one postmat see each other's committed changes.
+        Used by the reconcile task and where `adjust` cannot derive the change.
+        """
+        from django.db import transaction
+        from django.db.models import Count, Q
+        from django.utils import timezone
+
+        postmat_ids = {pid for pid in postmat_ids if pid}
+        if not postmat_ids:
+            return
+        with transaction.atomic():
+            postmat_ids = sorted(Postmat.objects.filter(id__in=postmat_ids).values_list("id", flat=True), key=str)
+            cls.objects.bulk_create(
+                [cls(postmat_id=pid) for pid in postmat_ids], ignore_conflicts=True
+            )
+            rows = {
+                row.postmat_id: row
+                for row in cls.objects.select_for_update().filter(postmat_id__in=postmat_ids).order_by("postmat_id")
+            }
+            free = Q(stashes__is_empty=True, stashes__reserved_until__isnull=True)
+            counts = Postmat.objects.filter(id__in=postmat_ids).annotate(
+                small=Count("stashes", filter=free & Q(stashes__size="small")),
+                medium=Count("stashes", filter=free & Q(stashes__size="medium")),
+                large=Count("stashes", filter=free & Q(stashes__size="large")),
+            ).values_list("id", "small", "medium", "large")
+            now = timezone.now()
+            for pid, small, medium, large in counts:
+                row = rows[pid]
+                row.free_small, row.free_medium, row.free_large = small, medium, large
+                row.updated_at = now
+            cls.objects.bulk_update(rows.values(), ["free_small", "free_medium", "free_large", "updated_at"])
+
+    def __str__(self):
+        return f"{self.postmat_id}: S{self.free_small} M{self.free_medium} L{self.free_large}"
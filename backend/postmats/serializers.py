@@ -1,10 +1,12 @@
 from rest_framework import serializers
-from .models import Postmat, Stash, Zone
+from .models import Postmat, PostmatCapacity, Stash, Zone
 from logistics.models import Warehouse
 from logistics.serializers.serializers import WarehouseSimpleSerializer
 
 
 class PostmatSerializer(serializers.ModelSerializer):
+    free_stashes = serializers.SerializerMethodField()
+
     class Meta:
         model = Postmat
         fields = [
@@ -17,8 +19,21 @@ class PostmatSerializer(serializers.ModelSerializer):
             "longitude",
             "image",
             "postal_code",
+            "free_stashes",
         ]
 
+    def get_free_stashes(self, obj):
+        """Free stash counts per size from PostmatCapacity (select_related('capacity') in list views)"""
+        try:
+            capacity = obj.capacity
+        except PostmatCapacity.DoesNotExist:
+            return {"small": 0, "medium": 0, "large": 0}
+        return {
+            "small": capacity.free_small,
+            "medium": capacity.free_medium,
+            "large": capacity.free_large,
+        }
+
 class StashSerializer(serializers.ModelSerializer):
     display_size = serializers.CharField(source="get_size_display", read_only=True)
 
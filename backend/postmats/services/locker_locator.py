@@ -0,0 +1,158 @@
+import math
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.core.cache import cache
+
+from proj import geo
+
+# Grid cell edge in degrees (~11 km N-S); a lookup scans rings of cells outwards
+CELL_DEG = 0.1
+KM_PER_DEGREE = 111.32
+
+# Beyond this many rings (~5,500 km) a scan of every postmat is cheaper than walking cells
+MAX_RINGS = 50
+
+INDEX_VERSION_KEY = "postmats:spatial_index:version"
+
+# Per-process index, rebuilt only when a Postmat was added, moved or removed
+_local = {"version": None, "index": None}
+
+
+class PostmatGridIndex:
+    """Geohash-style grid over postmat coordinates for k-nearest lookups"""
+
+    def __init__(self, rows):
+        self.ids = [row[0] for row in rows]
+        self.id_set = set(self.ids)
+        self.coords = np.array([(row[1], row[2]) for row in rows], dtype=np.float64).reshape(-1, 2)
+        self.cells = defaultdict(list)
+        for i, (lat, lon) in enumerate(self.coords):
+            self.cells[self._cell(lat, lon)].append(i)
+        self.max_lat = float(np.abs(self.coords[:, 0]).max()) if len(self.ids) else 0.0
+        self.bounds = (
+            min(i for i, _ in self.cells), max(i for i, _ in self.cells),
+            min(j for _, j in self.cells), max(j for _, j in self.cells),
+        ) if self.cells else None
+
+    @staticmethod
+    def _cell(lat, lon):
+        return int(math.floor(lat / CELL_DEG)), int(math.floor(lon / CELL_DEG))
+
+    def _ring(self, ci, cj, r):
+        if r == 0:
+            return self.cells.get((ci, cj), [])
+        found = []
+        for di in range(-r, r + 1):
+            for dj in (-r, r) if abs(di) != r else range(-r, r + 1):
+                found.extend(self.cells.get((ci + di, cj + dj), []))
+        return found
+
+    def nearest(self, latitude, longitude, k, accept=None):
+        """
+        Up to k (postmat id, km) pairs, nearest first, among postmats passing `accept(id)`.
+        Rings are scanned until the k-th hit is closer than anything an outer ring could hold.
+        """
+        if not self.ids or k <= 0:
+            return []
+        ci, cj = self._cell(latitude, longitude)
+        min_i, max_i, min_j, max_j = self.bounds
+        max_ring = max(abs(min_i - ci), abs(max_i - ci), abs(min_j - cj), abs(max_j - cj))
+        # km of one cell along the narrower (longitude) axis at the worst latitude in the index
+        cell_km = CELL_DEG * KM_PER_DEGREE * math.cos(math.radians(min(89.0, max(self.max_lat, abs(latitude)))))
+
+        if max_ring > MAX_RINGS:
+            return self._nearest_brute_force(latitude, longitude, k, accept)
+
+        hits = []
+        for r in range(max_ring + 1):
+            ring = [i for i in self._ring(ci, cj, r) if accept is None or accept(self.ids[i])]
+            if ring:
+                distances = geo.distances_from((latitude, longitude), self.coords[ring])
+                hits.extend(zip(distances.tolist(), ring))
+                hits.sort()
+                del hits[k:]
+            if len(hits) == k and hits[-1][0] <= r * cell_km:
+                break
+        return [(self.ids[i], km) for km, i in hits]
+
+    def _nearest_brute_force(self, latitude, longitude, k, accept):
+        candidates = [i for i, pid in enumerate(self.ids) if accept is None or accept(pid)]
+        if not candidates:
+            return []
+        distances = geo.distances_from((latitude, longitude), self.coords[candidates])
+        hits = sorted(zip(distances.tolist(), candidates))[:k]
+        return [(self.ids[i], km) for km, i in hits]
+
+
+def invalidate_postmat_index():
+    try:
+        cache.set(INDEX_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        print(f"Warning: Could not invalidate postmat index: {e}")
+    _local["version"] = None
+
+
+def get_postmat_index(rebuild: bool = False) -> PostmatGridIndex:
+    from postmats.models import Postmat
+
+    try:
+        version = cache.get(INDEX_VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(INDEX_VERSION_KEY, version, timeout=None)
+    except Exception as e:
+        print(f"Warning: Postmat index cache unavailable, rebuilding: {e}")
+        version = None
+
+    if rebuild or version is None or _local["version"] != version:
+        rows = list(Postmat.objects.values_list("id", "latitude", "longitude"))
+        _local["index"] = PostmatGridIndex(rows)
+        _local["version"] = version
+    return _local["index"]
+
+
+def free_stash_counts(size: str) -> Dict:
+    """{postmat id: free stashes of `size`} read from the PostmatCapacity counters"""
+    from postmats.models import PostmatCapacity
+
+    field = f"free_{size}"
+    return dict(PostmatCapacity.objects.filter(**{f"{field}__gt": 0}).values_list("postmat_id", field))
+
+
+def find_nearest_available_postmats(latitude, longitude, size, k=5, exclude_ids=None) -> List:
+    """
+    k nearest postmats that have a free stash of `size`, nearest first.
+    Each returned Postmat carries `distance_km` and `free_stashes`.
+    """
+    from postmats.models import Postmat
+
+    free = free_stash_counts(size)
+    excluded = set(exclude_ids or [])
+    index = get_postmat_index()
+    if not index.id_set.issuperset(free):
+        # A postmat was added in a transaction whose invalidation has not reached us yet
+        index = get_postmat_index(rebuild=True)
+    hits = index.nearest(
+        latitude, longitude, k, accept=lambda pid: free.get(pid) and pid not in excluded
+    )
+    if not hits:
+        return []
+
+    postmats = Postmat.objects.in_bulk([pid for pid, _ in hits])
+    result = []
+    for pid, km in hits:
+        pm = postmats.get(pid)
+        if pm is None:
+            continue
+        pm.distance_km = round(km, 3)
+        pm.free_stashes = free[pid]
+        result.append(pm)
+    return result
+
+
+def find_nearest_available_postmat(origin_pm, size) -> Optional[object]:
+    found = find_nearest_available_postmats(origin_pm.latitude, origin_pm.longitude, size, k=1)
+    return found[0] if found else None
@@ -1,9 +1,9 @@
 from collections import defaultdict
 from datetime import date
-from django.db import transaction
+from typing import Optional
 from django.conf import settings
-from django.utils import timezone
-import math
+import numpy as np
+from proj import geo
 
 class LocalRoutingService:
     """
@@ -11,36 +11,65 @@ class LocalRoutingService:
     Logic:
     1. Group packages by Zone (Static Territories).
     2. Check Stash Availability (Allocation Phase).
-    3. Generate TSP Route for Zone Courier.
+    3. Split each Zone into van routes (capacitated VRP: Clarke-Wright + local search).
     """
     
     AVG_SPEED_KM_MIN = 0.5  # Slower in city (30km/h)
     STOP_DURATION_MINUTES = 5 # Quick stop (swap packages)
+    VEHICLE_CAPACITY = 60  # packages per van
+    MAX_WORK_DAY_MINUTES = 480
 
-    @transaction.atomic
-    def generate_local_routes(self, target_date: date, warehouse_id: str):
+    def generate_local_routes(
+        self,
+        target_date: date,
+        warehouse_id: str,
+        vehicle_capacity: Optional[int] = None,
+        max_work_minutes: Optional[float] = None
+    ):
+        """Plans local routes, then commits them in one short transaction"""
+        from logistics.services.route_plan import commit_route_plan
+
+        plan = self.plan_local_routes(target_date, warehouse_id, vehicle_capacity, max_work_minutes)
+        routes = commit_route_plan(plan)
+        for route in routes:
+            print(f"Created local route {route.id} ({route.estimated_duration} min) - Driver ID: {route.courier_id}")
+        return routes
+
+    def plan_local_routes(
+        self,
+        target_date: date,
+        warehouse_id: str,
+        vehicle_capacity: Optional[int] = None,
+        max_work_minutes: Optional[float] = None
+    ):
+        """
+        Planning phase only: returns a RoutePlan (routes, stash reservations and
+        "locker full" delays) without writing anything. A zone gets as many van
+        routes as `vehicle_capacity` and `max_work_minutes` require.
+        """
         from accounts.models import User
-        from logistics.models import Route, Warehouse
+        from logistics.models import Warehouse
+        from logistics.services.route_plan import RoutePlan, PlannedDelay
         from postmats.models import Zone
-        from packages.models import Actualization
         
+        plan = RoutePlan(scheduled_date=target_date)
         try:
             warehouse = Warehouse.objects.get(id=warehouse_id)
         except Warehouse.DoesNotExist:
             print(f"Error: Warehouse {warehouse_id} not found.")
-            return []
+            return plan
 
         zones = Zone.objects.filter(warehouse=warehouse)
         if not zones.exists():
             print(f"No zones defined for {warehouse.city}. Run seed_zones.")
-            return []
+            return plan
 
         # 1. Get packages waiting at this warehouse for local delivery
         local_packages = self._get_local_packages(warehouse)
         
         if not local_packages:
             print(f"No local packages pending at {warehouse.city}.")
-            return []
+            return plan
         
         # Group by Zone
         packages_by_zone = defaultdict(list)
@@ -51,8 +80,6 @@ class LocalRoutingService:
             else:
                 print(f"Skipping package {pkg.id}: Postmat {pkg.destination_postmat.name} has no zone.")
 
-        created_routes = []
-        
         # 2. Get available drivers STRICTLY for this warehouse
         couriers = list(User.objects.filter(
             role='courier', 
@@ -67,7 +94,22 @@ class LocalRoutingService:
                  couriers = list(User.objects.filter(role='courier', is_active=True).order_by('id'))
             
             if not couriers:
-                return []
+                return plan
+
+        vehicle_capacity = vehicle_capacity or self.VEHICLE_CAPACITY
+        max_work_minutes = max_work_minutes or self.MAX_WORK_DAY_MINUTES
+        postmats = list({pkg.destination_postmat for pkg in local_packages})
+        matrix, matrix_index = self._distance_matrix(warehouse, postmats)
+
+        # Allocation Phase: Reserve stashes for the whole warehouse at once
+        allocated_by_zone, failed_by_zone = defaultdict(list), defaultdict(list)
+        allocated, failed = self._allocate_stashes([p for pkgs in packages_by_zone.values() for p in pkgs])
+        for pkg in allocated:
+            allocated_by_zone[pkg.destination_postmat.zone_id].append(pkg)
+        for pkg in failed:
+            failed_by_zone[pkg.destination_postmat.zone_id].append(pkg)
+        if failed:
+            print(f"{warehouse.city}: {len(failed)} packages deferred to the next cycle (lockers full).")
 
         courier_idx = 0
 
@@ -76,102 +118,105 @@ class LocalRoutingService:
             if not zone_pkgs:
                 continue
             
-            # Allocation Phase: Reserve stashes
-            allocated_pkgs, failed_pkgs = self._allocate_stashes(zone_pkgs)
+            allocated_pkgs, failed_pkgs = allocated_by_zone[zone.id], failed_by_zone[zone.id]
             
             # --- Handle Lack of Free Stashes ---
             if failed_pkgs:
                 print(f"Zone {zone.name}: {len(failed_pkgs)} packages could not be allocated due to full lockers.")
                 for pkg in failed_pkgs:
-                    # FIX: Używamy package_id i warehouse_id zgodnie z definicją modelu
-                    Actualization.objects.create(
-                        package_id=pkg,
-                        status='in_warehouse', 
-                        warehouse_id=warehouse,
-                        route_remaining={'info': "Delivery delayed: Destination locker full. Retrying next cycle."}
-                    )
+                    plan.delays.append(PlannedDelay(
+                        package_id=str(pkg.id),
+                        warehouse_id=str(warehouse.id),
+                        info="Delivery delayed: Destination locker full. Retrying next cycle."
+                    ))
             # -----------------------------------
             
             if not allocated_pkgs:
                 print(f"Zone {zone.name}: No stashes available for {len(zone_pkgs)} packages.")
                 continue
 
-            # Assign Driver
-            driver = couriers[courier_idx % len(couriers)]
-            courier_idx += 1
+            # Build Routes (CVRP) and assign one driver per van
+            vans = self._solve_zone(allocated_pkgs, matrix, matrix_index, vehicle_capacity, max_work_minutes)
+            for ordered_postmats, van_pkgs in vans:
+                driver = couriers[courier_idx % len(couriers)]
+                courier_idx += 1
+                plan.routes.append(self._plan_zone_route(
+                    driver, warehouse, van_pkgs, ordered_postmats, matrix, matrix_index
+                ))
+                print(f"Planned local route for Zone {zone.name} ({len(van_pkgs)} pkgs) - Driver: {driver.email}")
 
-            # Build Route (TSP)
-            route = self._create_zone_route(driver, warehouse, allocated_pkgs, target_date)
-            created_routes.append(route)
-            print(f"Created local route {route.id} for Zone {zone.name} ({len(allocated_pkgs)} pkgs) - Driver: {driver.email}")
+        if courier_idx > len(couriers):
+            print(f"WARNING: {courier_idx} local routes for {len(couriers)} couriers at {warehouse.city}; some drive more than one.")
 
-        return created_routes
+        return plan
 
     def _get_local_packages(self, warehouse):
-        from packages.models import Actualization
+        from django.db.models import OuterRef, Subquery
+        from packages.models import Actualization, PackageCurrentState
         
-        # FIFO priority
-        latest_acts = Actualization.objects.filter(
-            status='in_warehouse', 
-            warehouse_id=warehouse.id # FIX: warehouse_id zamiast warehouse (dla bezpieczeństwa zapytań)
-        ).select_related('package_id__destination_postmat__zone').order_by('created_at')
-        
-        candidates = []
-        # Uwaga: latest_acts to queryset Actualization, musimy wyciągnąć unikalne paczki
-        seen_packages = set()
-        
-        for act in latest_acts:
-            pkg = act.package_id
-            if pkg.id in seen_packages:
-                continue
-            
-            # Sprawdź czy to jest ostatni status tej paczki (najnowsza aktualizacja)
-            # W prostszym modelu można założyć, że bierzemy statusy 'in_warehouse'.
-            # Ale dla pewności sprawdźmy czy paczka faktycznie ma iść z tego magazynu.
-            if pkg.destination_postmat.warehouse_id == warehouse.id:
-                candidates.append(pkg)
-                seen_packages.add(pkg.id)
-        
-        return candidates
+        # FIFO po pierwszym przyjęciu do tego magazynu - wpisy "locker full" nie przesuwają paczki na koniec kolejki
+        arrived_at = Actualization.objects.filter(
+            package_id=OuterRef('package_id'), status='in_warehouse', warehouse_id=warehouse.id
+        ).order_by('created_at').values('created_at')[:1]
+        # Tylko paczki, których aktualny status to 'in_warehouse' w tym magazynie
+        states = PackageCurrentState.objects.filter(
+            status='in_warehouse',
+            warehouse_id=warehouse.id,
+            package__destination_postmat__warehouse_id=warehouse.id
+        ).annotate(arrived_at=Subquery(arrived_at)).select_related(
+            'package__destination_postmat__zone'
+        ).order_by('arrived_at', 'package_id')
+
+        packages = []
+        for state in states:
+            state.package._arrived_at = state.arrived_at  # wiek paczki dla match_stashes (overdue)
+            packages.append(state.package)
+        return packages
 
     def _allocate_stashes(self, packages):
         """
         Check if destination postmat has empty stash of right size.
+        Each locker is matched as a whole (see stash_matching.match_stashes), so the
+        most packages fit and the newest ones are deferred when space runs out;
+        packages waiting longer than MAX_WAIT go first.
+        All free stashes of every destination locker come from one query,
+        the size-fallback assignment runs in memory; reservations are written
+        with bulk_update by commit_route_plan.
+        `packages` are expected oldest first.
         Returns tuple: (approved_packages, failed_packages)
         """
+        from django.utils import timezone
+        from postmats.models import Stash
+        from postmats.services.stash_matching import MAX_WAIT, SIZE_ORDER, match_stashes
+
         approved = []
         failed = []
+        overdue_before = timezone.now() - MAX_WAIT
         
         by_postmat = defaultdict(list)
         for p in packages: by_postmat[p.destination_postmat].append(p)
+
+        # Jedno zapytanie dla wszystkich paczkomatów magazynu: (postmat_id, size) -> wolne skrytki
+        locker_ids = [pm.id for pm in by_postmat if pm.is_locker]
+        free_stashes = defaultdict(list)
+        if locker_ids:
+            for stash in Stash.objects.filter(
+                postmat_id__in=locker_ids, is_empty=True, reserved_until__isnull=True
+            ).only('id', 'postmat_id', 'size'):
+                free_stashes[(stash.postmat_id, stash.size)].append(stash)
         
         for pm, pkgs in by_postmat.items():
             if pm.is_locker is False:
-                for p in pkgs:
-                    approved.extend(pkgs)
+                approved.extend(pkgs)
                 continue
 
-            # Pobieramy puste skrytki, które nie są zarezerwowane
-            empty_stashes = list(pm.stashes.filter(is_empty=True, reserved_until__isnull=True))
-            
-            small_stashes = [s for s in empty_stashes if s.size == 'small']
-            medium_stashes = [s for s in empty_stashes if s.size == 'medium']
-            large_stashes = [s for s in empty_stashes if s.size == 'large']
-            
-            for p in pkgs:
-                selected_stash = None
-                
-                # Prosta logika dopasowania rozmiaru (można ulepszyć o wkładanie małych do dużych)
-                if p.size == 'small':
-                    if small_stashes: selected_stash = small_stashes.pop()
-                    elif medium_stashes: selected_stash = medium_stashes.pop()
-                    elif large_stashes: selected_stash = large_stashes.pop()
-                elif p.size == 'medium':
-                    if medium_stashes: selected_stash = medium_stashes.pop()
-                    elif large_stashes: selected_stash = large_stashes.pop()
-                elif p.size == 'large':
-                    if large_stashes: selected_stash = large_stashes.pop()
-                
+            # Dopasowanie rozmiarów dla całego paczkomatu naraz (pkgs są w kolejności FIFO)
+            chosen = match_stashes(
+                [p.size for p in pkgs],
+                {size: free_stashes[(pm.id, size)] for size in SIZE_ORDER},
+                overdue=[bool(getattr(p, '_arrived_at', None)) and p._arrived_at < overdue_before for p in pkgs],
+            )
+            for p, selected_stash in zip(pkgs, chosen):
                 if selected_stash:
                     p._reserved_stash = selected_stash # Tymczasowe przypisanie w pamięci
                     approved.append(p)
@@ -180,105 +225,102 @@ class LocalRoutingService:
                     
         return approved, failed
 
-    def _create_zone_route(self, driver, warehouse, packages, date):
-        from logistics.models import Route, RouteStop, RoutePackage
-        
-        active_postmats = list({p.destination_postmat for p in packages})
+    def _distance_matrix(self, warehouse, postmats):
+        """
+        Road-less (haversine) km matrix: index 0 is the warehouse, then the postmats.
+        Returns (float32 matrix, {postmat id: index}).
+        """
+        points = [(warehouse.latitude, warehouse.longitude)] + [(pm.latitude, pm.longitude) for pm in postmats]
+        return geo.distance_matrix(points), {pm.id: i for i, pm in enumerate(postmats, start=1)}
+
+    def _solve_zone(self, packages, matrix, matrix_index, vehicle_capacity, max_work_minutes):
+        """
+        Splits a zone's allocated packages into van routes.
+        Returns [(ordered postmats, packages)] - one entry per van.
+        """
+        from logistics.services.tour_improvement import Tour, TourImprover
+        from postmats.services.zone_vrp import clarke_wright, route_minutes
+
+        by_postmat = defaultdict(list)
+        for pkg in packages:
+            by_postmat[pkg.destination_postmat].append(pkg)
+
+        vans = []
+        # A postmat with more packages than one van holds gets dedicated full vans first
+        for pm, pkgs in by_postmat.items():
+            while len(pkgs) > vehicle_capacity:
+                vans.append(([pm], pkgs[:vehicle_capacity]))
+                del pkgs[:vehicle_capacity]
+
+        postmats = list(by_postmat)
+        nodes = [0] + [matrix_index[pm.id] for pm in postmats]
+        sub_matrix = matrix[np.ix_(nodes, nodes)]
+        demands = {i: len(by_postmat[pm]) for i, pm in enumerate(postmats, start=1)}
+
+        routes = clarke_wright(
+            sub_matrix, demands, vehicle_capacity, max_work_minutes,
+            self.AVG_SPEED_KM_MIN, self.STOP_DURATION_MINUTES
+        )
+        tours = [
+            Tour(hub=0, visits=route, items=[(pkg, 0, node) for node in route for pkg in by_postmat[postmats[node - 1]]])
+            for route in routes
+        ]
+        improver = TourImprover(
+            sub_matrix, vehicle_capacity, max_work_minutes, self.AVG_SPEED_KM_MIN, self.STOP_DURATION_MINUTES,
+            getattr(settings, 'ROUTING_IMPROVEMENT_SECONDS', 2.0)
+        )
+        tours, _ = improver.improve(tours)
+
+        for tour in tours:
+            if route_minutes(improver.D, tour.visits, self.AVG_SPEED_KM_MIN, self.STOP_DURATION_MINUTES) > max_work_minutes:
+                print(f"WARNING: Local route with {len(tour.visits)} stops exceeds the {max_work_minutes} min work day.")
+            vans.append(([postmats[node - 1] for node in tour.visits], [pkg for pkg, _, _ in tour.items]))
+        return vans
+
+    def _plan_zone_route(self, driver, warehouse, packages, ordered_postmats, matrix, matrix_index):
+        from logistics.services.route_plan import PlannedRoute, PlannedStop, PlannedPackage
         
-        # Simple TSP (Nearest Neighbor)
         ordered_stops = []
-        current_loc = {'lat': warehouse.latitude, 'lon': warehouse.longitude}
-        remaining = list(active_postmats)
-        
         total_dist = 0.0
-        
-        while remaining:
-            nearest = min(remaining, key=lambda pm: math.sqrt((pm.latitude-current_loc['lat'])**2 + (pm.longitude-current_loc['lon'])**2))
-            dist = self._haversine(current_loc['lat'], current_loc['lon'], nearest.latitude, nearest.longitude)
+        prev = 0
+        for pm in ordered_postmats:
+            dist = float(matrix[prev, matrix_index[pm.id]])
             total_dist += dist
-            
-            ordered_stops.append((nearest, dist))
-            current_loc = {'lat': nearest.latitude, 'lon': nearest.longitude}
-            remaining.remove(nearest)
-            
-        dist_home = self._haversine(current_loc['lat'], current_loc['lon'], warehouse.latitude, warehouse.longitude)
+            ordered_stops.append((pm, dist))
+            prev = matrix_index[pm.id]
+
+        dist_home = float(matrix[prev, 0])
         total_dist += dist_home
         
-        # Create Route
-        route = Route.objects.create(
-            courier=driver,
-            scheduled_date=date,
-            status='planned',
-            route_type='last_mile',
-            total_distance=round(total_dist, 2),
-            estimated_duration=int((total_dist / self.AVG_SPEED_KM_MIN) + (len(ordered_stops) * self.STOP_DURATION_MINUTES))
-        )
-        
-        # STOP 0: Warehouse (START)
-        start_stop = RouteStop.objects.create(
-            route=route, 
-            warehouse=warehouse, 
-            order=0, 
-            distance_from_previous=0
-        )
-        
-        current_order = 1
-        pm_stop_map = {} 
-        
-        # Przystanki pośrednie (Paczkomaty)
-        for pm, dist in ordered_stops:
-            stop = RouteStop.objects.create(
-                route=route, 
-                postmat=pm, 
-                order=current_order, 
-                distance_from_previous=round(dist, 2)
-            )
-            pm_stop_map[pm.id] = stop
-            current_order += 1
-            
-        # STOP N: Warehouse (KONIEC/POWRÓT)
-        RouteStop.objects.create(
-            route=route, 
-            warehouse=warehouse, 
-            order=current_order, 
-            distance_from_previous=round(dist_home, 2)
-        )
+        # STOP 0: Warehouse (START), then postmats, then STOP N: Warehouse (KONIEC/POWRÓT)
+        stops = [PlannedStop(order=0, warehouse_id=str(warehouse.id), distance_from_previous=0)]
+        pm_stop_order = {}
+        for order, (pm, dist) in enumerate(ordered_stops, start=1):
+            stops.append(PlannedStop(order=order, postmat_id=str(pm.id), distance_from_previous=round(dist, 2)))
+            pm_stop_order[pm.id] = order
+        stops.append(PlannedStop(order=len(stops), warehouse_id=str(warehouse.id), distance_from_previous=round(dist_home, 2)))
         
-        # Link Packages & Apply Reservations
+        # To jest kluczowe dla skanera:
+        # pickup = stop 0 (Magazyn - kurier bierze paczkę)
+        # dropoff = przystanek paczkomatu (kurier wkłada paczkę, skrytka zarezerwowana)
+        planned_packages = []
         for pkg in packages:
-            dest_pm_id = pkg.destination_postmat.id
-            dropoff_stop = pm_stop_map.get(dest_pm_id)
-            
-            if dropoff_stop:
-                # To jest kluczowe dla skanera:
-                # pickup_stop = start_stop (Magazyn - kurier bierze paczkę)
-                # dropoff_stop = dropoff_stop (Paczkomat - kurier wkłada paczkę)
-                RoutePackage.objects.create(
-                    route=route,
-                    package=pkg, # Tutaj pole to 'package', bo RoutePackage ma ForeignKey o nazwie 'package'
-                    pickup_stop=start_stop,
-                    dropoff_stop=dropoff_stop
-                )
-                
-                # Zapisanie rezerwacji skrytki w bazie
-                if hasattr(pkg, '_reserved_stash'):
-                    stash = pkg._reserved_stash
-                    stash.reserved_until = timezone.now() + timezone.timedelta(hours=24)
-                    # Zakładamy, że model Stash ma pole 'package' (ForeignKey lub OneToOne)
-                    # Jeśli nie ma, usuń linię stash.package = pkg
-                    if hasattr(stash, 'package'): 
-                        stash.package = pkg 
-                    stash.is_empty = False # Oznaczamy jako zajętą (zarezerwowaną)
-                    stash.save()
-
-        return route
+            dropoff_order = pm_stop_order.get(pkg.destination_postmat.id)
+            if dropoff_order is None:
+                continue
+            stash = getattr(pkg, '_reserved_stash', None)
+            planned_packages.append(PlannedPackage(
+                package_id=str(pkg.id),
+                pickup_order=0,
+                dropoff_order=dropoff_order,
+                stash_id=str(stash.id) if stash else None
+            ))
 
-    def _haversine(self, lat1, lon1, lat2, lon2):
-        R = 6371.0
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (math.sin(dlat / 2) ** 2 +
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-             math.sin(dlon / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
\ No newline at end of file
+        return PlannedRoute(
+            courier_id=driver.id,
+            route_type='last_mile',
+            total_distance=round(total_dist, 2),
+            estimated_duration=int((total_dist / self.AVG_SPEED_KM_MIN) + (len(ordered_stops) * self.STOP_DURATION_MINUTES)),
+            stops=stops,
+            packages=planned_packages
+        )
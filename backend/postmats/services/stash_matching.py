@@ -0,0 +1,40 @@
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+# Stash sizes from smallest to largest; a package fits a stash of its own size or any larger one
+SIZE_ORDER = ["small", "medium", "large"]
+
+# A parcel waiting this long in the warehouse goes before larger, newer ones
+MAX_WAIT = timedelta(hours=48)
+
+
+def match_stashes(
+    sizes: List[str], free: Dict[str, List], overdue: Optional[List[bool]] = None
+) -> List[Optional[object]]:
+    """
+    Assigns free stashes of one postmat to packages, `sizes` given oldest package first.
+    `free` maps size -> free stashes. Returns the chosen stash (or None = deferred) per package.
+
+    Packages are placed largest first (oldest first within a size) into the tightest
+    fitting stash. With nested sizes this delivers the maximum number of packages, and
+    when a locker is short it is the newest small parcels that wait - they fit any stash
+    freed tomorrow, while a medium parcel would keep losing its stash to them.
+    Packages flagged in `overdue` (waited past MAX_WAIT) are placed before all others,
+    oldest first, so a small parcel cannot lose its stash to newer large ones forever.
+    """
+    rank = {size: i for i, size in enumerate(SIZE_ORDER)}
+    pools = {size: list(free.get(size, [])) for size in SIZE_ORDER}
+
+    overdue = overdue or [False] * len(sizes)
+
+    chosen = [None] * len(sizes)
+    order = sorted(
+        (i for i, size in enumerate(sizes) if size in rank),
+        key=lambda i: (not overdue[i], -rank[sizes[i]], i),
+    )
+    for idx in order:
+        for size in SIZE_ORDER[rank[sizes[idx]]:]:
+            if pools[size]:
+                chosen[idx] = pools[size].pop()
+                break
+    return chosen
@@ -0,0 +1,131 @@
+from datetime import timedelta
+from typing import Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+RESERVATION_HOURS = 24
+
+# A package fits its own size or anything larger
+SIZE_FALLBACKS = {
+    "small": ["small", "medium", "large"],
+    "medium": ["medium", "large"],
+    "large": ["large"],
+}
+
+# How many nearby postmats are tried when the origin is full
+NEARBY_CANDIDATES = 5
+
+# Expired reservations released per transaction / per sweep run
+SWEEP_BATCH_SIZE = 500
+SWEEP_MAX_BATCHES = 20
+
+# A stash whose package already sits in it (or is on its way there) keeps the package
+HELD_STATUSES = ["placed_in_stash", "delivered"]
+
+
+def reserve_stash(postmat, size, package=None, allow_larger=True, hours=RESERVATION_HOURS, mark_full=False):
+    """
+    Claims one free stash of `postmat` in its own short transaction.
+    Rows locked by concurrent claims are skipped (SELECT ... FOR UPDATE SKIP LOCKED),
+    so parallel senders at one locker take different stashes instead of queueing.
+    `mark_full=True` is for courier allocations (stash counted as occupied right away).
+    Returns the reserved Stash or None.
+    """
+    from postmats.models import Stash
+
+    sizes = SIZE_FALLBACKS.get(size, [size]) if allow_larger else [size]
+    with transaction.atomic():
+        for candidate_size in sizes:
+            stash = (
+                Stash.objects.select_for_update(skip_locked=True)
+                .filter(postmat=postmat, size=candidate_size, is_empty=True, reserved_until__isnull=True)
+                .order_by("id")
+                .first()
+            )
+            if stash is None:
+                continue
+            stash.postmat = postmat
+            stash.reserved_until = timezone.now() + timedelta(hours=hours)
+            stash.package = package
+            stash.is_empty = not mark_full
+            stash.save(update_fields=["reserved_until", "package", "is_empty"])
+            return stash
+    return None
+
+
+def reserve_stash_nearby(postmat, size, package=None, hours=RESERVATION_HOURS) -> Optional[object]:
+    """
+    Reserves at `postmat` (own size first, then larger), otherwise at the nearest
+    postmats with a free stash of the exact size. The chosen postmat is `stash.postmat`.
+    """
+    from postmats.services.locker_locator import find_nearest_available_postmats
+
+    stash = reserve_stash(postmat, size, package, hours=hours)
+    if stash:
+        return stash
+
+    for candidate in find_nearest_available_postmats(
+        postmat.latitude, postmat.longitude, size, k=NEARBY_CANDIDATES, exclude_ids=[postmat.id]
+    ):
+        stash = reserve_stash(candidate, size, package, allow_larger=False, hours=hours)
+        if stash:
+            return stash
+    return None
+
+
+def release_stashes(package) -> int:
+    """Frees every stash held by `package`"""
+    from postmats.models import Stash
+
+    return Stash.objects.filter(package=package).update(package=None, is_empty=True, reserved_until=None)
+
+
+def release_expired_reservations(batch_size=SWEEP_BATCH_SIZE, max_batches=SWEEP_MAX_BATCHES) -> dict:
+    """
+    Releases expired reservations, oldest first, in batches of `batch_size` rows locked
+    with SKIP LOCKED (a concurrent reserve or a second sweeper is never waited on).
+    Abandoned reservations get their stash back (package cleared, empty, unreserved);
+    stashes holding a package in the locker or on an active route only lose the timer.
+    Capacity counters follow through StashQuerySet.update.
+    Returns metrics: released, cleared, batches and lag_seconds (age of the oldest expiry).
+    """
+    from django.db.models import Q
+    from logistics.services.route_plan import ACTIVE_ROUTE_STATUSES
+    from postmats.models import Stash
+
+    now = timezone.now()
+    metrics = {"released": 0, "cleared": 0, "batches": 0, "lag_seconds": 0.0}
+    oldest = (
+        Stash.objects.filter(reserved_until__isnull=False, reserved_until__lt=now)
+        .order_by("reserved_until").values_list("reserved_until", flat=True).first()
+    )
+    if oldest is None:
+        return metrics
+    metrics["lag_seconds"] = round((now - oldest).total_seconds(), 1)
+
+    held = Q(package__current_state__status__in=HELD_STATUSES) | Q(
+        package__route_assignments__route__status__in=ACTIVE_ROUTE_STATUSES
+    )
+    for _ in range(max_batches):
+        with transaction.atomic():
+            ids = list(
+                Stash.objects.select_for_update(skip_locked=True)
+                .filter(reserved_until__isnull=False, reserved_until__lt=now)
+                .order_by("reserved_until")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            kept = set(Stash.objects.filter(held, id__in=ids).values_list("id", flat=True))
+            released = [i for i in ids if i not in kept]
+            if kept:
+                metrics["cleared"] += Stash.objects.filter(id__in=kept).update(reserved_until=None)
+            if released:
+                metrics["released"] += Stash.objects.filter(id__in=released).update(
+                    package=None, is_empty=True, reserved_until=None
+                )
+        metrics["batches"] += 1
+        if len(ids) < batch_size:
+            break
+    return metrics
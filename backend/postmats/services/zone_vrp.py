@@ -0,0 +1,57 @@
+from typing import Dict, List
+
+
+def route_minutes(dist, route, speed_km_min, stop_minutes) -> float:
+    """Drive + stop time of depot (0) -> route -> depot"""
+    total, prev = 0.0, 0
+    for node in route:
+        total += dist[prev][node]
+        prev = node
+    total += dist[prev][0]
+    return total / speed_km_min + len(route) * stop_minutes
+
+
+def clarke_wright(dist, demands: Dict[int, int], capacity: int, max_minutes: float,
+                  speed_km_min: float, stop_minutes: float) -> List[List[int]]:
+    """
+    Clarke-Wright savings for a capacitated, time-limited VRP.
+    `dist` is a square matrix with the depot at index 0, `demands` maps node -> packages.
+    Starts from one route per node and merges route ends by descending saving
+    d(i,0) + d(0,j) - d(i,j) while the van load and the work day allow it.
+    """
+    dist = dist.tolist() if hasattr(dist, 'tolist') else dist
+    routes = {node: [node] for node in demands}
+    route_of = {node: node for node in demands}
+    load = {node: demands[node] for node in demands}
+
+    savings = sorted(
+        ((dist[i][0] + dist[0][j] - dist[i][j], i, j) for i in demands for j in demands if i != j),
+        reverse=True,
+    )
+    for saving, i, j in savings:
+        if saving <= 0:
+            break
+        ri, rj = route_of[i], route_of[j]
+        if ri == rj or load[ri] + load[rj] > capacity:
+            continue
+        a, b = routes[ri], routes[rj]
+        # i must end its route and j must start the other one (routes may be reversed)
+        if a[-1] != i:
+            if a[0] != i:
+                continue
+            a = a[::-1]
+        if b[0] != j:
+            if b[-1] != j:
+                continue
+            b = b[::-1]
+        merged = a + b
+        if route_minutes(dist, merged, speed_km_min, stop_minutes) > max_minutes:
+            continue
+
+        routes[ri] = merged
+        load[ri] += load.pop(rj)
+        del routes[rj]
+        for node in b:
+            route_of[node] = ri
+
+    return list(routes.values())
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Postmat, PostmatCapacity, Stash
+
+
+@receiver(post_save, sender=Postmat)
+@receiver(post_delete, sender=Postmat)
+def refresh_postmat_index(sender, instance, **kwargs):
+    """Rebuild the nearest-postmat grid in every process once the change is committed."""
+    from postmats.services.locker_locator import invalidate_postmat_index
+
+    transaction.on_commit(invalidate_postmat_index)
+
+
+@receiver(post_save, sender=Stash)
+def adjust_capacity_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """Same transaction as the stash change, so the counter moves commit (or roll back) with it."""
+    if update_fields is not None and not Stash.CAPACITY_FIELDS & set(update_fields):
+        return
+    after = instance.capacity_slot()
+    if created:
+        PostmatCapacity.adjust([(after, 1)])
+    elif hasattr(instance, "_capacity_slot"):
+        PostmatCapacity.adjust([(instance._capacity_slot, -1), (after, 1)])
+    else:
+        # Loaded without the capacity fields, so the slot it left is unknown
+        PostmatCapacity.refresh([instance.postmat_id])
+    instance._capacity_slot = after
+
+
+@receiver(post_delete, sender=Stash)
+def adjust_capacity_on_delete(sender, instance, **kwargs):
+    # After commit: when the whole postmat is being deleted there is no counter left to move
+    postmat_id = instance.postmat_id
+    if hasattr(instance, "_capacity_slot"):
+        slot = instance._capacity_slot
+        transaction.on_commit(lambda: PostmatCapacity.adjust([(slot, -1)]))
+    else:
+        transaction.on_commit(lambda: PostmatCapacity.refresh([postmat_id]))
@@ -1,30 +1,72 @@
 from celery import shared_task
-from django.utils import timezone
-from django.db.models import Q
-from .models import Stash
+from datetime import date
 import logging
+import time
 
 
 @shared_task(name="cleanup_expired_stash_reservations")
 def cleanup_expired_stash_reservations():
     """
-    Remove expired reservations from stashes.
-    Sets reserved_until to None for all stashes where the reservation has expired.
+    Releases stashes whose reservation has expired, in bounded batches
+    (see stash_reservation.release_expired_reservations), and reports
+    how many were released and how far behind the sweep is.
     """
-    now = timezone.now()
+    from .services.stash_reservation import release_expired_reservations
 
-    # Find all stashes with expired reservations
-    expired_stashes = Stash.objects.filter(
-        Q(reserved_until__isnull=False) & Q(reserved_until__lt=now)
+    metrics = release_expired_reservations()
+    if not metrics["batches"]:
+        return "No expired reservations to clear"
+
+    print(
+        f"Stash sweep: released={metrics['released']} cleared={metrics['cleared']} "
+        f"batches={metrics['batches']} lag={metrics['lag_seconds']}s"
     )
+    return f"Released {metrics['released']} expired reservations (lag {metrics['lag_seconds']}s)"
+
+
+@shared_task(name="reconcile_postmat_capacity")
+def reconcile_postmat_capacity(batch_size=500):
+    """
+    Recounts PostmatCapacity for every postmat from the Stash rows, repairing
+    any drift left by writes that bypassed the model (raw SQL, manual fixes).
+    """
+    from .models import Postmat, PostmatCapacity
+
+    postmat_ids = list(Postmat.objects.values_list("id", flat=True))
+    for start in range(0, len(postmat_ids), batch_size):
+        PostmatCapacity.refresh(postmat_ids[start:start + batch_size])
+    return f"Reconciled capacity of {len(postmat_ids)} postmats"
 
-    count = expired_stashes.count()
 
-    if count > 0:
-        # Clear the reservations
-        updated = expired_stashes.update(reserved_until=None)
-        print(f"Cleared {updated} expired stash reservations")
-        return f"Successfully cleared {updated} expired reservations"
+@shared_task(name="generate_local_routes_for_all_warehouses")
+def generate_local_routes_for_all_warehouses(job_id):
+    """
+    Generates last-mile routes warehouse by warehouse for a RouteGenerationJob.
+    One failing warehouse is recorded in the job progress and does not stop the rest.
+    """
+    from logistics.models import RouteGenerationJob, Warehouse
+    from postmats.services.routing_service import LocalRoutingService
 
-    print("No expired reservations found")
-    return "No expired reservations to clear"
+    job = RouteGenerationJob.objects.get(id=job_id)
+    job.mark_running()
+    target_date = date.fromisoformat(job.params['date'])
+    service = LocalRoutingService()
+    created_routes = []
+    started = time.monotonic()
+    try:
+        for wh in Warehouse.objects.all():
+            wh_started = time.monotonic()
+            try:
+                routes = service.generate_local_routes(target_date, str(wh.id))
+                created_routes.extend(routes)
+                job.record_progress(wh.id, city=wh.city, routes=len(routes),
+                                    seconds=round(time.monotonic() - wh_started, 3))
+            except Exception as e:
+                job.record_progress(wh.id, city=wh.city, routes=0, error=str(e),
+                                    seconds=round(time.monotonic() - wh_started, 3))
+        job.timings = {'total': round(time.monotonic() - started, 3)}
+        job.mark_completed(created_routes)
+    except Exception as e:
+        job.mark_failed(e)
+        raise
+    return f"Created {len(created_routes)} local routes"
@@ -0,0 +1,70 @@
+import random
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+from logistics.models import Warehouse
+from postmats.models import Postmat, Stash
+from postmats.services.locker_locator import PostmatGridIndex, find_nearest_available_postmats
+from proj import geo
+
+
+class PostmatGridIndexTests(SimpleTestCase):
+
+    def test_grid_lookup_matches_brute_force(self):
+        rnd = random.Random(7)
+        rows = [(i, rnd.uniform(49.0, 54.8), rnd.uniform(14.1, 24.1)) for i in range(500)]
+        index = PostmatGridIndex(rows)
+
+        for _ in range(20):
+            lat, lon = rnd.uniform(49.0, 54.8), rnd.uniform(14.1, 24.1)
+            expected = sorted(rows, key=lambda r: geo.haversine(lat, lon, r[1], r[2]))
+            expected = [r[0] for r in expected if r[0] % 3][:5]
+
+            found = index.nearest(lat, lon, 5, accept=lambda pid: pid % 3)
+
+            self.assertEqual([pid for pid, _ in found], expected)
+
+    def test_far_origin_falls_back_to_brute_force(self):
+        rows = [(1, 50.0, 20.0), (2, 51.0, 20.0), (3, -33.9, 151.2)]
+        index = PostmatGridIndex(rows)
+
+        expected = sorted(rows, key=lambda r: geo.haversine(-34.0, 151.0, r[1], r[2]))[:2]
+
+        self.assertEqual([pid for pid, _ in index.nearest(-34.0, 151.0, 2)], [r[0] for r in expected])
+
+
+class NearestAvailablePostmatTests(APITestCase):
+
+    def setUp(self):
+        warehouse = Warehouse.objects.create(city="Krakow", latitude=50.06, longitude=19.94, address="A 1")
+        self.full, self.near, self.far = [
+            Postmat.objects.create(
+                name=name, warehouse=warehouse, latitude=50.06 + offset, longitude=19.94, address=name
+            )
+            for name, offset in (("Full", 0.001), ("Near", 0.02), ("Far", 0.5))
+        ]
+        Stash.objects.create(postmat=self.full, size='small', is_empty=False)
+        Stash.objects.create(postmat=self.near, size='small', is_empty=True)
+        Stash.objects.create(postmat=self.far, size='small', is_empty=True)
+        Stash.objects.create(postmat=self.far, size='small', is_empty=True)
+
+    def test_nearest_skips_postmats_without_free_stash(self):
+        find_nearest_available_postmats(50.06, 19.94, 'small')  # warm the spatial index
+
+        with self.assertNumQueries(2):
+            found = find_nearest_available_postmats(50.06, 19.94, 'small', k=5)
+
+        self.assertEqual([pm.id for pm in found], [self.near.id, self.far.id])
+        self.assertEqual(found[1].free_stashes, 2)
+        self.assertEqual(find_nearest_available_postmats(50.06, 19.94, 'large'), [])
+
+    def test_public_nearest_endpoint(self):
+        response = self.client.get("/api/postmats/public/points/nearest/?lat=50.06&lon=19.94&size=small&k=1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.data], [str(self.near.id)])
+        self.assertIn('distance_km', response.data[0])
+
+    def test_public_nearest_rejects_out_of_range_coordinates(self):
+        for lat, lon in (("nan", "19.94"), ("inf", "19.94"), ("1e9", "19.94"), ("50.06", "-181")):
+            response = self.client.get(f"/api/postmats/public/points/nearest/?lat={lat}&lon={lon}&size=small")
+            self.assertEqual(response.status_code, 400, (lat, lon))
@@ -0,0 +1,65 @@
+from django.test import TestCase
+from django.utils import timezone
+from logistics.models import Warehouse
+from postmats.models import Postmat, PostmatCapacity, Stash
+from postmats.tasks import cleanup_expired_stash_reservations, reconcile_postmat_capacity
+
+
+class PostmatCapacityTests(TestCase):
+
+    def setUp(self):
+        warehouse = Warehouse.objects.create(city="Krakow", latitude=50.06, longitude=19.94, address="A 1")
+        self.postmat = Postmat.objects.create(
+            name="Locker", warehouse=warehouse, latitude=50.06, longitude=19.94, address="L 1"
+        )
+        self.small = Stash.objects.create(postmat=self.postmat, size='small')
+        Stash.objects.bulk_create([Stash(postmat=self.postmat, size='large') for _ in range(2)])
+
+    def _capacity(self):
+        return PostmatCapacity.objects.get(postmat=self.postmat)
+
+    def test_counters_follow_reserve_release_and_expire(self):
+        self.assertEqual((self._capacity().free_small, self._capacity().free_large), (1, 2))
+
+        self.small.reserved_until = timezone.now() - timezone.timedelta(minutes=1)
+        self.small.save()
+        self.assertEqual(self._capacity().free_small, 0)
+
+        cleanup_expired_stash_reservations()
+        self.assertEqual(self._capacity().free_small, 1)
+
+        Stash.objects.filter(size='large').update(is_empty=False)
+        self.assertEqual(self._capacity().free_large, 0)
+
+    def test_reconcile_repairs_drift(self):
+        PostmatCapacity.objects.filter(postmat=self.postmat).update(free_small=9, free_large=0)
+
+        reconcile_postmat_capacity()
+
+        self.assertEqual((self._capacity().free_small, self._capacity().free_large), (1, 2))
+
+    def test_reserve_moves_counter_without_recount(self):
+        stash = Stash.objects.get(pk=self.small.pk)
+        stash.reserved_until = timezone.now() + timezone.timedelta(hours=1)
+
+        # The stash UPDATE and one F() UPDATE of the counter, no locking recount
+        with self.assertNumQueries(2):
+            stash.save(update_fields=["reserved_until"])
+
+        self.assertEqual(self._capacity().free_small, 0)
+
+    def test_incremental_counters_match_full_recount(self):
+        large = list(Stash.objects.filter(size='large'))
+        large[0].is_empty = False
+        Stash.objects.bulk_update(large, ['is_empty'])
+        Stash.objects.filter(pk=self.small.pk).update(reserved_until=timezone.now())
+        Stash.objects.filter(size='large').update(is_empty=True, reserved_until=None)
+        Stash.objects.create(postmat=self.postmat, size='medium')
+        with self.captureOnCommitCallbacks(execute=True):
+            large[1].delete()
+        Stash.objects.filter(pk=self.small.pk).update(reserved_until=None)
+
+        counted = (self._capacity().free_small, self._capacity().free_medium, self._capacity().free_large)
+        PostmatCapacity.refresh([self.postmat.id])
+        self.assertEqual(counted, (self._capacity().free_small, self._capacity().free_medium, 1))
+        self.assertEqual(counted, (1, 1, 1))
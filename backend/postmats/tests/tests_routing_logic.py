@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.utils import timezone
 from datetime import date
 from django.contrib.auth import get_user_model
@@ -6,6 +6,8 @@ from logistics.models import Warehouse, Route, RouteStop, RoutePackage
 from postmats.models import Postmat, Zone, Stash
 from packages.models import Package, Actualization
 from postmats.services.routing_service import LocalRoutingService
+from postmats.services.stash_matching import match_stashes
+from logistics.services.route_plan import RoutePlan, commit_route_plan
 
 User = get_user_model()
 
@@ -186,4 +188,222 @@ class LocalRoutingServiceTests(TestCase):
         # Verify End
         end_stop = route.stops.order_by('-order').first()
         self.assertEqual(end_stop.warehouse, self.warehouse)
-        self.assertNotEqual(end_stop.id, start_stop.id) # Should be distinct DB records
\ No newline at end of file
+        self.assertNotEqual(end_stop.id, start_stop.id) # Should be distinct DB records
+
+    def test_plan_commit_rejects_packages_changed_after_planning(self):
+        """
+        Planning writes nothing; the commit phase drops packages that moved
+        on in the meantime and leaves their stash untouched.
+        """
+        pkg = Package.objects.create(
+            origin_postmat=self.locker, destination_postmat=self.locker,
+            sender=self.courier, receiver_name="R1", receiver_phone="1",
+            size='small', weight=1, route_path={}
+        )
+        Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse)
+
+        plan = LocalRoutingService().plan_local_routes(date.today(), str(self.warehouse.id))
+        self.assertEqual(Route.objects.count(), 0)
+        self.assertEqual(len(plan.routes), 1)
+
+        # Plans survive a serialization round trip (e.g. to a worker)
+        plan = RoutePlan.from_dict(plan.to_dict())
+
+        # Package is picked up elsewhere before the plan is committed
+        Actualization.objects.create(package_id=pkg, status='in_transit', courier_id=self.courier)
+        routes = commit_route_plan(plan)
+
+        self.assertEqual(routes, [])
+        self.assertEqual(plan.rejected_package_ids, [str(pkg.id)])
+        self.stash.refresh_from_db()
+        self.assertTrue(self.stash.is_empty)
+        self.assertIsNone(self.stash.reserved_until)
+
+    def test_commit_accepts_package_already_dropped_by_running_line_haul(self):
+        pkg = Package.objects.create(
+            origin_postmat=self.locker, destination_postmat=self.locker,
+            sender=self.courier, receiver_name="R1", receiver_phone="1",
+            size='small', weight=1, route_path={}
+        )
+        line_haul = Route.objects.create(
+            courier=self.courier, scheduled_date=date.today(), total_distance=100, status='in_progress'
+        )
+        origin = RouteStop.objects.create(route=line_haul, warehouse=self.warehouse, order=0)
+        hub = RouteStop.objects.create(route=line_haul, warehouse=self.warehouse, order=1)
+        RoutePackage.objects.create(route=line_haul, package=pkg, pickup_stop=origin, dropoff_stop=hub)
+        Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse)
+
+        plan = LocalRoutingService().plan_local_routes(date.today(), str(self.warehouse.id))
+        self.assertEqual(commit_route_plan(RoutePlan.from_dict(plan.to_dict())), [])
+
+        hub.completed_at = timezone.now()
+        hub.save()
+        routes = commit_route_plan(plan)
+
+        self.assertEqual(len(routes), 1)
+        self.assertEqual(routes[0].route_packages.get().package_id, pkg.id)
+
+    def test_busy_zone_is_split_across_vans(self):
+        """Packages beyond one van's capacity go to extra routes; every package is routed once."""
+        points = [self.pickup_point] + [
+            Postmat.objects.create(
+                name=f"Point {i}", warehouse=self.warehouse, zone=self.zone,
+                latitude=50.0 + 0.01 * i, longitude=20.03, type='pickup_point', address=f"St {i}"
+            )
+            for i in range(1, 4)
+        ]
+        pkg_ids = set()
+        for point in points:
+            for _ in range(2):
+                pkg = Package.objects.create(
+                    origin_postmat=self.locker, destination_postmat=point,
+                    sender=self.courier, receiver_name="R", receiver_phone="1",
+                    size='small', weight=1, route_path={}
+                )
+                Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse)
+                pkg_ids.add(str(pkg.id))
+
+        plan = LocalRoutingService().plan_local_routes(date.today(), str(self.warehouse.id), vehicle_capacity=3)
+
+        self.assertEqual(len(plan.routes), 4)
+        routed = [p.package_id for r in plan.routes for p in r.packages]
+        self.assertEqual(sorted(routed), sorted(pkg_ids))
+        for route in plan.routes:
+            self.assertLessEqual(len(route.packages), 3)
+            self.assertEqual(route.stops[0].warehouse_id, str(self.warehouse.id))
+            self.assertEqual(route.stops[-1].warehouse_id, str(self.warehouse.id))
+
+    def test_commit_replaces_stash_taken_after_planning(self):
+        """A planned stash reserved by someone else meanwhile is swapped for another free one."""
+        from postmats.services.stash_reservation import reserve_stash
+
+        spare = Stash.objects.create(postmat=self.locker, size='medium', is_empty=True)
+        pkg = Package.objects.create(
+            origin_postmat=self.locker, destination_postmat=self.locker,
+            sender=self.courier, receiver_name="R1", receiver_phone="1",
+            size='small', weight=1, route_path={}
+        )
+        Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse)
+
+        plan = LocalRoutingService().plan_local_routes(date.today(), str(self.warehouse.id))
+        self.assertEqual(plan.routes[0].packages[0].stash_id, str(self.stash.id))
+        reserve_stash(self.locker, 'small', allow_larger=False)  # a sender takes the planned stash
+
+        routes = commit_route_plan(plan)
+
+        self.assertEqual(len(routes), 1)
+        self.assertEqual(plan.rejected_package_ids, [])
+        spare.refresh_from_db()
+        self.assertEqual(spare.package_id, pkg.id)
+        self.assertFalse(spare.is_empty)
+
+    def test_allocation_uses_one_query_for_all_lockers(self):
+        zone_b = Zone.objects.create(name="Zone B", warehouse=self.warehouse)
+        lockers = [self.locker] + [
+            Postmat.objects.create(
+                name=f"Locker {i}", warehouse=self.warehouse, zone=zone_b,
+                latitude=50.03, longitude=20.0 + 0.01 * i, type='locker', address=f"L {i}"
+            )
+            for i in range(2, 5)
+        ]
+        packages = []
+        for locker in lockers:
+            Stash.objects.create(postmat=locker, size='large', is_empty=True)
+            packages.append(Package.objects.create(
+                origin_postmat=locker, destination_postmat=locker, sender=self.courier,
+                receiver_name="R", receiver_phone="1", size='large', weight=1, route_path={}
+            ))
+        packages = list(Package.objects.filter(id__in=[p.id for p in packages]).select_related('destination_postmat'))
+
+        with self.assertNumQueries(1):
+            approved, failed = LocalRoutingService()._allocate_stashes(packages)
+
+        self.assertEqual(len(approved), 4)
+        self.assertEqual(failed, [])
+        self.assertEqual(len({p._reserved_stash.id for p in approved}), 4)
+
+    def test_early_small_package_does_not_take_last_medium_stash(self):
+        # The small stash is taken, so only the medium one is free
+        Stash.objects.filter(pk=self.stash.pk).update(is_empty=False)
+        medium = Stash.objects.create(postmat=self.locker, size='medium', is_empty=True)
+        packages = []
+        for i, size in enumerate(['small', 'medium']):
+            pkg = Package.objects.create(
+                origin_postmat=self.locker, destination_postmat=self.locker, sender=self.courier,
+                receiver_name="R", receiver_phone=str(i), size=size, weight=1, route_path={}
+            )
+            Actualization.objects.create(
+                package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse,
+                created_at=timezone.now() - timezone.timedelta(hours=4 - i)
+            )
+            packages.append(pkg)
+        small, medium_pkg = packages
+
+        plan = LocalRoutingService().plan_local_routes(date.today(), str(self.warehouse.id))
+
+        # Arrival-order greedy would put the older small parcel into the medium stash
+        reserved = {p.package_id: p.stash_id for p in plan.routes[0].packages}
+        self.assertEqual(reserved, {str(medium_pkg.id): str(medium.id)})
+        self.assertEqual([d.package_id for d in plan.delays], [str(small.id)])
+
+    def test_small_package_waiting_past_max_wait_gets_the_medium_stash(self):
+        Stash.objects.filter(pk=self.stash.pk).update(is_empty=False)
+        medium = Stash.objects.create(postmat=self.locker, size='medium', is_empty=True)
+        packages = []
+        for hours, size in ((72, 'small'), (1, 'medium')):
+            pkg = Package.objects.create(
+                origin_postmat=self.locker, destination_postmat=self.locker, sender=self.courier,
+                receiver_name="R", receiver_phone="1", size=size, weight=1, route_path={}
+            )
+            act = Actualization.objects.create(package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse)
+            # created_at is auto_now_add, so backdate it with an update
+            Actualization.objects.filter(pk=act.pk).update(created_at=timezone.now() - timezone.timedelta(hours=hours))
+            packages.append(pkg)
+
+        plan = LocalRoutingService().plan_local_routes(date.today(), str(self.warehouse.id))
+
+        reserved = {p.package_id: p.stash_id for p in plan.routes[0].packages}
+        self.assertEqual(reserved, {str(packages[0].id): str(medium.id)})
+        self.assertEqual([d.package_id for d in plan.delays], [str(packages[1].id)])
+
+    def test_deferred_package_keeps_its_place_in_the_queue(self):
+        pkgs = []
+        for hours in (3, 1):
+            pkg = Package.objects.create(
+                origin_postmat=self.locker, destination_postmat=self.locker, sender=self.courier,
+                receiver_name="R", receiver_phone="1", size='small', weight=1, route_path={}
+            )
+            Actualization.objects.create(
+                package_id=pkg, status='in_warehouse', warehouse_id=self.warehouse,
+                created_at=timezone.now() - timezone.timedelta(hours=hours)
+            )
+            pkgs.append(pkg)
+        # A "locker full" delay written for the older package later on
+        Actualization.objects.create(package_id=pkgs[0], status='in_warehouse', warehouse_id=self.warehouse)
+
+        queue = LocalRoutingService()._get_local_packages(self.warehouse)
+
+        self.assertEqual([p.id for p in queue], [p.id for p in pkgs])
+
+
+class StashMatchingTests(SimpleTestCase):
+
+    def test_larger_packages_first_then_oldest(self):
+        free = {'small': ['s1'], 'medium': ['m1'], 'large': ['l1']}
+
+        self.assertEqual(match_stashes(['small', 'small', 'large'], free), ['s1', 'm1', 'l1'])
+        self.assertEqual(match_stashes(['small', 'small', 'medium', 'large'], free), ['s1', None, 'm1', 'l1'])
+        self.assertEqual(match_stashes(['small', 'medium', 'medium', 'medium'], free), ['s1', 'm1', 'l1', None])
+        self.assertEqual(match_stashes(['small', 'large', 'large'], {'small': [], 'medium': [], 'large': ['l1']}), [None, 'l1', None])
+
+    def test_oldest_package_of_a_size_goes_first(self):
+        free = {'small': [], 'medium': ['m1'], 'large': []}
+
+        self.assertEqual(match_stashes(['small', 'small'], {'small': ['s1']}), ['s1', None])
+        self.assertEqual(match_stashes(['medium', 'small', 'medium'], free), ['m1', None, None])
+
+    def test_overdue_package_is_placed_before_newer_larger_ones(self):
+        free = {'small': [], 'medium': [], 'large': ['l1']}
+
+        self.assertEqual(match_stashes(['small', 'large'], free), [None, 'l1'])
+        self.assertEqual(match_stashes(['small', 'large'], free, overdue=[True, False]), ['l1', None])
@@ -0,0 +1,74 @@
+from django.test import TestCase
+from logistics.models import Warehouse
+from postmats.models import Postmat, PostmatCapacity, Stash
+from postmats.services.stash_reservation import (
+    reserve_stash, reserve_stash_nearby, release_stashes, release_expired_reservations
+)
+
+
+class StashReservationTests(TestCase):
+
+    def setUp(self):
+        warehouse = Warehouse.objects.create(city="Krakow", latitude=50.06, longitude=19.94, address="A 1")
+        self.origin, self.nearby = [
+            Postmat.objects.create(name=name, warehouse=warehouse, latitude=lat, longitude=19.94, address=name)
+            for name, lat in (("Origin", 50.06), ("Nearby", 50.07))
+        ]
+        self.origin_medium = Stash.objects.create(postmat=self.origin, size='medium')
+        self.nearby_small = Stash.objects.create(postmat=self.nearby, size='small')
+
+    def test_reserve_falls_back_to_larger_size_then_nearby_postmat(self):
+        first = reserve_stash_nearby(self.origin, 'small')
+        second = reserve_stash_nearby(self.origin, 'small')
+
+        self.assertEqual(first, self.origin_medium)
+        self.assertEqual(second, self.nearby_small)
+        self.assertEqual(second.postmat, self.nearby)
+        self.assertIsNotNone(Stash.objects.get(id=first.id).reserved_until)
+        self.assertIsNone(reserve_stash_nearby(self.origin, 'small'))
+        self.assertIsNone(reserve_stash(self.nearby, 'small', allow_larger=False))
+        self.assertEqual(PostmatCapacity.objects.get(postmat=self.origin).free_medium, 0)
+
+    def test_release_frees_only_the_package_stash(self):
+        from accounts.models import User
+        from packages.models import Package
+
+        sender = User.objects.create(email="s@test.com", username="s", is_active=True)
+        package = Package.objects.create(
+            origin_postmat=self.origin, destination_postmat=self.nearby, sender=sender,
+            receiver_name="R", receiver_phone="1", size='medium', weight=1, route_path={}
+        )
+        reserve_stash(self.origin, 'medium', package=package)
+        reserve_stash(self.nearby, 'small')
+
+        self.assertEqual(release_stashes(package), 1)
+        self.assertEqual(PostmatCapacity.objects.get(postmat=self.origin).free_medium, 1)
+        self.assertEqual(PostmatCapacity.objects.get(postmat=self.nearby).free_small, 0)
+
+    def test_sweep_releases_abandoned_reservations_in_batches(self):
+        from django.utils import timezone
+        from accounts.models import User
+        from packages.models import Package, Actualization
+
+        sender = User.objects.create(email="s@test.com", username="s", is_active=True)
+        abandoned, delivered = [
+            Package.objects.create(
+                origin_postmat=self.origin, destination_postmat=self.nearby, sender=sender,
+                receiver_name="R", receiver_phone=phone, size='small', weight=1, route_path={}
+            )
+            for phone in ("1", "2")
+        ]
+        Actualization.objects.create(package_id=delivered, status='placed_in_stash')
+        reserve_stash(self.origin, 'small', package=abandoned)
+        reserve_stash(self.nearby, 'small', package=delivered, mark_full=True)
+        Stash.objects.update(reserved_until=timezone.now() - timezone.timedelta(minutes=5))
+
+        metrics = release_expired_reservations(batch_size=1)
+
+        self.assertEqual((metrics['released'], metrics['cleared'], metrics['batches']), (1, 1, 2))
+        self.assertGreaterEqual(metrics['lag_seconds'], 300)
+        freed, kept = Stash.objects.get(id=self.origin_medium.id), Stash.objects.get(id=self.nearby_small.id)
+        self.assertEqual((freed.package, freed.is_empty, freed.reserved_until), (None, True, None))
+        self.assertEqual((kept.package, kept.is_empty, kept.reserved_until), (delivered, False, None))
+        self.assertEqual(PostmatCapacity.objects.get(postmat=self.origin).free_medium, 1)
+        self.assertEqual(release_expired_reservations()['batches'], 0)
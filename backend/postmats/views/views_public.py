@@ -1,3 +1,4 @@
+import math
 from rest_framework import viewsets, filters, generics, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
@@ -5,7 +6,7 @@ from rest_framework.permissions import AllowAny
 from django.db.models import Q
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
-from postmats.models import Postmat
+from postmats.models import Postmat, Stash
 from packages.models import Package
 from postmats.serializers import PostmatSerializer
 
@@ -15,7 +16,7 @@ class PublicPostmatViewSet(viewsets.ReadOnlyModelViewSet):
     Public API for browsing Postmats.
     Returns a plain list of all active postmats (No Pagination).
     """
-    queryset = Postmat.objects.filter(status='active').order_by('name')
+    queryset = Postmat.objects.filter(status='active').select_related('capacity').order_by('name')
     serializer_class = PostmatSerializer
     permission_classes = [AllowAny]
     
@@ -25,3 +26,35 @@ class PublicPostmatViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'address', 'postal_code', 'warehouse__city']
     ordering_fields = ['name', 'warehouse__city']
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("lat", float, required=True),
+            OpenApiParameter("lon", float, required=True),
+            OpenApiParameter("size", str, required=True, enum=["small", "medium", "large"]),
+            OpenApiParameter("k", int, description="How many postmats to return (max 20, default 5)"),
+        ]
+    )
+    @action(detail=False, methods=["get"])
+    def nearest(self, request):
+        """k nearest postmats with a free stash of the given size, nearest first."""
+        from postmats.services.locker_locator import find_nearest_available_postmats
+
+        try:
+            lat = float(request.query_params["lat"])
+            lon = float(request.query_params["lon"])
+            k = min(int(request.query_params.get("k", 5)), 20)
+        except (KeyError, ValueError):
+            return Response({"error": "lat, lon (and optional k) must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+            return Response({"error": "lat must be within -90..90 and lon within -180..180"}, status=status.HTTP_400_BAD_REQUEST)
+        size = request.query_params.get("size")
+        if size not in Stash.StashSize.values:
+            return Response({"error": "size must be one of small, medium, large"}, status=status.HTTP_400_BAD_REQUEST)
+
+        postmats = find_nearest_available_postmats(lat, lon, size, k=k)
+        data = self.get_serializer(postmats, many=True).data
+        for item, pm in zip(data, postmats):
+            item["distance_km"] = pm.distance_km
+            item["free_stashes"] = pm.free_stashes
+        return Response(data)
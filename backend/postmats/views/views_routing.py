@@ -5,8 +5,11 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from datetime import date
 from drf_spectacular.utils import extend_schema
 
-from logistics.models import Warehouse, Route
+from django.db import transaction
+from logistics.models import Route, RouteGenerationJob
+from logistics.serializers.admin_serializers import RouteGenerationJobSerializer
 from postmats.services.routing_service import LocalRoutingService
+from postmats.tasks import generate_local_routes_for_all_warehouses
 from postmats.serializers import LocalRouteGenerationSerializer
 # We reuse the detailed route serializer to keep frontend logic consistent
 from logistics.serializers.warehouse_courier_serializers import CourierRouteDetailSerializer
@@ -42,22 +45,21 @@ class LocalRouteViewSet(viewsets.ViewSet):
         except Exception as e:
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request=None,
+        responses={202: RouteGenerationJobSerializer},
+        summary="Queue local route generation for all warehouses",
+        description="Poll /api/admin/route-jobs/{id}/ for per-warehouse progress."
+    )
     @action(detail=False, methods=['post'], url_path='generate-all')
     def generate_all(self, request):
-        service = LocalRoutingService()
-        target_date = date.today()
-        warehouses = Warehouse.objects.all()
-        total_created = 0
-        report = {}
-        for wh in warehouses:
-            try:
-                routes = service.generate_local_routes(target_date, str(wh.id))
-                count = len(routes)
-                total_created += count
-                if count > 0: report[wh.city] = count
-            except Exception as e:
-                report[wh.city] = f"Error: {str(e)}"
-        return Response({'success': True, 'total_routes_created': total_created, 'breakdown': report}, status=status.HTTP_201_CREATED)
+        job = RouteGenerationJob.objects.create(
+            job_type='last_mile_all',
+            created_by=request.user,
+            params={'date': date.today().isoformat()}
+        )
+        transaction.on_commit(lambda: generate_local_routes_for_all_warehouses.delay(str(job.id)))
+        return Response(RouteGenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=False, methods=['post'], url_path='clear-hub')
     def clear_hub(self, request):
@@ -29,7 +29,7 @@ class PostmatDetailedView(APIView):
 
 class PostmatView(APIView):
     def get(self, request):
-        postmats = Postmat.objects.all()
+        postmats = Postmat.objects.select_related('capacity')
         serializer = PostmatSerializer(postmats, many=True)
 
         return Response(serializer.data)
@@ -13,4 +13,8 @@ app.conf.beat_schedule = {
         "task": "cleanup_expired_stash_reservations",
         "schedule": crontab(minute="*/1"),  # Run every 1 minute
     },
+    "reconcile-postmat-capacity-hourly": {
+        "task": "reconcile_postmat_capacity",
+        "schedule": crontab(minute=7),
+    },
 }
@@ -0,0 +1,40 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat1, lon1, lat2, lon2) -> float:
+    """Great-circle distance in km between two points"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _to_radians(points) -> np.ndarray:
+    return np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+
+
+def distance_matrix(points, others=None) -> np.ndarray:
+    """
+    Haversine km between every (lat, lon) row of `points` and of `others`
+    (defaults to `points`, i.e. the full pairwise matrix). Computed in float64,
+    returned as float32 of shape (len(points), len(others)).
+    """
+    a = _to_radians(points)
+    b = a if others is None else _to_radians(others)
+    lat1, lon1 = a[:, 0, None], a[:, 1, None]
+    lat2, lon2 = b[None, :, 0], b[None, :, 1]
+
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))).astype(np.float32)
+
+
+def distances_from(origin, points) -> np.ndarray:
+    """One-to-many: float32 km from one (lat, lon) to each row of `points`"""
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return distance_matrix([origin], points)[0]
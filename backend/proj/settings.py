@@ -101,6 +101,20 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Celery
 CELERY_BROKER_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
 
+# Line-haul planning: number of processes hubs are planned in (1 = sequential)
+ROUTING_PLANNER_WORKERS = int(os.environ.get("ROUTING_PLANNER_WORKERS", "1"))
+
+# Line-haul planning: seconds spent improving the constructed tours (0 = keep greedy tours)
+ROUTING_IMPROVEMENT_SECONDS = float(os.environ.get("ROUTING_IMPROVEMENT_SECONDS", "2"))
+
+# Shared cache (routing distance matrices etc.)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL", "redis://redis:6379/0"),
+    }
+}
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 100,
@@ -82,12 +82,23 @@ export default function RoutesView({ goBack }) { // Receive goBack prop
     return result;
   }, [routes, searchTerm, selectedHubId]);
 
+  // Route generation runs as a background job - poll until it finishes
+  const waitForRouteJob = async (jobId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const { data } = await api.get(`/api/admin/route-jobs/${jobId}/`);
+      if (data.status === "completed") return data;
+      if (data.status === "failed") throw new Error(data.error || "Route generation failed");
+    }
+  };
+
   const handleGenerateGlobal = async () => {
     if(!confirm("Generate National Line Haul routes? This analyzes all pending warehouse-to-warehouse packages.")) return;
     setIsGenerating(true);
     try {
         const res = await api.post("/api/admin/routes/generate/", { date: new Date().toISOString().split('T')[0] });
-        alert(`Success! Created ${res.data.routes_created} line haul routes.`);
+        const job = await waitForRouteJob(res.data.id);
+        alert(`Success! Created ${job.routes_created} line haul routes.`);
         fetchData();
     } catch(err) {
         alert("Generation failed: " + (err.response?.data?.error || err.message));
@@ -101,7 +112,8 @@ export default function RoutesView({ goBack }) { // Receive goBack prop
     setIsGenerating(true);
     try {
         const res = await api.post("/api/admin/local-routes/generate-all/");
-        alert(`Success! Created ${res.data.total_routes_created} local routes across Poland.`);
+        const job = await waitForRouteJob(res.data.id);
+        alert(`Success! Created ${job.routes_created} local routes across Poland.`);
         fetchData();
     } catch(err) {
         alert("Bulk generation failed: " + (err.response?.data?.error || err.message));
@@ -16,14 +16,26 @@ const ParcelMap = dynamic(() => import('../../components/ParcelMapSendPackage'),
 
 export default function ParcelHistoryPage() {
     const [history, setHistory] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [selectedParcel, setSelectedParcel] = useState(null);
     const [postmatLocation, setPostmatLocation] = useState(null);
 
     useEffect(() => {
-        api.get("/api/packages/user")
-            .then(response => setHistory(response.data));
+        api.get("/api/packages/user/")
+            .then(response => {
+                setHistory(response.data.results);
+                setNextCursor(response.data.next_cursor);
+            });
     }, []);
 
+    const loadMore = () => {
+        api.get("/api/packages/user/", { params: { cursor: nextCursor } })
+            .then(response => {
+                setHistory((prev) => [...prev, ...response.data.results]);
+                setNextCursor(response.data.next_cursor);
+            });
+    };
+
     const handleSelectParcel = (parcel) => {
         api.get(`/api/packages/user/${parcel.id}`).then((res) => {
             const details = res.data;
@@ -88,6 +100,11 @@ export default function ParcelHistoryPage() {
                             </p>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button onClick={loadMore} className="py-2 text-blue-700 font-semibold hover:underline">
+                                Load more
+                            </button>
+                        )}
                         </div>
                     </div>
 
@@ -16,6 +16,7 @@ const ParcelMap = dynamic(() => import('@/app/components/ParcelMapSendPackage'),
 export default function IncomingParcelsView() {
     // Data State
     const [parcels, setParcels] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
     
     // UI State
@@ -31,11 +32,12 @@ export default function IncomingParcelsView() {
     const loadData = async () => {
         try {
             const res = await api.get("/api/packages/user/incoming/");
-            setParcels(res.data);
+            setParcels(res.data.results);
+            setNextCursor(res.data.next_cursor);
             
             // If a parcel is selected, refresh its details too
             if (selectedParcel) {
-                const updatedParcel = res.data.find(p => p.id === selectedParcel.id);
+                const updatedParcel = res.data.results.find(p => p.id === selectedParcel.id);
                 if (updatedParcel) {
                     handleViewDetails(updatedParcel, true); 
                 }
@@ -47,6 +49,16 @@ export default function IncomingParcelsView() {
         }
     };
 
+    const loadMore = async () => {
+        try {
+            const res = await api.get("/api/packages/user/incoming/", { params: { cursor: nextCursor } });
+            setParcels((prev) => [...prev, ...res.data.results]);
+            setNextCursor(res.data.next_cursor);
+        } catch (e) {
+            console.error("Failed to load more incoming parcels", e);
+        }
+    };
+
     // --- Actions ---
 
     const handleViewDetails = async (parcel, refresh = false) => {
@@ -180,6 +192,11 @@ export default function IncomingParcelsView() {
                                 </div>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button onClick={loadMore} className="py-2 text-sm font-bold text-purple-600 hover:text-purple-800">
+                                Load more
+                            </button>
+                        )}
                     </div>
 
                     {/* RIGHT COLUMN: Details */}
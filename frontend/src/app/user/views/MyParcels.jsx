@@ -22,6 +22,7 @@ const stripePromise = loadStripe(process.env.NEXT_PUBLIC_STRIPE_PUBLISHABLE_KEY)
 export default function MyParcelsView() {
     // Data State
     const [parcels, setParcels] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
     
     // UI State
@@ -42,11 +43,12 @@ export default function MyParcelsView() {
     const loadData = async () => {
         try {
             const res = await api.get("/api/packages/user/");
-            setParcels(res.data);
+            setParcels(res.data.results);
+            setNextCursor(res.data.next_cursor);
             
             // If a parcel is selected, refresh its details too
             if (selectedParcel) {
-                const updatedParcel = res.data.find(p => p.id === selectedParcel.id);
+                const updatedParcel = res.data.results.find(p => p.id === selectedParcel.id);
                 if (updatedParcel) {
                     // We might need to fetch full details again if the list view is partial
                     handleViewDetails(updatedParcel, true); 
@@ -59,6 +61,16 @@ export default function MyParcelsView() {
         }
     };
 
+    const loadMore = async () => {
+        try {
+            const res = await api.get("/api/packages/user/", { params: { cursor: nextCursor } });
+            setParcels((prev) => [...prev, ...res.data.results]);
+            setNextCursor(res.data.next_cursor);
+        } catch (e) {
+            console.error("Failed to load more parcels", e);
+        }
+    };
+
     // --- Actions ---
 
     const handleViewDetails = async (parcel, refresh = false) => {
@@ -306,6 +318,11 @@ export default function MyParcelsView() {
                                 )}
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button onClick={loadMore} className="py-2 text-sm font-bold text-blue-600 hover:text-blue-800">
+                                Load more
+                            </button>
+                        )}
                     </div>
 
                     {/* RIGHT COLUMN: Details */}